@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for an OpenAI-compatible API, used by the benchmarks.
+
+Serves chat completions (normal and streaming) on /v1/chat/completions,
+/api/chat/completions and /chat/completions, embeddings on /v1/embeddings,
+/api/embeddings and /embeddings, and the model list on /models, /v1/models
+and /api/models. Latency, streaming chunk sizes and error
+injection are configurable, so the client can be exercised without a live API.
+
+Run it on its own and point openai-cl at it:
+
+    python bench/mock_server.py --port 8000 --latency 0.2
+    openai-cl.py --base_url http://127.0.0.1:8000 --api_key x
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_PATHS = {'/v1/chat/completions', '/api/chat/completions', '/chat/completions'}
+MODEL_PATHS = {'/models', '/v1/models', '/api/models'}
+EMBEDDING_PATHS = {'/v1/embeddings', '/api/embeddings', '/embeddings'}
+EMBEDDING_DIM = 64
+DEFAULT_MODELS = ['llama3.1:8b', 'llama3.2:3b', 'qwen2.5:14b']
+
+def make_markdown(chars):
+    """Return roughly chars characters of markdown with headings, lists and code blocks."""
+    section = ("## Section {n}\n\n"
+               "Some explanatory text about the topic, with `inline code` and a [link](https://example.com).\n\n"
+               "- first point\n- second point with **bold** text\n\n"
+               "```python\ndef example_{n}(value):\n    return value * {n}\n```\n\n")
+    parts = []
+    total = 0
+    for n in itertools.count(1):
+        part = section.format(n=n)
+        parts.append(part)
+        total += len(part)
+        if total >= chars:
+            break
+    return "".join(parts)[:max(chars, 1)]
+
+def make_embedding(text):
+    """Return a deterministic bag-of-words vector, so texts sharing words come out similar."""
+    import zlib
+
+    vector = [0.0] * EMBEDDING_DIM
+    for word in text.lower().split():
+        vector[zlib.crc32(word.encode()) % EMBEDDING_DIM] += 1.0
+    return vector
+
+class MockSettings:
+    """
+    Behaviour of a MockServer; can be changed while the server runs.
+
+    latency is the delay before the response starts (first token for streams),
+    chunk_chars the content carried by each stream event and chunk_delay the
+    pause between events. error_rate is the probability that a request fails
+    with error_status; fail_first fails that many requests before any succeed.
+    stream_error_after sends an error event after that many stream chunks.
+    retry_after, if set, is sent as the Retry-After header of injected errors.
+    """
+
+    def __init__(self, latency=0.0, response_chars=400, chunk_chars=8, chunk_delay=0.0, error_rate=0.0,
+                 error_status=500, fail_first=0, stream_error_after=None, models=None, response_text=None,
+                 retry_after=None):
+        self.latency = latency
+        self.response_chars = response_chars
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_first = fail_first
+        self.stream_error_after = stream_error_after
+        self.models = models or list(DEFAULT_MODELS)
+        self.response_text = response_text
+        self.retry_after = retry_after
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, Nagle's algorithm and
+    # the client's delayed ACK add ~40ms to every non-streaming response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def should_fail(self):
+        with self.server.lock:
+            self.server.request_count += 1
+            if self.server.request_count <= self.settings.fail_first:
+                return True
+        return random.random() < self.settings.error_rate
+
+    def send_error_response(self):
+        headers = {}
+        if self.settings.retry_after is not None:
+            headers['Retry-After'] = str(self.settings.retry_after)
+        self.send_json(self.settings.error_status, {'error': {'message': 'Injected error'}}, headers)
+
+    def do_HEAD(self):
+        self.send_response(405)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in MODEL_PATHS:
+            self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+        if self.should_fail():
+            self.send_error_response()
+            return
+        time.sleep(self.settings.latency)
+        self.send_json(200, {'object': 'list',
+                             'data': [{'id': name, 'object': 'model'} for name in self.settings.models]})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        encoding = self.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif encoding == 'zstd':
+            import zstandard
+
+            body = zstandard.ZstdDecompressor().decompress(body)
+        path = self.path.split('?')[0]
+        if path not in CHAT_PATHS and path not in EMBEDDING_PATHS:
+            self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_json(400, {'error': {'message': 'Request body is not valid JSON'}})
+            return
+        if self.should_fail():
+            self.send_error_response()
+            return
+        if path in EMBEDDING_PATHS:
+            inputs = request.get('input', '')
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.send_json(200, {'object': 'list', 'model': request.get('model'),
+                                 'data': [{'object': 'embedding', 'index': number, 'embedding': make_embedding(text)}
+                                          for number, text in enumerate(inputs)]})
+            return
+
+        text = self.settings.response_text or make_markdown(self.settings.response_chars)
+        prompt_tokens = sum(len(str(m.get('content', ''))) for m in request.get('messages', [])) // 4
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(text) // 4,
+                 'total_tokens': prompt_tokens + len(text) // 4}
+        model = request.get('model', self.settings.models[0])
+        time.sleep(self.settings.latency)
+
+        if not request.get('stream'):
+            self.send_json(200, {'id': 'chatcmpl-mock', 'object': 'chat.completion', 'model': model,
+                                 'choices': [{'index': 0, 'finish_reason': 'stop',
+                                              'message': {'role': 'assistant', 'content': text}}],
+                                 'usage': usage})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        step = max(1, self.settings.chunk_chars)
+        for number, start in enumerate(range(0, len(text), step)):
+            if self.settings.stream_error_after is not None and number >= self.settings.stream_error_after:
+                self.send_event({'error': {'message': 'Injected stream error'}})
+                break
+            self.send_event({'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'model': model,
+                             'choices': [{'index': 0, 'delta': {'content': text[start:start + step]}}]})
+            if self.settings.chunk_delay:
+                time.sleep(self.settings.chunk_delay)
+        else:
+            self.send_event({'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'model': model,
+                             'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage})
+        self.send_chunk(b'data: [DONE]\n\n')
+        self.send_chunk(b'')
+
+    def send_event(self, event):
+        self.send_chunk(b'data: ' + json.dumps(event).encode() + b'\n\n')
+
+    def send_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+class MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (e.g. a cancelled request) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class MockServer:
+    """
+    Run the mock API in a background thread.
+
+        with MockServer(latency=0.1) as server:
+            open_web_ui_api_request(messages, model, 'key', server.url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **settings):
+        self.httpd = MockHTTPServer((host, port), MockHandler)
+        self.httpd.settings = MockSettings(**settings)
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self.thread = None
+
+    @property
+    def settings(self):
+        return self.httpd.settings
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a mock OpenAI-compatible API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before each response starts')
+    parser.add_argument('--response-chars', type=int, default=400, help='Length of each generated answer')
+    parser.add_argument('--chunk-chars', type=int, default=8, help='Characters of content per stream event')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Seconds between stream events')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability that a request fails')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of injected failures')
+    parser.add_argument('--fail-first', type=int, default=0, help='Fail this many requests before any succeed')
+    parser.add_argument('--stream-error-after', type=int, help='Send an error event after this many stream chunks')
+    parser.add_argument('--retry-after', type=float, help='Retry-After header sent with injected failures')
+    args = parser.parse_args()
+
+    server = MockServer(args.host, args.port, latency=args.latency, response_chars=args.response_chars,
+                        chunk_chars=args.chunk_chars, chunk_delay=args.chunk_delay, error_rate=args.error_rate,
+                        error_status=args.error_status, fail_first=args.fail_first,
+                        stream_error_after=args.stream_error_after, retry_after=args.retry_after)
+    print(f"Mock API listening on {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == '__main__':
+    main()
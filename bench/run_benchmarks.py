@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for openai-cl, run against the local mock API in mock_server.py.
+
+Measures the client-side cost of a chat turn (normal and streaming), startup
+time, rendering of large markdown answers and batch throughput. Results are
+written as JSON so that runs from different commits can be compared offline:
+
+    python bench/run_benchmarks.py                        # writes bench/results/<commit>.json
+    python bench/run_benchmarks.py --compare bench/results/abc1234.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_server import MockServer, make_markdown
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCRIPT_PATH = BENCH_DIR.parent / 'openai-cl.py'
+RESULTS_DIR = BENCH_DIR / 'results'
+
+def load_client():
+    """Import openai-cl.py as a module (its file name isn't a valid module name)."""
+    spec = importlib.util.spec_from_file_location('openai_cl', SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def summarize(samples):
+    """Return p50/p95/mean/min in milliseconds for a list of durations in seconds."""
+    ordered = sorted(samples)
+    return {
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'samples': len(ordered),
+    }
+
+def bench_turn_overhead(client, turns):
+    """
+    Time whole chat turns against a server that answers instantly.
+
+    The conversation grows every turn like a real session, so this includes
+    request body encoding, the HTTP round trip over loopback and JSON or SSE
+    parsing, but no model time.
+    """
+    results = {}
+    with MockServer(response_chars=1500, chunk_chars=16) as server:
+        for mode in ('request', 'stream'):
+            messages = [{"role": "system", "content": "You are a helpful assistant."}]
+            samples = []
+            for turn in range(turns):
+                messages.append({"role": "user", "content": f"Question number {turn}: " + "context " * 50})
+                start = time.perf_counter()
+                if mode == 'stream':
+                    content = "".join(client.open_web_ui_api_stream(messages, 'llama3.1:8b', 'key', server.url))
+                else:
+                    response = client.open_web_ui_api_request(messages, 'llama3.1:8b', 'key', server.url)
+                    content = response['choices'][0]['message']['content']
+                samples.append(time.perf_counter() - start)
+                messages.append({"role": "assistant", "content": content})
+            results[mode] = summarize(samples)
+    return results
+
+def bench_startup(runs):
+    """Time `openai-cl.py --startup-bench`, which parses arguments, loads config and imports the UI modules."""
+    env = dict(os.environ, OPENAI_API_TOKEN='bench')
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(SCRIPT_PATH), '--startup-bench'], env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def bench_render(client, sizes, repeats):
+    """Time rendering markdown answers of several sizes, both all at once and as a stream."""
+    from rich.console import Console
+
+    results = {}
+    for size in sizes:
+        text = make_markdown(size)
+        chunks = [text[i:i + 64] for i in range(0, len(text), 64)]
+        full, streamed = [], []
+        for _ in range(repeats):
+            client._console = Console(file=io.StringIO(), force_terminal=True, width=100, height=40)
+            start = time.perf_counter()
+            client.display_response(text)
+            full.append(time.perf_counter() - start)
+
+            client._console = Console(file=io.StringIO(), force_terminal=True, width=100, height=40)
+            start = time.perf_counter()
+            client.display_streaming_response(iter(chunks))
+            streamed.append(time.perf_counter() - start)
+        results[f'{size // 1024}kb'] = {'full': summarize(full), 'stream': summarize(streamed)}
+    client._console = None
+    return results
+
+def bench_batch(client, requests, concurrency, latency):
+    """Measure batch throughput against a server with a fixed per-request latency."""
+    with MockServer(latency=latency) as server, tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'in.jsonl')
+        output_path = os.path.join(tmp, 'out.jsonl')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for number in range(requests):
+                f.write(json.dumps({'id': number, 'prompt': f'Prompt {number}'}) + '\n')
+        client.configure_http(pool_size=concurrency)
+        start = time.perf_counter()
+        with contextlib.redirect_stderr(io.StringIO()):
+            exit_code = client.run_batch(input_path, output_path, 'llama3.1:8b', 'key', server.url, concurrency)
+        elapsed = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'server_latency_ms': latency * 1000,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(requests / elapsed, 2),
+        # Perfect scaling would finish in requests / concurrency * latency
+        'efficiency': round(requests / concurrency * latency / elapsed, 3),
+        'exit_code': exit_code,
+    }
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def flatten(results, prefix=''):
+    """Yield (dotted.name, value) for every number in a nested result dict."""
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, name + '.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+def compare(baseline, current):
+    """Print each metric next to its baseline value with the relative change."""
+    before = dict(flatten(baseline['results']))
+    print(f"\nCompared with {baseline.get('commit', '?')}:")
+    for name, value in flatten(current['results']):
+        if name not in before or name.endswith('.samples'):
+            continue
+        change = f"{(value - before[name]) / before[name] * 100:+.1f}%" if before[name] else ''
+        print(f"  {name:<40} {before[name]:>12} -> {value:>12} {change:>8}")
+
+BENCHMARKS = ['turn', 'startup', 'render', 'batch']
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark openai-cl against a local mock API.')
+    parser.add_argument('--only', type=str, help=f"Comma-separated benchmarks to run ({','.join(BENCHMARKS)})")
+    parser.add_argument('--quick', action='store_true', help='Fewer iterations, for a fast sanity check')
+    parser.add_argument('--output', type=str, help='Where to write the JSON results (default: bench/results/<commit>.json)')
+    parser.add_argument('--compare', type=str, metavar='FILE', help='Earlier results to compare against')
+    args = parser.parse_args()
+
+    selected = args.only.split(',') if args.only else BENCHMARKS
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+    scale = 0.2 if args.quick else 1
+
+    client = load_client()
+    results = {}
+    if 'turn' in selected:
+        results['turn'] = bench_turn_overhead(client, max(5, int(100 * scale)))
+    if 'startup' in selected:
+        results['startup'] = bench_startup(max(3, int(10 * scale)))
+    if 'render' in selected:
+        results['render'] = bench_render(client, [16 * 1024, 64 * 1024], max(1, int(5 * scale)))
+    if 'batch' in selected:
+        results['batch'] = bench_batch(client, max(40, int(200 * scale)), 8, 0.05)
+
+    report = {
+        'commit': get_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': results,
+    }
+    output_path = Path(args.output) if args.output else RESULTS_DIR / f"{report['commit']}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2) + '\n', encoding='utf-8')
+
+    for name, value in flatten(results):
+        if not name.endswith('.samples'):
+            print(f"  {name:<40} {value:>12}")
+    print(f"\nResults written to {output_path}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,30 @@
 # Standard libraries
+import time
+
+# Startup timing for --startup-bench; taken before anything else is imported
+_startup_t0 = time.perf_counter()
+
 import argparse
+import collections
+import contextlib
 import os
 import re
 import subprocess
 import sys
 import threading
-import time
 from pathlib import Path
+import itertools
 import json
-import requests
 import logging
+import math
+import queue
+import random
+import shutil
+import textwrap
 
-# Prompt Toolkit
-from prompt_toolkit import PromptSession, print_formatted_text
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-from prompt_toolkit.formatted_text import FormattedText
-from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.keys import Keys
-from prompt_toolkit.lexers import PygmentsLexer
-from prompt_toolkit.shortcuts import prompt
-from prompt_toolkit.styles import Style
-
-# Pygments
-from pygments import highlight
-from pygments.formatters.terminal import TerminalFormatter
-from pygments.lexers import PythonLexer, get_lexer_by_name, guess_lexer
-
-# Rich
-from rich.console import Console
-from rich.markdown import Markdown
-
-# Halo
-from halo import Halo
-
-# Set title.
-try:
-    print('\033]0;OpenAI API Compatible Command-Line Client\a', end='', flush=True)
-except AttributeError:
-    pass  # Silently pass if there's an issue setting the terminal title
+# Heavy third-party modules (requests, prompt_toolkit, rich, halo)
+# are imported inside the functions that need them, so that quick invocations
+# such as --help or -l don't pay for loading the interactive UI.
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -49,17 +36,256 @@ markdown_it_logger.setLevel(logging.ERROR)  # or logging.ERROR to only show erro
 # Define the API endpoint and headers
 API_ENDPOINT = "https://api.openai.com/v1/chat/completions"
 
-def open_web_ui_api_request(prompt, model, api_key, base_url):
-    """Make a request to the OpenWebUI API"""
-    # Construct the full endpoint URL
+# HTTP connection pool defaults; overridable from the command line or config
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+
+http_settings = {
+    'pool_size': DEFAULT_POOL_SIZE,
+    'timeout': (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+    'compression': None,
+}
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def configure_http(pool_size=None, connect_timeout=None, read_timeout=None, compression=None):
+    """Set pool size, timeouts and request compression. Must be called before the first request."""
+    import importlib.util
+
+    if pool_size:
+        http_settings['pool_size'] = pool_size
+    connect, read = http_settings['timeout']
+    http_settings['timeout'] = (connect_timeout or connect, read_timeout or read)
+    if compression == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        logger.warning("zstd compression needs the zstandard package; using gzip instead")
+        compression = 'gzip'
+    if compression:
+        http_settings['compression'] = None if compression == 'none' else compression
+
+# Setup times of connections opened by the current thread's last request
+_connection_timings = threading.local()
+
+# Connection each thread is sending a request on or reading a response from, so a request can be
+# aborted from another thread; a thread's entry is dropped when the connection goes back to the pool
+_active_connections = {}
+_active_connections_lock = threading.Lock()
+
+# Threads whose request was aborted on purpose, so the resulting error isn't reported as a failure
+_aborted_requests = set()
+
+def abort_request(thread_id):
+    """Shut down the socket a thread's request is using, so the thread stops waiting at once."""
+    import socket
+
+    # Under the lock, so the connection can't go back to the pool and be handed to another request meanwhile
+    with _active_connections_lock:
+        connection = _active_connections.get(thread_id)
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return
+        _aborted_requests.add(thread_id)
+        connection.aborted = True
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def take_connection_timings():
+    """Return and reset the DNS+TCP connect and TLS handshake times of the last new connection."""
+    timings = {'connect': getattr(_connection_timings, 'connect', 0.0),
+               'tls': getattr(_connection_timings, 'tls', 0.0)}
+    _connection_timings.connect = 0.0
+    _connection_timings.tls = 0.0
+    return timings
+
+def make_timed_adapter(pool_size):
+    """Build an HTTPAdapter whose new connections record how long DNS+TCP and TLS took."""
+    import requests
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def timed(connection_class):
+        class TimedConnection(connection_class):
+            def _new_conn(self):
+                start = time.perf_counter()
+                sock = super()._new_conn()
+                _connection_timings.connect = time.perf_counter() - start
+                return sock
+
+            def request(self, *args, **kwargs):
+                with _active_connections_lock:
+                    self.aborted = False
+                    _active_connections[threading.get_ident()] = self
+                return super().request(*args, **kwargs)
+
+            def connect(self):
+                start = time.perf_counter()
+                super().connect()
+                if isinstance(self, HTTPSConnection):
+                    _connection_timings.tls = max(0.0, time.perf_counter() - start - _connection_timings.connect)
+
+        return TimedConnection
+
+    def released(pool_class):
+        class ReleasingConnectionPool(pool_class):
+            def _put_conn(self, conn):
+                # The response has been read: the connection is no longer any thread's to abort
+                with _active_connections_lock:
+                    for thread_id, connection in list(_active_connections.items()):
+                        if connection is conn:
+                            del _active_connections[thread_id]
+                    aborted = getattr(conn, 'aborted', False)
+                if aborted:
+                    conn.close()  # its socket was shut down; reconnect on next use
+                super()._put_conn(conn)
+
+        return ReleasingConnectionPool
+
+    class TimedHTTPConnectionPool(released(HTTPConnectionPool)):
+        ConnectionCls = timed(HTTPConnection)
+
+    class TimedHTTPSConnectionPool(released(HTTPSConnectionPool)):
+        ConnectionCls = timed(HTTPSConnection)
+
+    class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                       'https': TimedHTTPSConnectionPool}
+
+    return TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+def get_http_session():
+    """Return the process-wide pooled keep-alive session, creating it on first use."""
+    import requests
+
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            http_session = requests.Session()
+            adapter = make_timed_adapter(http_settings['pool_size'])
+            http_session.mount('http://', adapter)
+            http_session.mount('https://', adapter)
+            http_session.headers['Connection'] = 'keep-alive'
+            _http_session = http_session
+        return _http_session
+
+def warm_up_connection(url):
+    """Open a pooled connection to url in the background so the next request skips the handshake."""
+    def _warm_up():
+        import requests
+
+        try:
+            get_http_session().head(url, timeout=http_settings['timeout'], allow_redirects=False)
+            logger.info("Warmed up connection to %s", url)
+        except requests.exceptions.RequestException as e:
+            logger.debug("Connection warm-up failed: %s", e)
+
+    threading.Thread(target=_warm_up, daemon=True).start()
+
+def get_chat_endpoint(base_url):
+    """Return the chat completions endpoint for the given base URL."""
     if base_url == None:
-        endpoint = API_ENDPOINT
-    else:
-        # Otherwise, construct the endpoint using the base_url
-        endpoint = f"{base_url}/api/chat/completions"
+        return API_ENDPOINT
+    # Otherwise, construct the endpoint using the base_url
+    return f"{base_url}/api/chat/completions"
+
+# Request body compression; zstd needs the optional zstandard package
+COMPRESSION_LEVELS = {'gzip': 1, 'zstd': 3}
+COMPRESS_MIN_BYTES = 1024
+
+class MessageEncoder:
+    """
+    Encodes chat request bodies, reusing the JSON of messages already sent.
+
+    The conversation history is the same list of message dicts turn after turn,
+    so each message is serialized once and a turn only encodes what is new.
+    Entries are keyed by object identity and checked against the content they
+    were built from, so a message whose content was replaced is encoded again.
+    """
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def encode_message(self, message):
+        if message.get('attachments'):
+            # Expanded on every request instead of cached, so attachment text is never held in memory
+            return get_attachment_store().encode_message(message)
+        key = id(message)
+        with self.lock:
+            entry = self.entries.get(key)
+            # Holding the message in the entry keeps its id from being reused
+            if entry and entry[0] is message and entry[1] is message.get('content'):
+                self.entries.move_to_end(key)
+                return entry[2]
+        encoded = json.dumps(message).encode('utf-8')
+        with self.lock:
+            self.entries[key] = (message, message.get('content'), encoded)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return encoded
+
+    def encode(self, model, messages, **params):
+        """Return the JSON body for a chat request, byte-for-byte what json.dumps would produce."""
+        parts = [b'{"model": ', json.dumps(model).encode('utf-8'), b', "messages": [',
+                 b', '.join(self.encode_message(message) for message in messages), b']']
+        for name, value in params.items():
+            parts += [b', ', json.dumps(name).encode('utf-8'), b': ', json.dumps(value).encode('utf-8')]
+        parts.append(b'}')
+        return b''.join(parts)
+
+message_encoder = MessageEncoder()
+
+def compress_body(body):
+    """Compress a request body as configured; returns the body and the headers to send with it."""
+    method = http_settings['compression']
+    if not method or len(body) < COMPRESS_MIN_BYTES:
+        return body, {}
+    if method == 'zstd':
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=COMPRESSION_LEVELS['zstd']).compress(body), {'Content-Encoding': 'zstd'}
+    import gzip
+
+    return gzip.compress(body, compresslevel=COMPRESSION_LEVELS['gzip'], mtime=0), {'Content-Encoding': 'gzip'}
+
+def build_chat_request(model, messages, headers, **params):
+    """Encode (and maybe compress) a chat request body, adding any Content-Encoding to headers."""
+    with profiler.span("request: encode body"):
+        body, extra_headers = compress_body(message_encoder.encode(model, messages, **params))
+    headers.update(extra_headers)
+    return body
+
+def record_response_metrics(metrics, response, start):
+    """Fill metrics with connection, time-to-first-byte and size figures for a response."""
+    metrics.update(take_connection_timings())
+    metrics['ttfb'] = response.elapsed.total_seconds()
+    metrics['request_bytes'] = len(response.request.body or b'')
+    metrics['response_bytes'] = response.raw.tell()
+    metrics['latency'] = time.perf_counter() - start
+    record_rate_limits(metrics, response)
+
+def record_rate_limits(metrics, response):
+    """Keep the x-ratelimit-* headers of a response, for the request limiter."""
+    metrics['rate_limits'] = {name.lower(): value for name, value in response.headers.items()
+                              if name.lower().startswith('x-ratelimit-')}
+
+def open_web_ui_api_request(prompt, model, api_key, base_url, metrics=None):
+    """
+    Make a request to the OpenWebUI API
+
+    When a metrics dict is given, it is filled with timings, sizes and usage.
+    """
+    import requests
+
+    # Construct the full endpoint URL
+    endpoint = get_chat_endpoint(base_url)
     
-    logger.info(f"Making API request to OpenWebUI model: {model}")
-    logger.info(f"Using endpoint: {endpoint}")
+    logger.info("Making API request to OpenWebUI model: %s", model)
+    logger.info("Using endpoint: %s", endpoint)
     # Set up headers
     headers = {
         'Authorization': f'Bearer {api_key}',
@@ -67,63 +293,847 @@ def open_web_ui_api_request(prompt, model, api_key, base_url):
     }
     
     # Set up the request data
-    data = {
-        'model': model,
-        'messages': messages
-    }
+    data = build_chat_request(model, prompt, headers)
     
     try:
         # Make the POST request
-        response = requests.post(endpoint, headers=headers, json=data)
+        start = time.perf_counter()
+        with profiler.span("request: HTTP round trip"):
+            response = get_http_session().post(endpoint, headers=headers, data=data, timeout=http_settings['timeout'])
+        if metrics is not None:
+            record_response_metrics(metrics, response, start)
         
-        logger.debug(f"API Response: {response.text}")
+        if logger.isEnabledFor(logging.DEBUG):
+            # response.text decodes the whole body, so only touch it when it will be logged
+            logger.debug("API Response: %s", response.text)
         logger.info("API request completed")
         
         # Raise an exception for bad status codes
         response.raise_for_status()
         
         # Return the JSON response
-        return response.json()
+        with profiler.span("request: JSON decode"):
+            response_data = response.json()
+        if metrics is not None and isinstance(response_data, dict):
+            metrics['usage'] = response_data.get('usage')
+        return response_data
         
     except requests.exceptions.RequestException as e:
-        logger.error(f"API request failed: {str(e)}")
+        if threading.get_ident() in _aborted_requests:
+            _aborted_requests.discard(threading.get_ident())
+            logger.info("API request aborted")
+        else:
+            # Only a warning: the request limiter may retry it, and reports the final failure
+            logger.warning("API request failed: %s", e)
         raise
 
-def list_available_models(api_key, base_url=None):
+def open_web_ui_api_stream(prompt, model, api_key, base_url, metrics=None):
     """
-    Fetch and list available models from the OpenAI API or a custom endpoint.
+    Make a streaming request to the OpenWebUI API.
+
+    Yields the content of each server-sent event delta as it arrives. When a
+    metrics dict is given, it is filled in once the stream ends.
     """
+    import requests
+
+    endpoint = get_chat_endpoint(base_url)
+
+    logger.info("Making streaming API request to OpenWebUI model: %s", model)
+    logger.info("Using endpoint: %s", endpoint)
+    headers = {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream'
+    }
+
+    data = build_chat_request(model, prompt, headers, stream=True)
+
+    try:
+        start = time.perf_counter()
+        first_token = None
+        usage = None
+        received_bytes = 0
+        with profiler.span("stream: HTTP headers"):
+            response = get_http_session().post(endpoint, headers=headers, data=data, stream=True,
+                                               timeout=http_settings['timeout'])
+        with response:
+            response.raise_for_status()
+            # chunk_size=None hands over each chunk as soon as the server flushes it
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                received_bytes += len(line.encode()) + 1
+                if not line or not line.startswith('data:'):
+                    continue
+                payload = line[len('data:'):].strip()
+                if payload == '[DONE]':
+                    break
+                try:
+                    with profiler.span("stream: JSON decode"):
+                        event = json.loads(payload)
+                except json.JSONDecodeError:
+                    logger.warning("Skipping malformed stream event: %s", payload)
+                    continue
+                if 'error' in event:
+                    raise ValueError(f"API returned an error: {event['error']}")
+                usage = event.get('usage') or usage
+                choices = event.get('choices') or []
+                if not choices:
+                    continue
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    yield content
+
+            if metrics is not None:
+                record_response_metrics(metrics, response, start)
+                metrics['first_token'] = first_token
+                metrics['response_bytes'] = received_bytes
+                metrics['usage'] = usage
+
+        logger.info("Streaming API request completed")
+
+    except requests.exceptions.RequestException as e:
+        if threading.get_ident() in _aborted_requests:
+            _aborted_requests.discard(threading.get_ident())
+            logger.info("Streaming API request aborted")
+        else:
+            logger.warning("Streaming API request failed: %s", e)
+        raise
+
+def get_models_url(base_url):
     if base_url:
-        url = f"{base_url}/api/models"
-    else:
-        url = "https://api.openai.com/v1/models"
+        return f"{base_url}/api/models"
+    return "https://api.openai.com/v1/models"
 
+def fetch_models(api_key, base_url=None, quiet=False):
+    """Return the model ids offered by the endpoint, or None if the response has no model list."""
     headers = {
         "Authorization": f"Bearer {api_key}"
     }
 
-    try:
-        response = requests.get(url, headers=headers)
+    def send(url, metrics):
+        response = get_http_session().get(get_models_url(url), headers=headers, timeout=http_settings['timeout'])
+        record_rate_limits(metrics, response)
         response.raise_for_status()
-        models_data = response.json()
+        return response.json()
+
+    models_data = endpoint_request(send, base_url, quiet=quiet)
+    if "data" not in models_data:
+        return None
+    return [model['id'] for model in models_data["data"]]
+
+# Endpoint routing when several base URLs are configured
+ENDPOINT_PROBE_INTERVAL = 30
+ENDPOINT_PROBE_TIMEOUT = 5
+ENDPOINT_RETRY_AFTER = 30
+ENDPOINT_LATENCY_SAMPLES = 100
+HEDGE_MIN_SAMPLES = 10
+RTT_SMOOTHING = 0.3
+
+def is_endpoint_failure(error):
+    """Whether an error means the endpoint itself is unavailable, so another one should be tried."""
+    import requests
+
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.exceptions.HTTPError) and response is not None and response.status_code >= 500
+
+class EndpointRouter:
+    """
+    Spreads chat requests over several OpenAI-compatible endpoints.
+
+    Endpoints are ranked by the smoothed round trip of background probes of
+    their model list. One that fails with a connection error, timeout or 5xx
+    is passed over for ENDPOINT_RETRY_AFTER seconds (or until a probe succeeds)
+    and the request moves on to the next. With hedge set, a request that has
+    not been answered within its endpoint's p95 latency is duplicated to the
+    runner-up, and the first answer wins. Stats carry across runs via to_config().
+    """
+
+    def __init__(self, base_urls, saved_stats=None, hedge=False):
+        self.hedge = hedge
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        for url in base_urls:
+            saved = (saved_stats or {}).get(url) or {}
+            self.endpoints[url] = {
+                'rtt': saved.get('rtt'),
+                'p95': saved.get('p95'),
+                'latencies': collections.deque(maxlen=ENDPOINT_LATENCY_SAMPLES),
+                'successes': saved.get('successes', 0),
+                'failures': saved.get('failures', 0),
+                'down_until': 0.0,
+            }
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.executor = None
+
+    def ranked(self):
+        """Return the endpoints to try in order: healthy ones fastest first, then the failed ones."""
+        now = time.monotonic()
+        with self.lock:
+            items = list(self.endpoints.items())
+        up = sorted((url for url, stats in items if stats['down_until'] <= now),
+                    key=lambda url: self.endpoints[url]['rtt'] if self.endpoints[url]['rtt'] is not None else math.inf)
+        down = sorted((url for url, stats in items if stats['down_until'] > now),
+                      key=lambda url: self.endpoints[url]['down_until'])
+        return up + down
+
+    def _mark_up(self, url, rtt=None):
+        stats = self.endpoints[url]
+        with self.lock:
+            stats['down_until'] = 0.0
+            if rtt is not None:
+                stats['rtt'] = rtt if stats['rtt'] is None else stats['rtt'] + RTT_SMOOTHING * (rtt - stats['rtt'])
+
+    def record_success(self, url, latency=None):
+        self._mark_up(url)
+        with self.lock:
+            self.endpoints[url]['successes'] += 1
+            if latency is not None:
+                self.endpoints[url]['latencies'].append(latency)
+
+    def record_failure(self, url, error):
+        logger.warning("Endpoint %s failed, trying the next one: %s", url, error)
+        with self.lock:
+            self.endpoints[url]['failures'] += 1
+            self.endpoints[url]['down_until'] = time.monotonic() + ENDPOINT_RETRY_AFTER
+
+    def p95(self, url):
+        """Return the p95 request latency of an endpoint, from this run or else a previous one."""
+        with self.lock:
+            latencies = list(self.endpoints[url]['latencies'])
+            saved = self.endpoints[url]['p95']
+        if len(latencies) >= HEDGE_MIN_SAMPLES:
+            return percentile(latencies, 95)
+        return saved
+
+    def probe(self, api_key):
+        """Time a model list request to every endpoint at once and update their health."""
+        def _probe(url):
+            start = time.perf_counter()
+            try:
+                response = get_http_session().get(get_models_url(url), headers={"Authorization": f"Bearer {api_key}"},
+                                                  timeout=ENDPOINT_PROBE_TIMEOUT)
+                response.close()
+                if response.status_code >= 500:
+                    raise ValueError(f"status {response.status_code}")
+            except Exception as e:
+                logger.info("Probe of %s failed: %s", url, e)
+                with self.lock:
+                    self.endpoints[url]['down_until'] = time.monotonic() + ENDPOINT_RETRY_AFTER
+                return
+            self._mark_up(url, time.perf_counter() - start)
+
+        threads = [threading.Thread(target=_probe, args=(url,), daemon=True) for url in self.endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def start_probing(self, api_key, interval=ENDPOINT_PROBE_INTERVAL):
+        """Probe the endpoints now and then every interval seconds, in a daemon thread."""
+        def _run():
+            while True:
+                self.probe(api_key)
+                time.sleep(interval)
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def _failover(self, candidates, send, metrics, cancelled):
+        error = None
+        for url in candidates:
+            attempt_metrics = {}
+            start = time.perf_counter()
+            try:
+                result = send(url, attempt_metrics)
+            except Exception as e:
+                # A request aborted on purpose says nothing about the endpoint
+                if (cancelled is not None and cancelled.is_set()) or not is_endpoint_failure(e):
+                    raise
+                self.record_failure(url, e)
+                error = e
+                continue
+            self.record_success(url, time.perf_counter() - start)
+            if metrics is not None:
+                metrics.update(attempt_metrics)
+            return result
+        raise error
+
+    def request(self, send, metrics=None, cancelled=None):
+        """
+        Return send(base_url, metrics) from the best endpoint, failing over to the others in turn.
+
+        cancelled is an Event set when the caller gives up on the request.
+        """
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        candidates = self.ranked()
+        delay = self.p95(candidates[0]) if self.hedge and len(candidates) > 1 else None
+        if delay is None:
+            return self._failover(candidates, send, metrics, cancelled)
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=32)
+        # Set once the request is settled, so aborting the other copy isn't counted as a failure
+        settled = threading.Event()
+        attempts = {}
+
+        def launch(order):
+            attempt = {'metrics': {}, 'thread': None}
+
+            def run():
+                attempt['thread'] = threading.get_ident()
+                try:
+                    return self._failover(order, send, attempt['metrics'], settled)
+                finally:
+                    _active_connections.pop(attempt['thread'], None)
+                    _aborted_requests.discard(attempt['thread'])
+
+            attempts[self.executor.submit(run)] = attempt
+
+        def settle():
+            settled.set()
+            for future, attempt in attempts.items():
+                if not future.done() and attempt['thread'] is not None:
+                    abort_request(attempt['thread'])
+
+        launch(candidates)
+        hedge_at = time.monotonic() + delay
+        hedge = None
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                settle()
+                if future is hedge:
+                    with self.lock:
+                        self.hedge_wins += 1
+                if metrics is not None:
+                    metrics.update(attempts[future]['metrics'])
+                return result
+            if cancelled is not None and cancelled.is_set():
+                settle()
+                break
+            if hedge is None and pending and time.monotonic() >= hedge_at:
+                logger.info("No answer after %.3fs, sending a hedged request to %s", delay, candidates[1])
+                with self.lock:
+                    self.hedges += 1
+                launch(candidates[1:])
+                hedge = list(attempts)[-1]
+                pending.add(hedge)
+        raise error or ValueError("Request cancelled")
+
+    def stream(self, open_stream, metrics=None, cancelled=None):
+        """
+        Yield from open_stream(base_url, metrics) on the best endpoint, failing over to the others in turn.
+
+        Endpoints are only switched before the first chunk arrives; an error
+        after the answer has started is raised as is.
+        """
+        error = None
+        for url in self.ranked():
+            chunks = open_stream(url, metrics)
+            try:
+                first = next(chunks)
+            except StopIteration:
+                self.record_success(url)
+                return
+            except Exception as e:
+                if (cancelled is not None and cancelled.is_set()) or not is_endpoint_failure(e):
+                    raise
+                self.record_failure(url, e)
+                error = e
+                continue
+            yield first
+            yield from chunks
+            self.record_success(url)
+            return
+        raise error
+
+    def to_config(self):
+        """Return per-endpoint stats to keep in the saved config."""
+        stats = {}
+        for url in self.endpoints:
+            p95 = self.p95(url)
+            with self.lock:
+                endpoint = self.endpoints[url]
+                stats[url] = {'rtt': round(endpoint['rtt'], 4) if endpoint['rtt'] is not None else None,
+                              'p95': round(p95, 4) if p95 is not None else None,
+                              'successes': endpoint['successes'], 'failures': endpoint['failures']}
+        return stats
+
+    def describe(self):
+        """Return a table of each endpoint's health, probe round trip and request latency."""
+        now = time.monotonic()
+        lines = [f"{'Endpoint':<32}{'state':>7}{'probe':>10}{'p50':>10}{'p95':>10}{'ok':>7}{'failed':>8}"]
+        for url in self.ranked():
+            p95 = self.p95(url)
+            with self.lock:
+                endpoint = self.endpoints[url]
+                latencies = list(endpoint['latencies'])
+                row = [url if len(url) <= 31 else url[:28] + '...',
+                       'down' if endpoint['down_until'] > now else 'up',
+                       format_metric(endpoint['rtt'], 's') if endpoint['rtt'] is not None else '-',
+                       format_metric(percentile(latencies, 50), 's') if latencies else '-',
+                       format_metric(p95, 's') if p95 is not None else '-',
+                       endpoint['successes'], endpoint['failures']]
+            lines.append(f"{row[0]:<32}{row[1]:>7}{row[2]:>10}{row[3]:>10}{row[4]:>10}{row[5]:>7}{row[6]:>8}")
+        if self.hedge:
+            lines.append(f"Hedged requests: {self.hedges} ({self.hedge_wins} answered first by the duplicate)")
+        return "\n".join(lines)
+
+endpoint_router = None
+
+def configure_endpoints(base_urls, saved_stats=None, hedge=False):
+    """Route chat requests across base_urls; a single URL needs no router."""
+    global endpoint_router
+    endpoint_router = EndpointRouter(base_urls, saved_stats, hedge) if len(base_urls) > 1 else None
+    return endpoint_router
+
+def chat_request(prompt, model, api_key, base_url, metrics=None, cancelled=None):
+    """
+    open_web_ui_api_request through the request limiter, on base_url or on the
+    best endpoint when several are configured.
+    """
+    metrics = {} if metrics is None else metrics
+    if endpoint_router is None:
+        send = lambda: open_web_ui_api_request(prompt, model, api_key, base_url, metrics)
+    else:
+        send = lambda: endpoint_router.request(lambda url, attempt_metrics: open_web_ui_api_request(
+            prompt, model, api_key, url, attempt_metrics), metrics, cancelled)
+    return request_limiter.call(send, prompt, metrics, cancelled)
+
+def chat_stream(prompt, model, api_key, base_url, metrics=None, cancelled=None, quiet=False):
+    """
+    open_web_ui_api_stream through the request limiter, on base_url or on the
+    best endpoint when several are configured. With quiet, the caller reports
+    a final failure itself.
+    """
+    metrics = {} if metrics is None else metrics
+    if endpoint_router is None:
+        open_stream = lambda: open_web_ui_api_stream(prompt, model, api_key, base_url, metrics)
+    else:
+        open_stream = lambda: endpoint_router.stream(lambda url, stream_metrics: open_web_ui_api_stream(
+            prompt, model, api_key, url, stream_metrics), metrics, cancelled)
+    return request_limiter.stream(open_stream, prompt, metrics, cancelled, quiet)
+
+def endpoint_request(send, base_url, messages=(), metrics=None, cancelled=None, quiet=False):
+    """
+    Return send(url, metrics) through the request limiter, on base_url or on
+    the best endpoint when several are configured. For API calls other than
+    chat completions, such as embeddings and the model list; messages is what
+    the call sends, for the tokens-per-minute limit. With quiet, the caller
+    reports a final failure itself.
+    """
+    metrics = {} if metrics is None else metrics
+    if endpoint_router is None:
+        call = lambda: send(base_url, metrics)
+    else:
+        call = lambda: endpoint_router.request(send, metrics, cancelled)
+    return request_limiter.call(call, messages, metrics, cancelled, quiet)
+
+def save_endpoint_stats():
+    """Keep the router's per-endpoint stats in the saved config for the next run."""
+    if endpoint_router is None:
+        return
+    config = load_config()
+    config['endpoint_stats'] = endpoint_router.to_config()
+    save_config(config, verbose=False)
+
+# Retries and client-side rate limiting, shared by every API call in the process
+DEFAULT_MAX_RETRIES = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30
+# A server asking for a longer wait than this is treated as a failure instead
+RETRY_GIVE_UP_DELAY = 120
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+OVERLOAD_STATUSES = {429, 503}
+
+def parse_reset_duration(value):
+    """Parse a Retry-After or x-ratelimit-reset-* value ('2', '1.5s', '6m0s', '20ms' or an HTTP date) into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if parts and ''.join(number + unit for number, unit in parts) == value:
+        scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def get_error_status(error):
+    response = getattr(error, 'response', None)
+    return response.status_code if response is not None else None
+
+def estimate_request_tokens(messages):
+    """Estimate the prompt tokens of a chat request, for the tokens-per-minute limit."""
+    return sum(estimate_tokens(str(message.get('content') or '')) for message in messages)
+
+class TokenBucket:
+    """
+    Allows amount per minute, with bursts of up to a minute's worth.
+
+    reserve() takes from the bucket at once and returns how long the caller
+    must wait for it to have been refilled, so concurrent callers queue up
+    behind each other in order instead of racing for the same capacity.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount):
+        """Take (or give back, if negative) amount once the real cost of a request is known."""
+        with self.lock:
+            self.level = min(self.capacity, self.level - amount)
+
+class AIMDController:
+    """
+    Adaptive limit on the number of requests in flight.
+
+    The limit grows by one for every limit's worth of successful requests and
+    is halved when the server reports overload (429 or 503), at most once a
+    second so that a burst of rejections counts as one signal.
+    """
+
+    def __init__(self, maximum, minimum=1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self, cancelled=None):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait(0.1)
+                if cancelled is not None and cancelled.is_set():
+                    raise ValueError("Request cancelled")
+            self.in_flight += 1
+
+    def release(self, overloaded=False):
+        with self.condition:
+            self.in_flight -= 1
+            if overloaded:
+                now = time.monotonic()
+                if now - self.last_decrease > 1.0:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+class RequestLimiter:
+    """
+    Retries, rate limits and adaptive concurrency for API calls.
+
+    Each attempt waits for the requests- and tokens-per-minute buckets (when
+    rpm/tpm are set), for any pause the server asked for, and for a slot from
+    the shared AIMDController. Failures with a retryable status or a
+    connection error are retried up to max_retries times, after the server's
+    Retry-After or x-ratelimit-reset-* when given, otherwise after a jittered
+    exponential backoff. When the server reports a rate limit used up, every
+    request in the process waits for it to reset, not just the one that hit it.
+    """
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, rpm=None, tpm=None, max_concurrency=DEFAULT_POOL_SIZE):
+        self.max_retries = max_retries
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AIMDController(max_concurrency)
+        self.paused_until = 0.0
+        self.retries = 0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def _wait(self, seconds, cancelled):
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.waited += seconds
+        if cancelled is None:
+            time.sleep(seconds)
+        elif cancelled.wait(seconds):
+            raise ValueError("Request cancelled")
+
+    def _admit(self, tokens, cancelled):
+        with self.lock:
+            pause = self.paused_until - time.monotonic()
+        self._wait(pause, cancelled)
+        delay = 0.0
+        if self.requests:
+            delay = self.requests.reserve(1)
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        self._wait(delay, cancelled)
+        self.concurrency.acquire(cancelled)
+
+    def pause(self, seconds):
+        """Hold back every request for seconds."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe(self, headers):
+        """Pause until the reset time of any rate limit the server reports as used up."""
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        for kind in ('requests', 'tokens'):
+            if headers.get(f'x-ratelimit-remaining-{kind}') == '0':
+                reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                if reset:
+                    self.pause(reset)
+
+    def retry_delay(self, error, attempt, cancelled=None):
+        """Return how long to wait before retrying after error, or None to give up."""
+        import requests
+
+        if (cancelled is not None and cancelled.is_set()) or attempt >= self.max_retries:
+            return None
+        status = get_error_status(error)
+        if status is None and not isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return None
+        if status is not None and status not in RETRY_STATUSES:
+            return None
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        delay = parse_reset_duration(headers.get('Retry-After'))
+        if delay is None and status == 429:
+            resets = [parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}')) for kind in ('requests', 'tokens')]
+            delay = max((reset for reset in resets if reset is not None), default=None)
+        if delay is None:
+            # Full jitter keeps clients that failed together from retrying together
+            return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        if delay > RETRY_GIVE_UP_DELAY:
+            return None
+        if status == 429:
+            self.pause(delay)
+        return delay + random.uniform(0, RETRY_BASE_DELAY)
+
+    def _failed(self, error, attempt, cancelled):
+        delay = self.retry_delay(error, attempt, cancelled)
+        self.concurrency.release(overloaded=get_error_status(error) in OVERLOAD_STATUSES)
+        if delay is None:
+            return False
+        logger.info("Request failed (%s), retrying in %.2fs", error, delay)
+        with self.lock:
+            self.retries += 1
+        self._wait(delay, cancelled)
+        return True
+
+    def _gave_up(self, error, cancelled, quiet=False):
+        if quiet or (cancelled is not None and cancelled.is_set()):
+            logger.info("Request abandoned: %s", error)
+        else:
+            logger.error("API request failed: %s", error)
+
+    def _succeeded(self, metrics, tokens):
+        self.concurrency.release()
+        self.observe(metrics.get('rate_limits'))
+        total = (metrics.get('usage') or {}).get('total_tokens')
+        if self.tokens and total:
+            self.tokens.adjust(total - tokens)
+
+    def call(self, send, messages, metrics, cancelled=None, quiet=False):
+        """
+        Return send(), retrying it as needed; metrics is the dict send() fills in.
+
+        A request that finally fails is logged as an error unless quiet is set.
+        """
+        tokens = estimate_request_tokens(messages)
+        for attempt in itertools.count():
+            self._admit(tokens, cancelled)
+            try:
+                result = send()
+            except Exception as e:
+                if self._failed(e, attempt, cancelled):
+                    continue
+                self._gave_up(e, cancelled, quiet)
+                raise
+            self._succeeded(metrics, tokens)
+            return result
+
+    def stream(self, open_stream, messages, metrics, cancelled=None, quiet=False):
+        """
+        Yield from open_stream(), retrying it as needed until the first chunk has arrived.
+
+        A stream that finally fails to start is logged as an error unless quiet is set.
+        """
+        tokens = estimate_request_tokens(messages)
+        for attempt in itertools.count():
+            self._admit(tokens, cancelled)
+            chunks = open_stream()
+            try:
+                first = next(chunks)
+            except StopIteration:
+                self._succeeded(metrics, tokens)
+                return
+            except Exception as e:
+                if self._failed(e, attempt, cancelled):
+                    continue
+                self._gave_up(e, cancelled, quiet)
+                raise
+            try:
+                yield first
+                yield from chunks
+            except BaseException:
+                # Includes GeneratorExit when the caller stops reading early
+                self.concurrency.release()
+                raise
+            self._succeeded(metrics, tokens)
+            return
+
+    def describe(self):
+        return (f"Retries: {self.retries}, time spent waiting on rate limits and backoff: {self.waited:.1f}s, "
+                f"concurrency limit: {int(self.concurrency.limit)}")
+
+request_limiter = RequestLimiter()
+
+def configure_rate_limits(max_retries=None, rpm=None, tpm=None, max_concurrency=None):
+    """Replace the process-wide RequestLimiter; call before the first request."""
+    global request_limiter
+    request_limiter = RequestLimiter(DEFAULT_MAX_RETRIES if max_retries is None else max_retries, rpm, tpm,
+                                     max_concurrency or http_settings['pool_size'])
+    return request_limiter
+
+# How long a cached model list is trusted before it is refreshed
+MODEL_CATALOG_TTL = 6 * 3600
+
+class ModelCatalog:
+    """The model ids offered by an endpoint, cached on disk with a TTL."""
+    def __init__(self, cache_dir, base_url):
+        import hashlib
+
+        key = hashlib.sha256((base_url or API_ENDPOINT).encode('utf-8')).hexdigest()[:16]
+        self.path = Path(cache_dir) / 'models' / f"{key}.json"
+        self.base_url = base_url
+        self.models = []
+        self.fetched_at = 0
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self.models = cached['models']
+            self.fetched_at = cached['fetched_at']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable model catalog %s: %s", self.path, e)
+
+    def is_stale(self, ttl=MODEL_CATALOG_TTL):
+        return time.time() - self.fetched_at > ttl
+
+    def refresh(self, api_key, quiet=False):
+        """Fetch the model list and save it. Raises requests exceptions on failure."""
+        models = fetch_models(api_key, self.base_url, quiet)
+        if models is None:
+            return
+        with self.lock:
+            self.models = sorted(models)
+            self.fetched_at = time.time()
+            try:
+                make_private_dir(self.path.parent)
+                with open(self.path, 'w', encoding='utf-8', opener=private_opener) as f:
+                    json.dump({'fetched_at': self.fetched_at, 'models': self.models}, f)
+            except OSError as e:
+                logger.warning("Could not save model catalog: %s", e)
+
+    def refresh_in_background(self, api_key):
+        def _refresh():
+            import requests
+
+            try:
+                self.refresh(api_key, quiet=True)
+                logger.info("Refreshed model catalog: %s models", len(self.models))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.debug("Model catalog refresh failed: %s", e)
+
+        threading.Thread(target=_refresh, daemon=True).start()
+
+def list_available_models(api_key, base_url=None, catalog=None):
+    """
+    Fetch and list available models from the OpenAI API or a custom endpoint.
+
+    A fresh cached catalog is used without contacting the endpoint.
+    """
+    import requests
+
+    try:
+        if catalog is None:
+            models = fetch_models(api_key, base_url)
+        else:
+            if catalog.is_stale() or not catalog.models:
+                catalog.refresh(api_key)
+            models = catalog.models
 
         # Clear the screen
-        os.system('cls' if os.name == 'nt' else 'clear')
+        clear_screen()
 
-        if "data" in models_data:
+        if models:
             print("Available models:")
-            for model in models_data["data"]:
-                print(f"- {model['id']}")
+            for model in models:
+                print(f"- {model}")
         else:
             print("No models found in the response.")
 
     except requests.exceptions.RequestException as e:
         # Clear the screen
-        os.system('cls' if os.name == 'nt' else 'clear')
+        clear_screen()
         print(f"Error fetching models: {e}")
 
-# Clear the terminal
-os.system('cls' if os.name == 'nt' else 'clear')
+_windows_ansi_enabled = False
+
+def clear_screen():
+    """Clear the terminal with escape sequences instead of spawning cls/clear."""
+    global _windows_ansi_enabled
+    if not sys.stdout.isatty():
+        return
+    if os.name == 'nt' and not _windows_ansi_enabled:
+        # Enable VT escape processing on the Windows console
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.GetStdHandle(-11)
+            mode = ctypes.c_uint32()
+            if kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+                kernel32.SetConsoleMode(handle, mode.value | 0x0004)
+        except (AttributeError, OSError):
+            pass
+        _windows_ansi_enabled = True
+    sys.stdout.write('\033[H\033[2J\033[3J')
+    sys.stdout.flush()
+
+def set_terminal_title():
+    try:
+        print('\033]0;OpenAI API Compatible Command-Line Client\a', end='', flush=True)
+    except AttributeError:
+        pass  # Silently pass if there's an issue setting the terminal title
 
 def display_intro():
     coffee_art = '''
@@ -177,7 +1187,7 @@ class CustomHelpFormatter(argparse.HelpFormatter):
 
 # Create helper
 def display_help():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    clear_screen()
     print("OpenAI API Compatible Command-Line Interface (CLI) Help")
     print("======================================================")
 
@@ -189,9 +1199,43 @@ def display_help():
     print("  --api_key <key>                Provide your API key.")
     print("  -m, --model <name>             Specify the model (default: gpt-4).")
     print("  -l, --l-models                 List available models.")
-    print("  -s, --software <name>          Learn about software using its man page.\n")
-    print("  -c, --code-helper <file_path>  Let the AI help you with code from a file.\n")
+    print("  -s, --software <name>          Learn about software using its man page.")
+    print("                                 Several tools can be given at once, e.g. -s jq,awk,xargs.\n")
+    print("  -c, --code-helper <path>...    Let the AI help you with code from files, directories or globs.\n")
+    print("  -p, --prompt <question>        Answer one question on stdout and exit; piped stdin is sent as context.")
+    print("  --stdin-tokens <n>             Token budget for the stdin sent with -p (default: what the model fits).\n")
     print("  --base_url <url>               Specify the base URL for a custom API endpoint.")
+    print("                                 Give several, comma-separated, to route to the fastest healthy one.")
+    print("  --hedge                        With several endpoints, resend slow requests to a second one.")
+    print("  --compare <m1,m2,...>          Send every prompt to several models at once and pick the answer to keep.")
+    print("  --stream, --no-stream          Render responses as they stream in (or wait for the full answer).")
+    print("  --pager, --no-pager            Show responses longer than two screens in a pager.")
+    print("  --pool-size <n>                Number of pooled keep-alive connections (default: 10).")
+    print("  --connect-timeout <seconds>    Connection timeout (default: 10).")
+    print("  --read-timeout <seconds>       Read timeout while waiting for the API (default: 300).")
+    print("  --max-retries <n>              Retries for rate-limited or transiently failed requests (default: 4).")
+    print("  --rpm <n>, --tpm <n>           Limit requests or tokens per minute on the client side.")
+    print("  --compress <gzip|zstd|none>    Compress request bodies for endpoints that accept it (default: none).")
+    print("  --context-tokens <n>           Model context window in tokens; older turns are dropped to fit.")
+    print("  --summarize-evicted            Keep a model-written summary of the turns dropped from the context.")
+    print("  --code-tokens <n>              Token budget for the code sent with each -c question (default: 6000).")
+    print("  --doc-sections <n>             Documentation sections sent with each -s question (default: 4).")
+    print("  --cache, --no-cache            Reuse cached responses for identical requests (off by default).")
+    print("  --cache-dir <dir>              Directory for on-disk caches (default: ~/.cache/openai-cl).")
+    print("  --semantic-cache               Reuse cached answers for reworded questions (off by default).")
+    print("  --similarity <0-1>             How similar a question must be to reuse a cached answer (default: 0.9).")
+    print("  --embedder <hashing|api>       Embed questions locally (default) or with the endpoint's embeddings API.")
+    print("  --batch <file>                 Send the requests in a JSONL file ('-' for stdin) non-interactively.")
+    print("  --batch-output <file>          JSONL file batch results are appended to (ids already done are skipped).")
+    print("  --concurrency <n>              Number of batch requests in flight at once (default: 4).")
+    print("  --metrics-file <file>          Record per-request timings as JSON lines (or a Prometheus .prom textfile).")
+    print("  --resume <id|last>             Continue a saved conversation.")
+    print("  --no-save                      Don't save this conversation, its prompts or its turns in the history.")
+    print("  --list-sessions                List saved conversations and exit.")
+    print("  --search <terms>               Search past questions and answers across sessions and exit.")
+    print("  --profile                      Print the time spent in each phase (startup, request, render) at exit.")
+    print("  --profile-output <file>        Also write a Chrome trace (.json) or cProfile stats (.prof) file.")
+    print("  --startup-bench                Report startup time per phase and exit.")
     print("  --save_config                  Save the current configuration.")
     print("  --clear_config                 Clear the saved configuration.\n")
 
@@ -200,319 +1244,2698 @@ def display_help():
     print("  clear                     Clear the terminal screen.")
     print("  exit                      End the interactive session.")
     print("  raw                       Display the last AI response in raw format, preserving markdown syntax.")
-    print("  markdown or md            Equivalent to 'raw', shows the last AI response preserving markdown.\n")
+    print("  markdown or md            Equivalent to 'raw', shows the last AI response preserving markdown.")
+    print("  cache                     Show response and semantic cache hits, misses and size.")
+    print("  stats                     Show p50/p95/max latency, time to first token, throughput and sizes.")
+    print("  attach <path>             Send a text file with your next message (kept on disk, not in memory).")
+    print("  search <terms>            Find past questions and answers from every session, best matches first.")
+    print("  /model [name]             Show or switch the model without losing the conversation (Tab completes names).")
+    print("  /compare <m1,m2,...|off>  Send each prompt to several models in parallel and pick the answer to keep.\n")
 
     print("Interactive Session Tips:")
     print("- Type or paste your messages into the terminal.")
     print("- Submit multi-line messages with `Ctrl+Space`.")
     print("- AI responses appear after the 'AI:' prompt.")
     print("- Use commands like help, clear, or exit by typing and submitting with `Ctrl+Space`.")
-    print("- End the session with `Ctrl+q`.\n")
+    print("- End the session with `Ctrl+q`.")
+    print("- Cancel an answer that is still arriving with `Ctrl+C`.")
+    print("- Type while an answer arrives to queue your next prompt with `Ctrl+Space`.\n")
 
     print("Examples:")
     print("  openai-cl.py --api_key YOUR_API_KEY_HERE")
     print("  openai-cl.py -m gpt-3.5-turbo-16k")
     print("  openai-cl.py -s nano")
     print("  openai-cl.py --api_key YOUR_API_KEY_HERE -m gpt-3.5-turbo-16k -s vim")
-    print("  openai-cl.py --base_url https://your-custom-endpoint.com/v1\n")
+    print("  openai-cl.py --base_url https://your-custom-endpoint.com/v1")
+    print("  journalctl -b | openai-cl.py -p \"Why did the network fail?\"")
+    print("  openai-cl.py --batch prompts.jsonl --batch-output results.jsonl --concurrency 8\n")
 
     print("Note: Keep your API key confidential. Do not expose or share it in public spaces.")
     print()
 
+# Seconds each documentation command (man, -h, --help) may take before it is killed
+DOC_FETCH_TIMEOUT = 10
+DOC_FETCH_WORKERS = 8
+
+def run_doc_command(command):
+    """Run a documentation command with stdin closed and a timeout; returns the CompletedProcess or None on timeout."""
+    try:
+        return subprocess.run(command, capture_output=True, text=True, errors='replace', stdin=subprocess.DEVNULL,
+                              timeout=DOC_FETCH_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        logger.warning("'%s' did not finish within %ss", ' '.join(command), DOC_FETCH_TIMEOUT)
+        return None
+
 def get_software_info(software_name):
+    """
+    Fetch documentation for a CLI tool.
+
+    Returns a (kind, text) tuple where kind is 'man' or 'help', or (None, error_message).
+    """
     try:
         # Use 'man -P cat' to get raw man page content without formatting
-        process = subprocess.Popen(['man', '-P', 'cat', software_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        man_page, stderr = process.communicate()
+        try:
+            process = run_doc_command(['man', '-P', 'cat', software_name])
+        except FileNotFoundError:
+            process = None  # no man on this system; the tool's own help may still work
 
-        if process.returncode == 0:
+        if process is not None and process.returncode == 0:
             # Man page found successfully
-            if stderr:
-                logger.warning(f"Warnings while retrieving man page for {software_name}:\n{stderr}")
+            if process.stderr:
+                logger.warning("Warnings while retrieving man page for %s:\n%s", software_name, process.stderr)
             
             # Clean up the man page content
-            cleaned_man_page = re.sub(r'\n{3,}', '\n\n', man_page)  # Reduce multiple newlines
+            cleaned_man_page = re.sub(r'.\x08', '', process.stdout)  # Strip overstrike bold/underline
+            cleaned_man_page = re.sub(r'\n{3,}', '\n\n', cleaned_man_page)  # Reduce multiple newlines
             
-            return f"Here's the man page for {software_name}:\n{cleaned_man_page}"
-        else:
-            # Man page not found, try -h flag
-            print(f"No man page found for {software_name}. Trying '{software_name} -h'...")
-            help_process = subprocess.Popen([software_name, '-h'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            help_output, help_stderr = help_process.communicate()
-
-            if help_process.returncode == 0:
-                # -h flag worked
-                print(f"\nNote: GPT has been provided with the help output for {software_name}. You can now ask questions about it.\n")
-                return f"Here's the help output for {software_name}:\n{help_output}"
-            else:
-                # Both man page and -h flag failed
-                error_message = f"Unable to retrieve information for {software_name}. "
-                error_message += "No man page entry exists and it could not be executed with the '-h' flag. "
-                error_message += "Ensure the software is installed and the name is spelled correctly."
-                print(f"\nWarning: {error_message}\n")
-                return error_message
+            return 'man', cleaned_man_page
+
+        # Man page not found, try -h and then --help
+        print(f"No man page found for {software_name}. Trying '{software_name} -h'...")
+        for flag in ('-h', '--help'):
+            try:
+                help_process = run_doc_command([software_name, flag])
+            except (FileNotFoundError, PermissionError):
+                break  # not an executable we can run
+            if help_process is None:
+                break  # a tool that hangs on -h will hang on --help too
+            if help_process.returncode == 0 and help_process.stdout.strip():
+                return 'help', help_process.stdout
+            # Many tools print their usage to stderr and exit non-zero for -h
+            usage = help_process.stdout.strip() or help_process.stderr.strip()
+            if re.match(r'\s*usage\b', usage, re.IGNORECASE):
+                return 'help', usage
+
+        # Both man page and -h flag failed
+        error_message = f"Unable to retrieve information for {software_name}. "
+        error_message += "No man page entry exists and it could not be executed with the '-h' or '--help' flag. "
+        error_message += "Ensure the software is installed and the name is spelled correctly."
+        print(f"\nWarning: {error_message}\n")
+        return None, error_message
 
-    except FileNotFoundError:
-        error_message = f"The command 'man' was not found. This feature may not be available on your system."
-        print(f"\nError: {error_message}\n")
-        return error_message
     except Exception as e:
         error_message = f"An unexpected error occurred while trying to get information for {software_name}: {str(e)}"
         print(f"\nError: {error_message}\n")
-        return error_message
+        return None, error_message
 
-def get_file_content(file_path):
+def get_software_doc_source(software_name):
+    """Return the file whose mtime decides whether cached docs for a tool are still valid."""
     try:
-        # Read the file's contents
-        with open(file_path, 'r', encoding='utf-8') as file:
-            file_contents = file.read()
-
-        # Append a message indicating the file's contents are being submitted
-        messages.append({"role": "assistant", "content": f"Submitting the contents of {file_path} to OpenAI for assistance. I need help or assistance with some code that I am working on.\n{file_contents}"})
-        print(f"GPT has been provided the code of {file_path} you're currently working on. You can now ask questions about your code.\n")
+        result = run_doc_command(['man', '-w', software_name])
+        if result is not None and result.returncode == 0 and result.stdout.strip():
+            return result.stdout.strip().splitlines()[0]
     except FileNotFoundError:
-         messages.append({"role": "assistant", "content": f"No file was found at this path."})
+        pass
+    return shutil.which(software_name)
 
-# Function to load configuration
-def load_config():
-    config_path = Path.home() / '.openai-cl-config.json'
-    if config_path.exists():
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-            logger.info(f"Loaded configuration: {config}")  
-            return config
-    logger.info("No saved configuration found.")  
-    return {}
+# Chunks larger than this are split at paragraph boundaries
+DOC_CHUNK_CHARS = 1500
+# Documents smaller than this are sent whole instead of searched
+DOC_FULL_TEXT_TOKENS = 1500
+DEFAULT_DOC_SECTIONS = 4
 
-# Function to save configuration
-def save_config(config):
-    config_path = Path.home() / '.openai-cl-config.json'
-    with open(config_path, 'w') as f:
-        json.dump(config, f)
-        print(f"Saved configuration: {config}")  
+# Always-sent sections that orient the model (what the tool is and how it's invoked)
+DOC_OVERVIEW_HEADINGS = ('NAME', 'SYNOPSIS', 'USAGE')
 
-# Add this function near the top of the file
-def validate_api_response(response):
-    """Validates the API response format and returns appropriate error messages."""
-    if not isinstance(response, dict):
-        return False, f"Invalid response type: {type(response)}"
-    if 'choices' not in response:
-        return False, f"Missing 'choices' in response: {response}"
-    if not response['choices']:
-        return False, "Empty choices array in response"
-    if 'message' not in response['choices'][0]:
-        return False, f"Missing 'message' in first choice: {response['choices'][0]}"
-    if 'content' not in response['choices'][0]['message']:
-        return False, f"Missing 'content' in message: {response['choices'][0]['message']}"
-    return True, None
+def stem(term):
+    """Strip common English suffixes so that e.g. 'recursively' matches 'recursive'."""
+    for suffix in ('ingly', 'edly', 'ing', 'ly', 'ed', 'es', 's'):
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            return term[:-len(suffix)]
+    return term
 
+STOPWORDS = frozenset(
+    'a an and are as at be by can do does for from how i if in is it me my of on or so that the '
+    'this to use using was what when where which who why will with you your'.split())
 
-def highlight_code_blocks(text):
-    # Regular expression to identify code blocks
-    code_block_pattern = re.compile(r'```(.*?)```', re.DOTALL)
+def tokenize(text):
+    """
+    Split text into stemmed search terms.
 
-    # Function to replace the block with highlighted code
-    def replace_with_highlighted(match):
-        code = match.group(1).strip()
-        language = None
-        if '\n' in code:
-            maybe_lang, rest_of_code = code.split('\n', 1)
-            if not maybe_lang.isalnum():
-                # If the first line isn't a language name, treat the entire block as code
-                rest_of_code = code
-            else:
-                language = maybe_lang
-                code = rest_of_code
+    Identifiers like call_later, --dry-run or camelCase also yield their parts
+    so that plain-language questions can match them.
+    """
+    terms = []
+    for word in re.findall(r'[A-Za-z0-9][A-Za-z0-9_\-]*', text):
+        lowered = word.lower()
+        if lowered in STOPWORDS:
+            continue
+        terms.append(stem(lowered))
+        parts = re.findall(r'[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])', word)
+        if len(parts) > 1:
+            terms.extend(stem(part.lower()) for part in parts if part.lower() not in STOPWORDS)
+    return terms
 
-        # Guess the lexer if not specified
-        if not language:
-            lexer = guess_lexer(code)
-        else:
-            lexer = get_lexer_by_name(language)
+def split_doc_sections(text):
+    """
+    Split man page or --help output into section-aware chunks.
 
-        # Highlight the code
-        return highlight(code, lexer, TerminalFormatter())
+    Top-level headings (NAME, OPTIONS, ...) start a new chunk, as do indented
+    option entries such as "  -r, --recursive". Each chunk is prefixed with its
+    section heading so it still makes sense on its own.
+    """
+    chunks = []
+    heading = ""
+    current = []
 
-    # Replace each code block with its highlighted version
-    highlighted_text = re.sub(code_block_pattern, replace_with_highlighted, text)
+    def flush():
+        body = textwrap.dedent("\n".join(current)).strip()
+        if body:
+            # Long chunks are split at paragraph boundaries
+            piece = ""
+            for paragraph in re.split(r'\n\s*\n', body):
+                if piece and len(piece) + len(paragraph) > DOC_CHUNK_CHARS:
+                    chunks.append({'heading': heading, 'text': piece})
+                    piece = ""
+                piece = f"{piece}\n\n{paragraph}" if piece else paragraph
+            if piece:
+                chunks.append({'heading': heading, 'text': piece})
+        current.clear()
 
-    return highlighted_text
+    previous_blank = True
+    for line in text.splitlines():
+        stripped = line.strip()
+        is_heading = bool(stripped) and not line[0].isspace() and stripped.upper() == stripped and len(stripped) < 60
+        is_option = previous_blank and re.match(r'^\s{1,8}-{1,2}[A-Za-z0-9]', line) is not None
+        if is_heading:
+            flush()
+            heading = stripped
+        elif is_option:
+            flush()
+            current.append(line)
+        else:
+            current.append(line)
+        previous_blank = not stripped
+    flush()
+    return chunks
 
-# Define argument parser
-# Help is handled in a custom way
-parser = argparse.ArgumentParser(description='Interactively chat with LLMs.', add_help=False)
-parser.add_argument('--api_key', type=str, help='Your OpenAI API key. Can be set as environment variable.')
-parser.add_argument('-m', '--model', type=str, help='The model to be used for the conversation.')
-parser.add_argument('-l', '--l-models', action='store_true', help='List available models.')
-parser.add_argument('-s', '--software', type=str, help='Learn about a software using its man page.')
-parser.add_argument('-h', '--help', action='store_true', help='Display this help message and exit.')
-parser.add_argument('-c', '--code-helper', type=str, metavar='FILE', help='Provide a file for code assistance.')
-parser.add_argument('--base_url', type=str, help='Base URL for custom OpenAI API endpoint')
-parser.add_argument('--save_config', action='store_true', help='Save the current configuration')
-parser.add_argument('--clear_config', action='store_true', help='Clear the saved configuration')
-
-# Load existing config
-config = load_config()
-if config:
-    print("Loaded saved configuration.")
-
-# Parse arguments
-args = parser.parse_args()
-
-def get_api_key():
-    if args.api_key:
-        logger.info("Using API key from command-line argument")
-        return args.api_key
+class BM25Index:
+    """Okapi BM25 ranking over pre-tokenized documents."""
+    k1 = 1.5
+    b = 0.75
 
-    if os.getenv("OPENWEBUI_KEY"):
-        logger.info("Using API key from OPENWEBUI_KEY environment variable")
-        return os.getenv("OPENWEBUI_KEY")
-    
-    if os.getenv("OPENAI_API_TOKEN"):
-        logger.info("Using API key from OPENAI_API_TOKEN environment variable")
-        return os.getenv("OPENAI_API_TOKEN")
-    
-    logger.error("No API key found")
-    return None
+    def __init__(self, term_counts):
+        self.term_counts = term_counts
+        self.lengths = [sum(counts.values()) for counts in term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        # Postings lists are built per query term on first use, which keeps
+        # loading a large index cheap
+        self.postings = {}
 
-api_key = get_api_key()
+    def _postings(self, term):
+        postings = self.postings.get(term)
+        if postings is None:
+            postings = [(index, counts[term]) for index, counts in enumerate(self.term_counts) if term in counts]
+            self.postings[term] = postings
+        return postings
 
-if api_key is None:
-    print("No OpenAI API Key provided. Please use one of the following methods:")
-    print("1. Use the --api_key command-line argument")
-    print("2. Set the OPENWEBUI_KEY environment variable")
-    print("3. Set the OPENAI_API_TOKEN environment variable")
-    exit(1)
+    @classmethod
+    def from_texts(cls, texts):
+        from collections import Counter
 
+        return cls([dict(Counter(tokenize(text))) for text in texts])
 
-if args.software:
-    SYSTEM_PROMPT = (
-        "Expert CLI assistant focused on delivering single-command solutions. "
-        "Always prioritize using provided documentation. "
-        "Respond with exactly one command unless complexity requires alternatives. "
-        "Format commands as inline code. "
-        "Prioritize brevity - no examples or extra text unless absolutely needed."
-    )
-else:
-    SYSTEM_PROMPT = (
+    def search(self, query, top_k):
+        """Return the indexes of the top_k best matching documents, best first."""
+        import heapq
+
+        document_count = len(self.term_counts)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.average_length or 1))
+                scores[index] = scores.get(index, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        return heapq.nlargest(top_k, scores, key=scores.get)
+
+class DocIndex:
+    """Chunked, searchable documentation for a CLI tool."""
+    def __init__(self, name, kind, chunks, index):
+        self.name = name
+        self.kind = kind
+        self.chunks = chunks
+        self.index = index
+        self.total_tokens = sum(estimate_tokens(chunk['text']) for chunk in chunks)
+        self.overview = [index for index, chunk in enumerate(chunks)
+                         if chunk['heading'].upper().rstrip(':') in DOC_OVERVIEW_HEADINGS] or [0]
+
+    @classmethod
+    def build(cls, name, kind, text):
+        chunks = split_doc_sections(text)
+        index = BM25Index.from_texts(f"{chunk['heading']} {chunk['text']}" for chunk in chunks)
+        return cls(name, kind, chunks, index)
+
+    def to_dict(self):
+        return {'name': self.name, 'kind': self.kind, 'chunks': self.chunks, 'term_counts': self.index.term_counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['kind'], data['chunks'], BM25Index(data['term_counts']))
+
+    def relevant_sections(self, question, top_k=DEFAULT_DOC_SECTIONS):
+        """Return the documentation text most relevant to question, in document order."""
+        if self.total_tokens <= DOC_FULL_TEXT_TOKENS:
+            selected = range(len(self.chunks))
+        else:
+            # Always include the overview (NAME/SYNOPSIS, or the opening usage line)
+            matches = [index for index in self.index.search(question, top_k + len(self.overview))
+                       if index not in self.overview]
+            selected = sorted(self.overview + matches[:top_k])
+        sections = []
+        for index in selected:
+            chunk = self.chunks[index]
+            sections.append(f"{chunk['heading']}\n{chunk['text']}" if chunk['heading'] else chunk['text'])
+        return "\n\n".join(sections)
+
+def load_software_docs(software_name, cache_dir):
+    """
+    Return a DocIndex for a CLI tool, or None if no documentation was found.
+
+    Parsed pages are cached on disk and reused until the man page (or the
+    executable, for --help output) changes. Tools that yielded no documentation
+    are cached too, so a tool that times out only costs the timeout once.
+    """
+    source = get_software_doc_source(software_name)
+    source_mtime = os.path.getmtime(source) if source and os.path.exists(source) else None
+    cache_path = Path(cache_dir) / 'docs' / f"{re.sub(r'[^A-Za-z0-9_.+-]', '_', software_name)}.json"
+
+    if source_mtime is not None and cache_path.exists():
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('source') == source and cached.get('mtime') == source_mtime:
+                logger.info("Loaded cached documentation index for %s", software_name)
+                return DocIndex.from_dict(cached['index']) if cached['index'] else None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable documentation cache %s: %s", cache_path, e)
+
+    kind, text = get_software_info(software_name)
+    doc_index = DocIndex.build(software_name, kind, text) if kind is not None else None
+
+    if source_mtime is not None:
+        try:
+            make_private_dir(cache_path.parent)
+            with open(cache_path, 'w', encoding='utf-8', opener=private_opener) as f:
+                json.dump({'source': source, 'mtime': source_mtime,
+                           'index': doc_index.to_dict() if doc_index else None}, f)
+        except OSError as e:
+            logger.warning("Could not cache documentation index: %s", e)
+    return doc_index
+
+def load_software_docs_concurrently(software_names, cache_dir):
+    """
+    Return the DocIndex of each tool that has documentation, in the order given.
+
+    The tools are loaded in parallel threads (the work happens in man and the
+    tools' own -h/--help processes), so startup takes as long as the slowest
+    tool rather than the sum of them, and each command is cut off after
+    DOC_FETCH_TIMEOUT seconds. Cached indexes are validated in parallel too.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not software_names:
+        return []
+    with ThreadPoolExecutor(max_workers=min(DOC_FETCH_WORKERS, len(software_names))) as executor:
+        doc_indexes = list(executor.map(lambda name: load_software_docs(name, cache_dir), software_names))
+    return [doc_index for doc_index in doc_indexes if doc_index]
+
+# Lines that start a new top-level symbol, by file extension
+CODE_SYMBOL_PATTERNS = {
+    '.py': r'^(?: {0,4}|\t?)(?:async\s+def|def|class)\s',
+    '.js': r'^(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\*?|class)\s|^(?:export\s+)?(?:const|let|var)\s+\w+\s*=',
+    '.go': r'^(?:func|type)\s',
+    '.rs': r'^\s{0,4}(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:fn|struct|enum|impl|trait|mod)\s',
+    '.rb': r'^\s{0,2}(?:def|class|module)\s',
+    '.sh': r'^(?:function\s+)?[\w-]+\s*\(\)',
+    '.c': r'^[A-Za-z_][\w \t\*&:<>,]*\([^;]*$',
+}
+for _extension in ('.jsx', '.ts', '.tsx', '.mjs', '.cjs'):
+    CODE_SYMBOL_PATTERNS[_extension] = CODE_SYMBOL_PATTERNS['.js']
+for _extension in ('.h', '.cc', '.cpp', '.hpp', '.java', '.cs', '.kt', '.swift', '.php'):
+    CODE_SYMBOL_PATTERNS[_extension] = CODE_SYMBOL_PATTERNS['.c']
+CODE_SYMBOL_PATTERNS['.bash'] = CODE_SYMBOL_PATTERNS['.sh']
+
+CODE_CHUNK_LINES = 120
+CODE_MAX_FILE_BYTES = 512 * 1024
+DEFAULT_CODE_TOKENS = 6000
+CODE_PROCESS_POOL_MIN_FILES = 200
+# Directories skipped when walking outside of a git checkout
+CODE_SKIP_DIRS = {'.git', '.hg', '.svn', 'node_modules', '__pycache__', '.venv', 'venv', 'env',
+                  '.tox', '.mypy_cache', '.pytest_cache', 'dist', 'build', 'target'}
+
+def split_code_symbols(path, lines):
+    """
+    Split source lines into symbol-level chunks.
+
+    Returns (start, end, symbol) tuples with 0-based, end-exclusive line ranges.
+    Languages without a known pattern are split at unindented lines that follow
+    a blank line. Chunks longer than CODE_CHUNK_LINES are split further.
+    """
+    pattern = CODE_SYMBOL_PATTERNS.get(os.path.splitext(path)[1].lower())
+    symbol_start = re.compile(pattern) if pattern else None
+
+    starts = [0]
+    for number, line in enumerate(lines):
+        if number == 0 or not line.strip():
+            continue
+        if symbol_start:
+            if not symbol_start.match(line):
+                continue
+            # Keep decorators and attributes with the definition they belong to
+            start = number
+            while start > 0 and lines[start - 1].lstrip().startswith(('@', '#[')):
+                start -= 1
+        else:
+            if line[0].isspace() or lines[number - 1].strip():
+                continue
+            start = number
+        if start > starts[-1]:
+            starts.append(start)
+
+    chunks = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else len(lines)
+        for piece_start in range(start, end, CODE_CHUNK_LINES):
+            piece_end = min(end, piece_start + CODE_CHUNK_LINES)
+            symbol = next((line.strip() for line in lines[piece_start:piece_end] if line.strip()), "")
+            if symbol:
+                chunks.append((piece_start, piece_end, symbol[:120]))
+    return chunks
+
+def index_code_file(path):
+    """Read and chunk one source file. Returns None for binary or oversized files."""
+    from collections import Counter
+
+    try:
+        stat = os.stat(path)
+        if stat.st_size > CODE_MAX_FILE_BYTES:
+            return None
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except OSError as e:
+        logger.warning("Skipping %s: %s", path, e)
+        return None
+    if b'\0' in raw[:1024]:
+        return None
+    lines = raw.decode('utf-8', errors='replace').splitlines()
+
+    path_terms = tokenize(path.replace(os.sep, ' ').replace('.', ' '))
+    chunks = []
+    for start, end, symbol in split_code_symbols(path, lines):
+        text = "\n".join(lines[start:end])
+        terms = Counter(tokenize(text))
+        terms.update(path_terms)
+        chunks.append({'start': start, 'end': end, 'symbol': symbol,
+                       'tokens': estimate_tokens(text), 'terms': dict(terms)})
+    return {'mtime': stat.st_mtime, 'size': stat.st_size, 'chunks': chunks}
+
+def glob_base_dir(spec):
+    """Return the directory a glob starts from: its leading parts without wildcards."""
+    parts = []
+    for part in Path(spec).parts:
+        if any(char in part for char in '*?['):
+            break
+        parts.append(part)
+    return str(Path(*parts)) if parts else '.'
+
+def list_git_ignored(paths, cwd):
+    """Return those of paths that git ignores; none when cwd isn't in a git checkout."""
+    if not paths or not os.path.isdir(cwd):
+        return set()
+    try:
+        result = subprocess.run(['git', 'check-ignore', '--stdin', '-z'], cwd=cwd, capture_output=True,
+                                input=b'\0'.join(os.fsencode(os.path.abspath(path)) for path in paths) + b'\0')
+    except FileNotFoundError:
+        return set()
+    # Exit status 1 means nothing is ignored, 128 that the paths aren't in a git checkout
+    if result.returncode != 0:
+        return set()
+    ignored = {os.fsdecode(name) for name in result.stdout.split(b'\0') if name}
+    return {path for path in paths if os.path.abspath(path) in ignored}
+
+def list_code_files(spec):
+    """Expand a file, directory, or glob into source files, respecting .gitignore."""
+    import glob
+
+    if any(char in spec for char in '*?['):
+        matches = [path for path in glob.glob(spec, recursive=True)
+                   if os.path.isfile(path) and not set(Path(path).parts) & CODE_SKIP_DIRS]
+        return sorted(set(matches) - list_git_ignored(matches, glob_base_dir(spec)))
+    if os.path.isfile(spec):
+        return [spec]
+    if not os.path.isdir(spec):
+        return []
+
+    # Inside a git checkout, git knows exactly which files are ignored
+    try:
+        result = subprocess.run(['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard'],
+                                cwd=spec, capture_output=True)
+        if result.returncode == 0:
+            files = (os.path.join(spec, name) for name in result.stdout.decode('utf-8', errors='replace').split('\0') if name)
+            return sorted(path for path in files if os.path.isfile(path))
+    except FileNotFoundError:
+        pass
+
+    files = []
+    for directory, subdirectories, filenames in os.walk(spec):
+        subdirectories[:] = [name for name in subdirectories if name not in CODE_SKIP_DIRS]
+        files.extend(os.path.join(directory, name) for name in filenames)
+    return sorted(files)
+
+class CodeIndex:
+    """Symbol-level chunks of a set of source files with BM25 search."""
+    def __init__(self, files):
+        self.files = files
+        self.chunks = [(path, chunk) for path, entry in sorted(files.items()) for chunk in entry['chunks']]
+        self.index = BM25Index([chunk['terms'] for _, chunk in self.chunks])
+        self.total_tokens = sum(chunk['tokens'] for _, chunk in self.chunks)
+
+    def render(self, selected):
+        """Return the text of the selected chunks, grouped by file in source order."""
+        parts = []
+        lines_by_path = {}
+        for index in sorted(selected, key=lambda index: (self.chunks[index][0], self.chunks[index][1]['start'])):
+            path, chunk = self.chunks[index]
+            if path not in lines_by_path:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    lines_by_path[path] = f.read().splitlines()
+            code = "\n".join(lines_by_path[path][chunk['start']:chunk['end']])
+            language = os.path.splitext(path)[1].lstrip('.')
+            parts.append(f"{path} (lines {chunk['start'] + 1}-{chunk['end']}):\n```{language}\n{code}\n```")
+        return "\n\n".join(parts)
+
+    def relevant_code(self, question, token_budget):
+        """Return the best matching chunks for question that fit within token_budget."""
+        selected = []
+        used = 0
+        for index in self.index.search(question, len(self.chunks)):
+            tokens = self.chunks[index][1]['tokens']
+            if used + tokens > token_budget:
+                continue
+            selected.append(index)
+            used += tokens
+        return self.render(selected)
+
+    def all_code(self):
+        return self.render(range(len(self.chunks)))
+
+def load_code_index(specs, cache_dir):
+    """
+    Build a CodeIndex for files, directories and globs.
+
+    The index is persisted per set of specs; on later runs only files whose
+    mtime or size changed are re-read, and those are processed in parallel.
+    """
+    import hashlib
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    paths = sorted({path for spec in specs for path in list_code_files(spec)})
+    key = hashlib.sha256("\0".join(sorted(os.path.abspath(spec) for spec in specs)).encode('utf-8')).hexdigest()[:16]
+    cache_path = Path(cache_dir) / 'code' / f"{key}.json"
+
+    cached = {}
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable code index %s: %s", cache_path, e)
+
+    files = {}
+    stale = []
+    for path in paths:
+        entry = cached.get(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            files[path] = entry
+        else:
+            stale.append(path)
+
+    if stale:
+        # Chunking is CPU-bound, so large re-indexes are spread over processes
+        if len(stale) >= CODE_PROCESS_POOL_MIN_FILES and (os.cpu_count() or 1) > 1:
+            executor = ProcessPoolExecutor()
+        else:
+            executor = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4))
+        with executor:
+            for path, entry in zip(stale, executor.map(index_code_file, stale, chunksize=16)):
+                if entry is not None:
+                    files[path] = entry
+    # Files that were skipped (binary, too large) are remembered as empty entries
+    for path in stale:
+        if path not in files and os.path.exists(path):
+            stat = os.stat(path)
+            files[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'chunks': []}
+
+    if stale or set(cached) != set(files):
+        try:
+            make_private_dir(cache_path.parent)
+            with open(cache_path, 'w', encoding='utf-8', opener=private_opener) as f:
+                json.dump(files, f)
+        except OSError as e:
+            logger.warning("Could not save code index: %s", e)
+    logger.info("Code index: %s files, %s re-indexed", len(files), len(stale))
+
+    return CodeIndex({path: entry for path, entry in files.items() if entry['chunks']})
+
+# Context window sizes in tokens, matched by model name prefix (longest prefix wins)
+MODEL_CONTEXT_TOKENS = {
+    'gpt-4o': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4-32k': 32768,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'llama3.1': 131072,
+    'llama3.2': 131072,
+    'llama3': 8192,
+    'mistral': 32768,
+    'qwen2.5': 32768,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+# Tokens kept free for the model's reply
+RESPONSE_TOKEN_RESERVE = 1024
+
+def estimate_tokens(text):
+    """Cheap token estimate (about four characters per token plus per-message overhead)."""
+    return (len(text) + 3) // 4 + 4
+
+def message_tokens(message):
+    """Token estimate of a message, including the attachments it references."""
+    return estimate_tokens(message['content']) + sum((attachment['size'] + 3) // 4
+                                                     for attachment in message.get('attachments', ()))
+
+def get_context_budget(model, context_tokens=None):
+    """Return the prompt token budget for a model, leaving room for the reply."""
+    if not context_tokens:
+        context_tokens = DEFAULT_CONTEXT_TOKENS
+        for prefix in sorted(MODEL_CONTEXT_TOKENS, key=len, reverse=True):
+            if model.startswith(prefix):
+                context_tokens = MODEL_CONTEXT_TOKENS[prefix]
+                break
+    return context_tokens - min(RESPONSE_TOKEN_RESERVE, context_tokens // 4)
+
+# Largest part of the context budget the summary of evicted turns may take
+SUMMARY_MAX_SHARE = 0.25
+
+class ContextWindow:
+    """
+    Conversation history kept within a token budget.
+
+    Token counts are computed once per message when it is added. Pinned messages
+    (the system prompt and the -s/-c context) are never evicted; other turns are
+    dropped oldest first. With a summarizer, evicted turns are folded into a
+    pinned summary message instead of being lost; the summary is held to
+    SUMMARY_MAX_SHARE of the budget so it can't crowd out the turns.
+    """
+    def __init__(self, budget, summarizer=None):
+        self.budget = budget
+        self.summarizer = summarizer
+        self.messages = []
+        self.token_counts = []
+        self.pinned = []
+        self.total = 0
+        self.summary = ""
+        self.summary_message = None
+
+    def append(self, message, pinned=False):
+        tokens = message_tokens(message)
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.pinned.append(pinned)
+        self.total += tokens
+
+    def pop(self, index=-1):
+        self.total -= self.token_counts.pop(index)
+        self.pinned.pop(index)
+        return self.messages.pop(index)
+
+    def _oldest_turn(self):
+        """Return the index range of the oldest evictable turn, never including the newest message."""
+        for start in range(len(self.messages) - 1):
+            if self.pinned[start]:
+                continue
+            end = start + 1
+            while end < len(self.messages) - 1 and not self.pinned[end] and self.messages[end]['role'] != 'user':
+                end += 1
+            return start, end
+        return None
+
+    def _evict(self):
+        evicted = []
+        while self.total > self.budget:
+            turn = self._oldest_turn()
+            if turn is None:
+                logger.warning("Pinned context alone (%s tokens) exceeds the budget of %s tokens", self.total, self.budget)
+                break
+            start, end = turn
+            for _ in range(start, end):
+                evicted.append(self.pop(start))
+        return evicted
+
+    def enforce_budget(self, model=None):
+        """
+        Evict the oldest turns until the history fits the budget. Returns the evicted messages.
+
+        model is the model the summarizer should use, i.e. the one currently in use.
+        """
+        evicted = self._evict()
+        if not self.summarizer:
+            return evicted
+        batch = evicted
+        while batch:
+            self._summarize(batch, model)
+            # A longer summary can push the history over the budget again
+            batch = self._evict()
+            evicted.extend(batch)
+        return evicted
+
+    def _summarize(self, evicted, model):
+        summary = self.summarizer(self.summary, evicted, model)
+        if not summary:
+            return
+        max_chars = int(self.budget * SUMMARY_MAX_SHARE) * 4
+        if len(summary) > max_chars:
+            # Keep the most recent part; the start covers the oldest turns
+            summary = "..." + summary[-max_chars:]
+        self.summary = summary
+        message = {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+        for index, existing in enumerate(self.messages):
+            if existing is self.summary_message:
+                self.pop(index)
+                break
+        self.summary_message = message
+        # Keep the summary right after the leading pinned messages
+        insert_at = 0
+        while insert_at < len(self.messages) and self.pinned[insert_at]:
+            insert_at += 1
+        tokens = message_tokens(message)
+        self.messages.insert(insert_at, message)
+        self.token_counts.insert(insert_at, tokens)
+        self.pinned.insert(insert_at, True)
+        self.total += tokens
+
+def summarize_messages(previous_summary, evicted, model, api_key, base_url, cancelled=None):
+    """
+    Ask the model to fold evicted turns into a running summary.
+
+    Returns previous_summary if the request fails or is cancelled.
+    """
+    transcript = "\n\n".join(f"{message['role']}: {message['content']}" for message in evicted)
+    if previous_summary:
+        transcript = f"Earlier summary:\n{previous_summary}\n\n{transcript}"
+    prompt = [
+        {"role": "system", "content": "Summarize the conversation below in a few sentences. "
+                                      "Keep facts, decisions and open questions. Reply with the summary only."},
+        {"role": "user", "content": transcript},
+    ]
+    try:
+        response = chat_request(prompt, model, api_key, base_url, cancelled=cancelled)
+        is_valid, error_message = validate_api_response(response)
+        if not is_valid:
+            logger.error("Summary request failed: %s", error_message)
+            return previous_summary
+        return response['choices'][0]['message']['content']
+    except Exception as e:
+        if not (cancelled and cancelled.is_set()):
+            logger.error("Summary request failed: %s", e)
+        return previous_summary
+
+def get_cache_dir():
+    """Return the directory for on-disk caches, honoring XDG_CACHE_HOME."""
+    return Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'openai-cl'
+
+# Conversations, prompts and cached answers are readable by the user only, whatever the umask
+def make_private_dir(path):
+    """Create a directory (and any missing parents) with mode 0700, or restrict an existing one."""
+    path = Path(path)
+    for directory in reversed([path, *path.parents]):
+        if not directory.exists():
+            directory.mkdir(mode=0o700, exist_ok=True)
+    try:
+        os.chmod(path, 0o700)
+    except OSError:
+        pass
+    return path
+
+def private_opener(path, flags):
+    """open() opener that creates files with mode 0600."""
+    return os.open(path, flags, 0o600)
+
+def create_private_file(path):
+    """Create an empty file with mode 0600 if there is none (e.g. for SQLite to open), or restrict an existing one."""
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    try:
+        os.chmod(path, 0o600)
+    except OSError:
+        pass
+
+DEFAULT_CACHE_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_CACHE_MAX_AGE = 7 * 24 * 3600
+
+def make_cache_key(endpoint, model, messages, params=None):
+    """Stable hash of everything that determines a response."""
+    import hashlib
+
+    request = {'endpoint': endpoint, 'model': model, 'messages': messages, 'params': params or {}}
+    canonical = json.dumps(request, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with size- and age-based LRU eviction.
+
+    Safe to share between threads.
+    """
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_MAX_BYTES, max_age=DEFAULT_CACHE_MAX_AGE):
+        import sqlite3
+
+        make_private_dir(cache_dir)
+        self.path = Path(cache_dir) / 'responses.sqlite'
+        create_private_file(self.path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created REAL NOT NULL, accessed REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT content, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self.db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, content):
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses (key, content, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, content, len(content.encode('utf-8')), now, now))
+            self._evict(now)
+            self.db.commit()
+
+    def _evict(self, now):
+        self.db.execute('DELETE FROM responses WHERE created < ?', (now - self.max_age,))
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the cache fits again
+        for key, size in self.db.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def describe(self):
+        stats = self.stats()
+        return (f"Response cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries ({stats['bytes'] / 1024 / 1024:.1f} MB) in {self.path}")
+
+# Semantic cache: answers reused for questions asked again in other words
+DEFAULT_SEMANTIC_THRESHOLD = 0.9
+DEFAULT_SEMANTIC_MAX_ENTRIES = 5000
+DEFAULT_EMBEDDING_MODEL = 'text-embedding-3-small'
+HASHING_EMBEDDING_DIM = 512
+# Word pairs count for less than single words, so rewordings still match
+HASHING_PAIR_WEIGHT = 0.5
+SEMANTIC_LOOKUP_SAMPLES = 1000
+# Words that flip the meaning of the word after them ("files that do not match")
+NEGATIONS = frozenset(['not', 'no', 'never', 'without', 'except', 'don', 'doesn', 'isn', 'cannot', 'dont'])
+
+class HashingEmbedder:
+    """
+    Local embedder: stemmed words and word pairs hashed into a fixed-size vector.
+
+    Uses the same tokenize() as the documentation index, so "listing the files"
+    and "list files" share their features, and marks the word after a negation
+    so that "match" and "not match" don't. It needs no vocabulary, so vectors
+    stay comparable however many prompts are added.
+    """
+    def __init__(self, dim=HASHING_EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, text):
+        import zlib
+
+        terms = tokenize(text)
+        terms = [f"!{term}" if previous in NEGATIONS else term for previous, term in zip([None] + terms, terms)]
+        features = collections.Counter(terms)
+        pairs = collections.Counter(f"{first} {second}" for first, second in zip(terms, terms[1:]))
+        vector = [0.0] * self.dim
+        for counts, weight in ((features, 1.0), (pairs, HASHING_PAIR_WEIGHT)):
+            for feature, count in counts.items():
+                digest = zlib.crc32(feature.encode('utf-8'))
+                # The top bit picks the sign, so colliding features tend to cancel out
+                sign = -1.0 if digest & 0x80000000 else 1.0
+                vector[digest % self.dim] += sign * weight * (1 + math.log(count))
+        return vector
+
+    def word_difference(self, text):
+        """
+        How much the similarity to text drops when one of its words is replaced.
+
+        That changes one word and two word pairs of the vector, so the drop
+        shrinks as prompts get longer: in a 20-word prompt, "including" versus
+        "excluding" or "7 days" versus "90 days" still scores about 0.95.
+        """
+        words = len(tokenize(text))
+        if words < 2:
+            return 1.0
+        pair = HASHING_PAIR_WEIGHT ** 2
+        return (1 + 2 * pair) / (words + pair * (words - 1))
+
+def get_embeddings_endpoint(base_url):
+    """Return the embeddings endpoint that goes with get_chat_endpoint(base_url)."""
+    if base_url == None:
+        return "https://api.openai.com/v1/embeddings"
+    return f"{base_url}/api/embeddings"
+
+class APIEmbedder:
+    """Embeddings from the endpoint's OpenAI-compatible embeddings API."""
+
+    def __init__(self, model, api_key, base_url):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.name = f"api-{model}"
+
+    def embed(self, text):
+        def send(url, metrics):
+            response = get_http_session().post(get_embeddings_endpoint(url),
+                                               headers={'Authorization': f'Bearer {self.api_key}'},
+                                               json={'model': self.model, 'input': text},
+                                               timeout=http_settings['timeout'])
+            record_rate_limits(metrics, response)
+            response.raise_for_status()
+            return response.json()
+
+        # Shares retries, rate limits and endpoint failover with the chat requests
+        # (failures are counted and logged by the semantic cache)
+        response = endpoint_request(send, self.base_url, [{'content': text}], quiet=True)
+        return response['data'][0]['embedding']
+
+    def word_difference(self, text):
+        # Model embeddings weigh what a changed word means, so the threshold applies as it is
+        return None
+
+def make_embedder(kind, model, api_key, base_url):
+    """Return the embedder named by the 'embedder' setting: 'hashing' (default) or 'api'."""
+    if kind == 'api':
+        return APIEmbedder(model or DEFAULT_EMBEDDING_MODEL, api_key, base_url)
+    return HashingEmbedder()
+
+class VectorIndex:
+    """
+    Fixed number of slots holding unit vectors, searched by cosine similarity.
+
+    With NumPy installed the vectors are rows of one float32 matrix and a
+    lookup is a single matrix-vector product. Without it each vector is a dict
+    of its non-zero values, which keeps lookups quick for the sparse vectors
+    of the hashing embedder.
+    """
+    def __init__(self, capacity):
+        import importlib.util
+
+        self.capacity = capacity
+        self.numpy = importlib.import_module('numpy') if importlib.util.find_spec('numpy') else None
+        self.dim = None
+        self.vectors = None
+
+    def normalize(self, vector):
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def set(self, slot, vector):
+        if self.dim is None:
+            self.dim = len(vector)
+            self.vectors = (self.numpy.zeros((self.capacity, self.dim), dtype=self.numpy.float32) if self.numpy
+                            else [None] * self.capacity)
+        if len(vector) != self.dim:
+            raise ValueError(f"Expected a vector of {self.dim} dimensions, got {len(vector)}")
+        if self.numpy:
+            vector = self.numpy.asarray(vector, dtype=self.numpy.float32)
+            self.vectors[slot] = vector / (float(self.numpy.linalg.norm(vector)) or 1.0)
+        else:
+            self.vectors[slot] = {i: value for i, value in enumerate(self.normalize(vector)) if value}
+
+    def best(self, vector, slots):
+        """Return (slot, similarity) of the vector closest to vector among slots, or (None, 0.0)."""
+        if not slots or self.dim is None or len(vector) != self.dim:
+            return None, 0.0
+        query = self.normalize(vector)
+        if self.numpy:
+            np = self.numpy
+            slots = np.fromiter(slots, dtype=np.intp, count=len(slots))
+            similarities = self.vectors[slots] @ np.asarray(query, dtype=np.float32)
+            best = int(similarities.argmax())
+            return int(slots[best]), float(similarities[best])
+        query = [(i, value) for i, value in enumerate(query) if value]
+        return max(((slot, sum(self.vectors[slot].get(i, 0.0) * value for i, value in query)) for slot in slots),
+                   key=lambda item: item[1])
+
+class SemanticCache:
+    """
+    Answers reused for prompts that mean the same as an earlier one.
+
+    Each answered prompt is embedded and kept, with its answer, in one of
+    max_entries slots of a SQLite table (the least recently used slot is
+    reused once they are all taken). A lookup embeds the new prompt and
+    returns the stored answer whose prompt is most similar, if the cosine
+    similarity reaches threshold. Prompts only match within the same scope, a
+    key for everything else that shapes the answer (model, the conversation
+    so far, documentation and code), so a reworded question never picks up
+    an answer given in a different context.
+    """
+    def __init__(self, cache_dir, embedder, threshold=DEFAULT_SEMANTIC_THRESHOLD,
+                 max_entries=DEFAULT_SEMANTIC_MAX_ENTRIES, max_age=DEFAULT_CACHE_MAX_AGE):
+        import sqlite3
+        from array import array
+
+        make_private_dir(cache_dir)
+        self.path = Path(cache_dir) / 'semantic.sqlite'
+        create_private_file(self.path)
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.lookup_times = collections.deque(maxlen=SEMANTIC_LOOKUP_SAMPLES)
+        self.lock = threading.Lock()
+        self.last_embedding = None
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'slot INTEGER PRIMARY KEY, embedder TEXT NOT NULL, scope TEXT NOT NULL, prompt TEXT NOT NULL, '
+            'answer TEXT NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)')
+        self.db.commit()
+
+        self.index = VectorIndex(max_entries)
+        # Entries beyond a lowered max_entries are dropped
+        self.db.execute('DELETE FROM entries WHERE slot >= ?', (max_entries,))
+        self.db.commit()
+        self.accessed = {}  # slot -> last use, for every stored entry
+        self.created = {}
+        self.slot_scopes = {}
+        self.scopes = collections.defaultdict(set)
+        rows = self.db.execute('SELECT slot, embedder, scope, vector, created, accessed FROM entries')
+        for slot, embedder_name, scope, blob, created, accessed in rows:
+            self.accessed[slot] = accessed
+            # Vectors from another embedder aren't comparable; their slots are reused first
+            if embedder_name != embedder.name or time.time() - created > max_age:
+                self.accessed[slot] = 0.0
+                continue
+            try:
+                self.index.set(slot, array('f', blob))
+            except ValueError:
+                self.accessed[slot] = 0.0
+                continue
+            self.created[slot] = created
+            self.slot_scopes[slot] = scope
+            self.scopes[scope].add(slot)
+
+    def _embed(self, text):
+        # The prompt looked up is usually the one added next, so keep its vector
+        if self.last_embedding and self.last_embedding[0] == text:
+            return self.last_embedding[1]
+        vector = self.embedder.embed(text)
+        self.last_embedding = (text, vector)
+        return vector
+
+    def lookup(self, scope, text):
+        """Return (answer, original prompt, similarity) for a similar enough earlier prompt, or None."""
+        start = time.perf_counter()
+        try:
+            vector = self._embed(text)
+        except Exception as e:
+            logger.warning("Could not embed the prompt for the semantic cache: %s", e)
+            self.errors += 1
+            self.misses += 1
+            return None
+        threshold = self.required_similarity(text)
+        with self.lock:
+            slot, similarity = self.index.best(vector, self.scopes.get(scope))
+            if slot is None or similarity < threshold or time.time() - self.created[slot] > self.max_age:
+                self.misses += 1
+                self.lookup_times.append(time.perf_counter() - start)
+                return None
+            self.accessed[slot] = time.time()
+            self.db.execute('UPDATE entries SET accessed = ? WHERE slot = ?', (self.accessed[slot], slot))
+            self.db.commit()
+            prompt, answer = self.db.execute('SELECT prompt, answer FROM entries WHERE slot = ?', (slot,)).fetchone()
+            self.hits += 1
+            self.lookup_times.append(time.perf_counter() - start)
+        return answer, prompt, similarity
+
+    def required_similarity(self, text):
+        """
+        The threshold, tightened for long prompts.
+
+        The threshold holds for short prompts. When the embedder reports how
+        little one replaced word changes the similarity, the allowed difference
+        shrinks with it: at the default threshold, to half of one word.
+        """
+        allowed = 1 - self.threshold
+        one_word = self.embedder.word_difference(text)
+        if one_word is not None:
+            allowed = min(allowed, allowed / (1 - DEFAULT_SEMANTIC_THRESHOLD) * one_word / 2)
+        return 1 - allowed
+
+    def add(self, scope, text, answer):
+        from array import array
+
+        try:
+            vector = self._embed(text)
+        except Exception as e:
+            logger.warning("Could not embed the prompt for the semantic cache: %s", e)
+            self.errors += 1
+            return
+        now = time.time()
+        with self.lock:
+            if len(self.accessed) < self.max_entries:
+                slot = next(slot for slot in range(self.max_entries) if slot not in self.accessed)
+            else:
+                slot = min(self.accessed, key=self.accessed.get)
+            try:
+                self.index.set(slot, vector)
+            except ValueError as e:
+                logger.warning("Not caching the answer semantically: %s", e)
+                return
+            if slot in self.slot_scopes:
+                self.scopes[self.slot_scopes[slot]].discard(slot)
+            self.slot_scopes[slot] = scope
+            self.scopes[scope].add(slot)
+            self.accessed[slot] = now
+            self.created[slot] = now
+            self.db.execute(
+                'INSERT OR REPLACE INTO entries (slot, embedder, scope, prompt, answer, vector, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (slot, self.embedder.name, scope, text, answer, array('f', vector).tobytes(), now, now))
+            self.db.commit()
+
+    def describe(self):
+        lookups = self.hits + self.misses
+        hit_rate = f"{self.hits / lookups:.0%}" if lookups else "n/a"
+        times = list(self.lookup_times)
+        errors = f", {self.errors} embedding errors" if self.errors else ""
+        return (f"Semantic cache: {self.hits} hits, {self.misses} misses ({hit_rate} hit rate){errors}, "
+                f"lookup p50 {percentile(times, 50) * 1000:.1f} ms, p95 {percentile(times, 95) * 1000:.1f} ms; "
+                f"{len(self.slot_scopes)} entries, {self.embedder.name} embedder, "
+                f"threshold {self.threshold:g}, {'NumPy' if self.index.numpy else 'pure Python'} index")
+
+def get_data_dir():
+    """Return the directory for session logs and prompt history, honoring XDG_DATA_HOME."""
+    return Path(os.environ.get('XDG_DATA_HOME') or Path.home() / '.local' / 'share') / 'openai-cl'
+
+class SessionLog:
+    """
+    Append-only JSONL log of one conversation, written as it happens.
+
+    Each event is one line: {"message": ..., "pinned": ...} for a message added
+    to the conversation, {"pop": true} when the last message was withdrawn and
+    {"model": ...} when the model changed. Lines are flushed immediately, so a
+    crash loses at most the turn in flight, and a turn costs one small write no
+    matter how long the conversation is. Sessions are listed from a small index
+    file (one line per session) without opening the logs themselves.
+    """
+    def __init__(self, sessions_dir, session_id=None, indexed=False):
+        self.sessions_dir = Path(sessions_dir)
+        self.id = session_id or time.strftime('%Y%m%d-%H%M%S-') + os.urandom(2).hex()
+        self.path = self.sessions_dir / f"{self.id}.jsonl"
+        self.indexed = indexed
+        self.model = None
+        self.file = None
+
+    def _write(self, record):
+        if self.file is None:
+            make_private_dir(self.sessions_dir)
+            self.file = open(self.path, 'a', encoding='utf-8', opener=private_opener)
+        record['time'] = round(time.time(), 3)
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def append(self, message, pinned=False):
+        self._write({'message': message, 'pinned': pinned})
+
+    def pop(self):
+        self._write({'pop': True})
+
+    def set_model(self, model):
+        if model != self.model:
+            self.model = model
+            self._write({'model': model})
+
+    def set_title(self, title):
+        """Add the session to the index the first time the user asks something."""
+        if self.indexed:
+            return
+        self.indexed = True
+        make_private_dir(self.sessions_dir)
+        entry = {'id': self.id, 'created': time.time(), 'model': self.model,
+                 'title': " ".join(title[:1000].split())[:80]}
+        with open(self.sessions_dir / 'index.jsonl', 'a', encoding='utf-8', opener=private_opener) as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    @classmethod
+    def resume(cls, sessions_dir, session_id):
+        """
+        Open an existing session for appending.
+
+        Returns the log and the (message, pinned) pairs it holds, or (None, None)
+        when there is no such session. 'last' resumes the most recent one.
+        """
+        if session_id == 'last':
+            sessions = list_sessions(sessions_dir)
+            if not sessions:
+                return None, None
+            session_id = sessions[0]['id']
+        log = cls(sessions_dir, session_id, indexed=True)
+        if not log.path.exists():
+            return None, None
+        messages, log.model, complete_bytes = read_session_log(log.path)
+        if complete_bytes < log.path.stat().st_size:
+            # Otherwise the next event would be appended to the partial line and lost with it
+            os.truncate(log.path, complete_bytes)
+        return log, messages
+
+def read_session_log(path):
+    """
+    Read a session log without changing it.
+
+    Returns the (message, pinned) pairs it holds, the model it last used and
+    the size of its complete lines (a crash can leave the last one cut short).
+    """
+    messages = []
+    model = None
+    complete_bytes = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            complete_bytes += len(line)
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if 'message' in record:
+                messages.append((record['message'], record.get('pinned', False)))
+            elif record.get('pop') and messages:
+                messages.pop()
+            elif 'model' in record:
+                model = record['model']
+    return messages, model, complete_bytes
+
+def list_sessions(sessions_dir):
+    """Return the indexed sessions, most recently active first."""
+    sessions = []
+    index_path = Path(sessions_dir) / 'index.jsonl'
+    if not index_path.exists():
+        return sessions
+    with open(index_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            try:
+                stat = (Path(sessions_dir) / f"{entry['id']}.jsonl").stat()
+            except OSError:
+                continue  # the log was deleted
+            entry['updated'] = stat.st_mtime
+            entry['size'] = stat.st_size
+            sessions.append(entry)
+    sessions.sort(key=lambda entry: entry['updated'], reverse=True)
+    return sessions
+
+DEFAULT_SEARCH_HITS = 10
+
+def make_search_query(terms, any_term=False):
+    """Turn free text into an FTS5 query: every word quoted, so punctuation can't become query syntax."""
+    words = re.findall(r'\w+', terms.lower())
+    return (' OR ' if any_term else ' ').join(f'"{word}"' for word in words)
+
+class HistoryIndex:
+    """
+    Full-text index (SQLite FTS5) of every question and answer, across sessions.
+
+    A row is added after each turn, so the index never has to be rebuilt; the
+    first time it is opened it also takes in the turns of the saved session
+    logs. Safe to share between threads.
+    """
+    def __init__(self, data_dir):
+        import sqlite3
+
+        make_private_dir(data_dir)
+        self.path = Path(data_dir) / 'history.sqlite'
+        create_private_file(self.path)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.created = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'turns'").fetchone() is None
+        # Raises sqlite3.OperationalError when SQLite was built without FTS5
+        self.db.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS turns USING fts5('
+            'prompt, response, model UNINDEXED, session UNINDEXED, time UNINDEXED, '
+            "tokenize = 'porter unicode61')")
+        self.db.commit()
+
+    def add(self, prompt, response, model=None, session=None, when=None):
+        with self.lock:
+            self.db.execute('INSERT INTO turns (prompt, response, model, session, time) VALUES (?, ?, ?, ?, ?)',
+                            (prompt, response, model, session, when or time.time()))
+            self.db.commit()
+
+    def import_sessions(self, sessions_dir):
+        """Index the question/answer pairs of every saved session log; returns the number of turns added."""
+        rows = []
+        for path in sorted(Path(sessions_dir).glob('*.jsonl')):
+            if path.name == 'index.jsonl':
+                continue
+            try:
+                # Read only: another openai-cl may still be writing to the log
+                messages, model, _ = read_session_log(path)
+                when = path.stat().st_mtime
+            except OSError:
+                continue
+            for (question, _), (answer, _) in zip(messages, messages[1:]):
+                if question['role'] != 'user' or answer['role'] != 'assistant':
+                    continue
+                # Questions sent with -s/-c context end with the question the user typed
+                prompt = question['content'].rpartition("User's question: ")[2]
+                if not prompt:
+                    # Pasted text is stored as an attachment without a name
+                    prompt = " ".join(attachment.get('name') or "pasted text"
+                                      for attachment in question.get('attachments', []))
+                rows.append((prompt, answer['content'], model, path.stem, when))
+        with self.lock:
+            self.db.executemany('INSERT INTO turns (prompt, response, model, session, time) VALUES (?, ?, ?, ?, ?)',
+                                rows)
+            self.db.commit()
+        return len(rows)
+
+    def search(self, terms, limit=DEFAULT_SEARCH_HITS, highlight=('', '')):
+        """
+        Return the best matching turns, best first, as dicts with snippets of
+        the prompt and response. Turns matching all the words come first; if
+        there are none, turns matching any of them are returned.
+        """
+        hits = []
+        for any_term in (False, True):
+            query = make_search_query(terms, any_term)
+            if not query:
+                break
+            with self.lock:
+                rows = self.db.execute(
+                    'SELECT snippet(turns, 0, ?, ?, \'...\', 16), snippet(turns, 1, ?, ?, \'...\', 32), '
+                    'model, session, time FROM turns WHERE turns MATCH ? '
+                    'ORDER BY bm25(turns, 2.0, 1.0) LIMIT ?',
+                    (*highlight, *highlight, query, limit)).fetchall()
+            hits = [{'prompt': prompt, 'response': response, 'model': model, 'session': session, 'time': when}
+                    for prompt, response, model, session, when in rows]
+            if hits:
+                break
+        return hits
+
+    def count(self):
+        # Turns are never deleted, so the last rowid is the count (COUNT(*) would scan the whole index)
+        with self.lock:
+            return self.db.execute('SELECT COALESCE(MAX(rowid), 0) FROM turns').fetchone()[0]
+
+_history_index = None
+# Whether finished turns are added to the history (off with "save_sessions": false)
+_record_history = True
+
+def configure_history(record=True):
+    global _record_history
+    _record_history = record
+
+def get_history_index():
+    """Return the shared HistoryIndex, creating it (and indexing saved sessions) on first use, or None without FTS5."""
+    global _history_index
+    if _history_index is None:
+        import sqlite3
+
+        data_dir = get_data_dir()
+        try:
+            _history_index = HistoryIndex(data_dir)
+            if _history_index.created:
+                _history_index.import_sessions(data_dir / 'sessions')
+        except sqlite3.Error as e:
+            logger.error("History search is unavailable: %s", e)
+            _history_index = False
+    return _history_index or None
+
+def record_turn(prompt, response, model, session_log=None):
+    """Add a finished turn to the searchable history."""
+    history = get_history_index() if _record_history else None
+    if history:
+        with profiler.span("history: index turn"):
+            history.add(prompt, response, model, session_log.id if session_log else None)
+
+def print_search_results(terms, limit=DEFAULT_SEARCH_HITS):
+    """Search the history and print the hits, best first."""
+    history = get_history_index()
+    if not history:
+        print("History search is unavailable: this Python's SQLite was built without FTS5.")
+        return
+    highlight = ('\033[1m', '\033[0m') if sys.stdout.isatty() else ('', '')
+    start = time.perf_counter()
+    hits = history.search(terms, limit, highlight)
+    elapsed = time.perf_counter() - start
+    if not hits:
+        print(f"No past questions or answers match '{terms}'.")
+        return
+    for number, hit in enumerate(hits, 1):
+        when = time.strftime('%Y-%m-%d %H:%M', time.localtime(hit['time']))
+        session = f"  session {hit['session']}" if hit['session'] else ""
+        print(f"{number:>2}. {when}  {hit['model'] or ''}{session}")
+        print(f"    Q: {' '.join(hit['prompt'].split())}")
+        print(f"    A: {' '.join(hit['response'].split())}")
+    print(f"\n{len(hits)} {'hit' if len(hits) == 1 else 'hits'} from {history.count():,} stored turns, "
+          f"found in {elapsed * 1000:.1f} ms.")
+
+# Attachments: large texts kept once on disk and referenced from messages
+ATTACHMENT_CHUNK_BYTES = 1024 * 1024
+ATTACHMENT_MAX_AGE = 90 * 24 * 3600
+# Pasted prompts longer than this are stored as attachments
+ATTACH_PASTE_CHARS = 64 * 1024
+
+class AttachmentStore:
+    """
+    Content-addressed store for large texts (attached files, pasted input, -c code).
+
+    Each blob is written once under its SHA-256, so a message only holds a
+    small reference ({'id', 'name', 'size'} in its 'attachments' list) and the
+    text is read from disk in chunks, with no file kept open, when a request
+    body is built. Blobs are shared by every session that uses them; ones
+    unused for ATTACHMENT_MAX_AGE are removed.
+    """
+
+    def __init__(self, directory):
+        self.directory = make_private_dir(directory)
+
+    def path(self, digest):
+        return self.directory / digest
+
+    def _touch(self, digest):
+        """Mark a blob as used now, so prune() keeps it; False if there is no such blob."""
+        try:
+            os.utime(self.path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _commit(self, tmp_path, digest):
+        if self._touch(digest):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, self.path(digest))
+
+    def put_file(self, path):
+        """Copy a file into the store in chunks, hashing it on the way; returns its reference."""
+        import hashlib
+        import tempfile
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with open(path, 'rb') as source, os.fdopen(fd, 'wb') as target:
+                while True:
+                    chunk = source.read(ATTACHMENT_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    target.write(chunk)
+                    size += len(chunk)
+            self._commit(tmp_path, digest.hexdigest())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return {'id': digest.hexdigest(), 'name': os.path.basename(path), 'size': size}
+
+    def put_text(self, text, name=None):
+        """Store text; returns its reference. name=None inserts the text without a heading."""
+        import hashlib
+        import tempfile
+
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if not self._touch(digest):
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self._commit(tmp_path, digest)
+        return {'id': digest, 'name': name, 'size': len(data)}
+
+    def iter_text(self, digest):
+        """Yield the blob's text in chunks, decoding UTF-8 across chunk boundaries."""
+        import codecs
+
+        try:
+            f = open(self.path(digest), 'rb')
+        except OSError as e:
+            logger.warning("Attachment %s is unavailable: %s", digest, e)
+            yield "[This attachment is no longer available.]"
+            return
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        with f:
+            os.utime(self.path(digest))
+            while True:
+                chunk = f.read(ATTACHMENT_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield decoder.decode(chunk)
+        yield decoder.decode(b'', final=True)
+
+    def content_pieces(self, message):
+        """Yield a message's content with its attachments expanded in front of it, in chunks."""
+        for number, attachment in enumerate(message['attachments']):
+            if number:
+                yield "\n\n"
+            if attachment.get('name'):
+                yield f"Attached file {attachment['name']}:\n\n"
+            yield from self.iter_text(attachment['id'])
+        if message['content']:
+            yield "\n\n" + message['content']
+
+    def encode_message(self, message):
+        """Encode a message as JSON, with the 'attachments' references expanded into its content."""
+        # Built up in one buffer a chunk at a time, so the only full copy is the body itself
+        encoded = bytearray(b'{')
+        for key, value in message.items():
+            if key == 'attachments':
+                continue
+            if len(encoded) > 1:
+                encoded += b', '
+            encoded += json.dumps(key).encode('utf-8') + b': '
+            if key != 'content':
+                encoded += json.dumps(value).encode('utf-8')
+                continue
+            encoded += b'"'
+            for piece in self.content_pieces(message):
+                # json.dumps(piece)[1:-1] is the inside of a JSON string
+                encoded += json.dumps(piece)[1:-1].encode('utf-8')
+            encoded += b'"'
+        encoded += b'}'
+        return encoded
+
+    def prune(self, max_age=ATTACHMENT_MAX_AGE):
+        """Remove blobs not used for max_age seconds."""
+        cutoff = time.time() - max_age
+        for path in self.directory.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+_attachment_store = None
+
+def get_attachment_store():
+    """Return the attachment store in the data directory, creating it on first use."""
+    global _attachment_store
+    if _attachment_store is None:
+        _attachment_store = AttachmentStore(get_data_dir() / 'attachments')
+        threading.Thread(target=_attachment_store.prune, daemon=True).start()
+    return _attachment_store
+
+def is_text_file(path):
+    """Guess whether a file is text from its first few KB."""
+    with open(path, 'rb') as f:
+        return b'\0' not in f.read(8192)
+
+# Function to load configuration
+def load_config():
+    config_path = Path.home() / '.openai-cl-config.json'
+    if config_path.exists():
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+            logger.info("Loaded configuration: %s", config)
+            return config
+    logger.info("No saved configuration found.")  
+    return {}
+
+# Function to save configuration
+def save_config(config, verbose=True):
+    config_path = Path.home() / '.openai-cl-config.json'
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+        if verbose:
+            print(f"Saved configuration: {config}")
+
+# Add this function near the top of the file
+def validate_api_response(response):
+    """Validates the API response format and returns appropriate error messages."""
+    if not isinstance(response, dict):
+        return False, f"Invalid response type: {type(response)}"
+    if 'choices' not in response:
+        return False, f"Missing 'choices' in response: {response}"
+    if not response['choices']:
+        return False, "Empty choices array in response"
+    if 'message' not in response['choices'][0]:
+        return False, f"Missing 'message' in first choice: {response['choices'][0]}"
+    if 'content' not in response['choices'][0]['message']:
+        return False, f"Missing 'content' in message: {response['choices'][0]['message']}"
+    return True, None
+
+_console = None
+
+def get_console():
+    """Return the shared rich Console used for all rendering."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+
+        _console = Console()
+    return _console
+
+class MarkdownBlockSplitter:
+    """
+    Splits streamed markdown into finished blocks.
+
+    A block is finished at a blank line outside of a code fence, or at the
+    closing fence of a code block. Only the unfinished tail needs re-rendering.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.block_start = 0
+        self.scan_pos = 0
+        self.in_fence = False
+
+    def feed(self, text):
+        """Add text and return the list of blocks finished by it."""
+        self.buffer += text
+        finished = []
+        while True:
+            line_end = self.buffer.find('\n', self.scan_pos)
+            if line_end == -1:
+                break
+            line = self.buffer[self.scan_pos:line_end].strip()
+            self.scan_pos = line_end + 1
+            if line.startswith('```') or line.startswith('~~~'):
+                self.in_fence = not self.in_fence
+                if not self.in_fence:
+                    finished.append(self.buffer[self.block_start:self.scan_pos])
+                    self.block_start = self.scan_pos
+            elif not line and not self.in_fence:
+                block = self.buffer[self.block_start:self.scan_pos]
+                if block.strip():
+                    finished.append(block)
+                self.block_start = self.scan_pos
+        return finished
+
+    @property
+    def tail(self):
+        return self.buffer[self.block_start:]
+
+def display_streaming_response(chunks, metrics=None, splitter=None, pause=None):
+    """
+    Renders a streamed AI response as markdown while it arrives.
+
+    Finished blocks are printed once; a Live region re-renders only the last
+    unfinished block. Returns the full response text. When pause() returns
+    True, rendering stops early and None is returned; the unfinished block is
+    left in splitter for whoever prints the rest of the answer.
+    """
+    from rich.live import Live
+    from rich.markdown import Markdown
+
+    console = get_console()
+    splitter = splitter or MarkdownBlockSplitter()
+    render_seconds = 0.0
+    with Live(Markdown(""), console=console, refresh_per_second=12, vertical_overflow="visible") as live:
+        for chunk in chunks:
+            if pause and pause():
+                live.update(Markdown(""))
+                return None
+            if not chunk:
+                continue
+            render_start = time.perf_counter()
+            with profiler.span("render: streamed markdown"):
+                for block in splitter.feed(chunk):
+                    live.console.print(Markdown(block))
+                    live.console.print()
+                live.update(Markdown(splitter.tail))
+            render_seconds += time.perf_counter() - render_start
+    if metrics is not None:
+        metrics['render'] = render_seconds
+    return splitter.buffer
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of values using nearest-rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+# (field, label, unit) for each per-request metric, in display order
+METRIC_FIELDS = [
+    ('connect', 'DNS+TCP connect', 's'),
+    ('tls', 'TLS handshake', 's'),
+    ('ttfb', 'Time to first byte', 's'),
+    ('first_token', 'Time to first token', 's'),
+    ('latency', 'Total latency', 's'),
+    ('render', 'Render time', 's'),
+    ('tokens_per_second', 'Throughput', 'tokens/s'),
+    ('prompt_tokens', 'Prompt tokens', ''),
+    ('completion_tokens', 'Completion tokens', ''),
+    ('request_bytes', 'Request size', 'bytes'),
+    ('response_bytes', 'Response size', 'bytes'),
+]
+
+def finish_request_metrics(metrics, content):
+    """Turn the usage reported by the server into token counts and a tokens/s figure."""
+    usage = metrics.pop('usage', None) or {}
+    metrics['prompt_tokens'] = usage.get('prompt_tokens')
+    metrics['completion_tokens'] = usage.get('completion_tokens')
+    if content and metrics.get('latency'):
+        # Fall back to an estimate when the server doesn't report usage
+        tokens = metrics['completion_tokens'] or estimate_tokens(content)
+        metrics['tokens_per_second'] = tokens / metrics['latency']
+    return metrics
+
+def format_metric(value, unit):
+    """Format a metric value for the stats table."""
+    if unit == 's':
+        return f"{value * 1000:.0f}ms"
+    if unit == 'tokens/s':
+        return f"{value:.1f}/s"
+    return f"{value:,.0f}"
+
+class SessionMetrics:
+    """
+    Per-request timings for the session, optionally exported to a file.
+
+    A metrics_file ending in .prom is rewritten as a Prometheus textfile after
+    each request; any other path gets one JSON line appended per request.
+    """
+
+    def __init__(self, metrics_file=None):
+        self.metrics_file = metrics_file
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def record(self, model, mode, metrics, error=None):
+        """Store the metrics of one request; mode is stream, chat, cached, semantic, compare, batch or pipe."""
+        entry = {'timestamp': time.time(), 'model': model, 'mode': mode}
+        entry.update({field: metrics.get(field) for field, _, _ in METRIC_FIELDS if metrics.get(field) is not None})
+        if error:
+            entry['error'] = str(error)
+        with self.lock:
+            self.requests.append(entry)
+            if self.metrics_file:
+                try:
+                    self._export(entry)
+                except OSError as e:
+                    logger.error("Could not write metrics to %s: %s", self.metrics_file, e)
+        return entry
+
+    def _export(self, entry):
+        if not self.metrics_file.endswith('.prom'):
+            with open(self.metrics_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+            return
+        lines = ['# HELP openai_cl_requests_total Requests sent this session.',
+                 '# TYPE openai_cl_requests_total counter']
+        for mode in sorted({r['mode'] for r in self.requests}):
+            count = sum(1 for r in self.requests if r['mode'] == mode)
+            lines.append(f'openai_cl_requests_total{{mode="{mode}"}} {count}')
+        lines += ['# HELP openai_cl_request_errors_total Requests that failed this session.',
+                  '# TYPE openai_cl_request_errors_total counter',
+                  f'openai_cl_request_errors_total {sum(1 for r in self.requests if "error" in r)}']
+        for field, label, unit in METRIC_FIELDS:
+            values = [r[field] for r in self.requests if field in r]
+            if not values:
+                continue
+            name = f'openai_cl_{field}' + ('_seconds' if unit == 's' else '')
+            lines += [f'# HELP {name} {label}.', f'# TYPE {name} summary']
+            lines += [f'{name}{{quantile="{q / 100}"}} {percentile(values, q)}' for q in (50, 95)]
+            lines += [f'{name}_sum {sum(values)}', f'{name}_count {len(values)}']
+        # Write then rename so a collector never reads a half-written file
+        tmp_path = self.metrics_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.metrics_file)
+
+    def describe(self):
+        """Return a p50/p95/max table of every metric recorded so far."""
+        with self.lock:
+            requests = list(self.requests)
+        if not requests:
+            return "No requests yet."
+        errors = sum(1 for r in requests if 'error' in r)
+        cached = sum(1 for r in requests if r['mode'] in ('cached', 'semantic'))
+        lines = [f"{len(requests)} requests ({cached} cached, {errors} failed)",
+                 f"{'':<20}{'p50':>12}{'p95':>12}{'max':>12}"]
+        for field, label, unit in METRIC_FIELDS:
+            values = [r[field] for r in requests if field in r]
+            if values:
+                lines.append(f"{label:<20}" + "".join(f"{format_metric(v, unit):>12}" for v in
+                             (percentile(values, 50), percentile(values, 95), max(values))))
+        return "\n".join(lines)
+
+def read_batch_requests(input_path):
+    """Yield (request_id, entry) pairs from a JSONL file, or stdin when input_path is '-'."""
+    batch_file = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8')
+    try:
+        for line_number, line in enumerate(batch_file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error("Skipping invalid JSON on line %s: %s", line_number, e)
+                continue
+            yield str(entry.get('id', line_number)), entry
+    finally:
+        if batch_file is not sys.stdin:
+            batch_file.close()
+
+def load_completed_batch_ids(output_path):
+    """Return the ids that already have a successful result in the output file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # e.g. a line cut short by an interrupted run
+            if not result.get('error'):
+                completed.add(str(result.get('id')))
+    return completed
+
+def run_batch_request(request_id, entry, model, api_key, base_url, response_cache=None, session_metrics=None):
+    """Send one batch entry and return its result record."""
+    if 'messages' in entry:
+        batch_messages = entry['messages']
+    else:
+        batch_messages = []
+        if entry.get('system'):
+            batch_messages.append({"role": "system", "content": entry['system']})
+        batch_messages.append({"role": "user", "content": entry.get('prompt', '')})
+    entry_model = entry.get('model', model)
+
+    result = {'id': request_id, 'model': entry_model}
+    metrics = {}
+    start = time.perf_counter()
+    try:
+        cache_key = None
+        if response_cache:
+            cache_key = make_cache_key(get_chat_endpoint(base_url), entry_model, batch_messages)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                result['response'] = cached
+                result['cached'] = True
+                result['latency'] = round(time.perf_counter() - start, 4)
+                if session_metrics:
+                    session_metrics.record(entry_model, 'cached', {'latency': result['latency']})
+                return result
+
+        response = chat_request(batch_messages, entry_model, api_key, base_url, metrics)
+        is_valid, error_message = validate_api_response(response)
+        if is_valid:
+            result['response'] = response['choices'][0]['message']['content']
+            if 'usage' in response:
+                result['usage'] = response['usage']
+            if cache_key:
+                response_cache.put(cache_key, result['response'])
+        else:
+            result['error'] = error_message
+    except Exception as e:
+        result['error'] = str(e)
+    result['latency'] = round(time.perf_counter() - start, 4)
+    if session_metrics:
+        session_metrics.record(entry_model, 'batch', finish_request_metrics(metrics, result.get('response')),
+                               result.get('error'))
+    return result
+
+def run_batch(input_path, output_path, model, api_key, base_url, concurrency, response_cache=None,
+              session_metrics=None):
+    """
+    Send every request in a JSONL file through a bounded thread pool.
+
+    Each input line is {"id": ..., "prompt": ...} or {"id": ..., "messages": [...]},
+    optionally with "model" and "system". Results are appended to output_path in
+    completion order; ids that already succeeded there are skipped so an
+    interrupted run can be resumed. Returns the process exit code.
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+    completed_ids = load_completed_batch_ids(output_path)
+    latencies = []
+    failed = 0
+    skipped = 0
+    start = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as output_file, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+
+        def write_results(done):
+            nonlocal failed
+            for future in done:
+                result = future.result()
+                output_file.write(json.dumps(result) + '\n')
+                output_file.flush()
+                if result.get('error'):
+                    failed += 1
+                    logger.error("Request %s failed: %s", result['id'], result['error'])
+                else:
+                    latencies.append(result['latency'])
+
+        for request_id, entry in read_batch_requests(input_path):
+            if request_id in completed_ids:
+                skipped += 1
+                continue
+            # Keep the number of queued requests bounded so huge inputs stream through
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write_results(done)
+            pending.add(executor.submit(run_batch_request, request_id, entry, model, api_key, base_url,
+                                        response_cache, session_metrics))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write_results(done)
+
+    elapsed = time.perf_counter() - start
+    total = len(latencies) + failed
+    print(f"Batch complete: {len(latencies)} succeeded, {failed} failed, {skipped} skipped "
+          f"in {elapsed:.1f}s", file=sys.stderr)
+    if total:
+        print(f"Throughput: {total / elapsed:.2f} requests/s, "
+              f"latency p50 {percentile(latencies, 50):.3f}s, p95 {percentile(latencies, 95):.3f}s",
+              file=sys.stderr)
+    if request_limiter.retries or request_limiter.waited:
+        print(request_limiter.describe(), file=sys.stderr)
+    if response_cache:
+        print(response_cache.describe(), file=sys.stderr)
+    return 1 if failed else 0
+
+def request_model_response(messages, model, api_key, base_url, session_metrics=None, cancelled=None):
+    """Send messages to one model and return a result record with timing."""
+    result = {'model': model}
+    metrics = {}
+    start = time.perf_counter()
+    try:
+        response = chat_request(messages, model, api_key, base_url, metrics, cancelled)
+        is_valid, error_message = validate_api_response(response)
+        if is_valid:
+            result['content'] = response['choices'][0]['message']['content']
+        else:
+            result['error'] = error_message
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        _active_connections.pop(threading.get_ident(), None)
+        _aborted_requests.discard(threading.get_ident())
+    result['latency'] = time.perf_counter() - start
+    finish_request_metrics(metrics, result.get('content'))
+    if 'content' in result:
+        result['completion_tokens'] = metrics['completion_tokens']
+        result['tokens_per_second'] = metrics.get('tokens_per_second', 0.0)
+    if session_metrics and not (cancelled and cancelled.is_set()):
+        session_metrics.record(model, 'compare', metrics, result.get('error'))
+    return result
+
+def compare_models(messages, models, api_key, base_url, on_result=None, session_metrics=None):
+    """
+    Send the same conversation to several models at once.
+
+    on_result is called with each result as soon as it arrives; the results are
+    returned in arrival order. Wall time is that of the slowest model. On
+    KeyboardInterrupt the requests still in flight are aborted, not waited for.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    cancelled = threading.Event()
+    thread_ids = []
+
+    def run(model):
+        thread_ids.append(threading.get_ident())
+        return request_model_response(messages, model, api_key, base_url, session_metrics, cancelled)
+
+    results = []
+    executor = ThreadPoolExecutor(max_workers=len(models), thread_name_prefix='compare')
+    try:
+        futures = [executor.submit(run, model) for model in models]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(len(results), result)
+    except KeyboardInterrupt:
+        cancelled.set()
+        for thread_id in thread_ids:
+            abort_request(thread_id)
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+# One-shot (-p) mode: exit codes and how piped input is cut to size
+EXIT_API_ERROR = 1
+EXIT_USAGE = 2
+EXIT_AUTH = 3
+EXIT_RATE_LIMITED = 4
+EXIT_UNAVAILABLE = 5
+EXIT_INTERRUPTED = 130
+
+STDIN_CHUNK_BYTES = 64 * 1024
+# Share of the stdin budget taken from the start of the input; the rest is its end
+STDIN_HEAD_SHARE = 0.25
+
+def read_bounded_stdin(max_bytes, stream=None):
+    """
+    Read piped input in chunks, keeping at most max_bytes of it.
+
+    When the input is longer, its start and end are kept (cut at line breaks)
+    with a marker where the middle was dropped, so memory use stays bounded
+    however much is piped in. Returns the text and the number of bytes dropped.
+    """
+    stream = stream or sys.stdin.buffer
+    head_limit = int(max_bytes * STDIN_HEAD_SHARE)
+    tail_limit = max_bytes - head_limit
+    head = bytearray()
+    tail = collections.deque()
+    tail_size = 0
+    total = 0
+    while True:
+        chunk = stream.read(STDIN_CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if len(head) < head_limit:
+            take = head_limit - len(head)
+            head += chunk[:take]
+            chunk = chunk[take:]
+        if chunk:
+            tail.append(chunk)
+            tail_size += len(chunk)
+            while tail and tail_size - len(tail[0]) >= tail_limit:
+                tail_size -= len(tail.popleft())
+    tail_bytes = b''.join(tail)
+    if total <= max_bytes:
+        return (bytes(head) + tail_bytes).decode('utf-8', errors='replace'), 0
+
+    head = bytes(head)
+    tail_bytes = tail_bytes[len(tail_bytes) - tail_limit:] if tail_limit else b''
+    # Don't leave half a line on either side of the cut
+    if b'\n' in head:
+        head = head[:head.rindex(b'\n') + 1]
+    if b'\n' in tail_bytes:
+        tail_bytes = tail_bytes[tail_bytes.index(b'\n') + 1:]
+    omitted = total - len(head) - len(tail_bytes)
+    text = (head.decode('utf-8', errors='replace') + f"\n[... {omitted:,} bytes omitted ...]\n\n"
+            + tail_bytes.decode('utf-8', errors='replace'))
+    return text, omitted
+
+def stdin_is_piped():
+    """Whether stdin is a pipe, file or socket, rather than a terminal or a device with nothing to read."""
+    import stat
+
+    try:
+        mode = os.fstat(sys.stdin.fileno()).st_mode
+    except (AttributeError, OSError, ValueError):
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISREG(mode) or stat.S_ISSOCK(mode)
+
+def get_exit_code(error):
+    """Map a failed request to the one-shot mode exit code."""
+    import requests
+
+    status = get_error_status(error)
+    if status in (401, 403):
+        return EXIT_AUTH
+    if status == 429:
+        return EXIT_RATE_LIMITED
+    if (status is not None and status >= 500) or \
+            isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return EXIT_UNAVAILABLE
+    return EXIT_API_ERROR
+
+def run_one_shot(question, model, api_key, base_url, system_prompt, stdin_tokens=None, response_cache=None,
+                 session_metrics=None, semantic_cache=None):
+    """
+    Answer one question without the interactive UI, streaming the raw answer to stdout.
+
+    Input piped to stdin is sent along as context, cut to stdin_tokens (by
+    default whatever the model's context window leaves free). Errors go to
+    stderr. Returns the process exit code.
+    """
+    if not question.strip():
+        print("openai-cl: -p needs a question", file=sys.stderr)
+        return EXIT_USAGE
+    content = question
+    text = ""
+    if stdin_is_piped():
+        if stdin_tokens is None:
+            stdin_tokens = get_context_budget(model) - estimate_tokens(system_prompt) - estimate_tokens(question)
+        # About four bytes per token, as in estimate_tokens
+        text, omitted = read_bounded_stdin(max(256, stdin_tokens) * 4)
+        if omitted:
+            print(f"openai-cl: input cut to about {stdin_tokens:,} tokens ({omitted:,} bytes omitted from the middle)",
+                  file=sys.stderr)
+        if text.strip():
+            content = f"Input:\n\n{text}\n\n{question}"
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": content}]
+
+    metrics = {}
+    parts = []
+    cached = None
+    semantic_hit = None
+    error = None
+    try:
+        cache_key = make_cache_key(get_chat_endpoint(base_url), model, messages) if response_cache else None
+        cached = response_cache.get(cache_key) if cache_key else None
+        semantic_scope = None
+        if semantic_cache and cached is None:
+            lookup_start = time.perf_counter()
+            semantic_scope = make_cache_key(get_chat_endpoint(base_url), model, messages[:1], {'input': text})
+            semantic_hit = semantic_cache.lookup(semantic_scope, question)
+            if semantic_hit:
+                cached, similar_prompt, similarity = semantic_hit
+                metrics['latency'] = time.perf_counter() - lookup_start
+                print(f"openai-cl: cached answer to a similar question ({similarity:.0%} match): {similar_prompt}",
+                      file=sys.stderr)
+        # Errors are printed below, so the limiter doesn't log them a second time
+        chunks = ([cached] if cached is not None
+                  else chat_stream(messages, model, api_key, base_url, metrics, quiet=True))
+        with profiler.span("turn: answer"):
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+                parts.append(chunk)
+        if parts and not parts[-1].endswith('\n'):
+            sys.stdout.write('\n')
+        sys.stdout.flush()
+        if cached is None and parts:
+            if cache_key:
+                response_cache.put(cache_key, "".join(parts))
+            if semantic_scope:
+                semantic_cache.add(semantic_scope, question, "".join(parts))
+            record_turn(question, "".join(parts), model)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`); stop quietly without a second error at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except Exception as e:
+        error = e
+        print(f"openai-cl: {e}", file=sys.stderr)
+    finally:
+        if session_metrics:
+            mode = 'semantic' if semantic_hit else 'cached' if cached is not None else 'pipe'
+            session_metrics.record(model, mode, finish_request_metrics(metrics, "".join(parts)), error)
+    return get_exit_code(error) if error else 0
+
+class ResponseJob:
+    """
+    A chat request running on a background executor.
+
+    The answer arrives through next_chunk(), as it streams in or all at once.
+    cancel() aborts the HTTP exchange by shutting down its socket, so even a
+    request stuck waiting on the server stops immediately. splitter and shown
+    track how much of the answer has been displayed.
+    """
+    def __init__(self, executor, messages, model, api_key, base_url, stream):
+        self.stream = stream
+        self.chunks = queue.Queue()
+        self.parts = []
+        self.metrics = {}
+        self.error = None
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.thread_id = None
+        self.splitter = MarkdownBlockSplitter()
+        self.shown = False
+        # The history keeps changing on the main thread, so send a snapshot
+        executor.submit(self._run, list(messages), model, api_key, base_url)
+
+    def _run(self, messages, model, api_key, base_url):
+        self.thread_id = threading.get_ident()
+        try:
+            if self.cancelled.is_set():
+                return
+            if self.stream:
+                for chunk in chat_stream(messages, model, api_key, base_url, self.metrics, self.cancelled):
+                    if self.cancelled.is_set():
+                        break
+                    self.chunks.put(chunk)
+            else:
+                response = chat_request(messages, model, api_key, base_url, self.metrics, self.cancelled)
+                with profiler.span("validate_api_response"):
+                    is_valid, error_message = validate_api_response(response)
+                if not is_valid:
+                    raise ValueError(error_message)
+                self.chunks.put(response['choices'][0]['message']['content'])
+        except Exception as e:
+            if not self.cancelled.is_set():
+                logger.error("Error details: %s", e)
+                self.error = e
+        finally:
+            _active_connections.pop(self.thread_id, None)
+            _aborted_requests.discard(self.thread_id)
+            self.done.set()
+            self.chunks.put(None)
+
+    def next_chunk(self, timeout):
+        """Return the next piece of the answer, '' if none arrived within timeout, or None at the end."""
+        try:
+            chunk = self.chunks.get(timeout=timeout)
+        except queue.Empty:
+            return ''
+        if chunk is None:
+            self.chunks.put(None)  # keep reporting the end to later readers
+        else:
+            self.parts.append(chunk)
+        return chunk
+
+    def iter_chunks(self, timeout=0.05):
+        """Yield the rest of the answer, with '' whenever nothing arrived for timeout seconds."""
+        while True:
+            chunk = self.next_chunk(timeout)
+            if chunk is None:
+                return
+            yield chunk
+
+    @property
+    def content(self):
+        return "".join(self.parts)
+
+    def cancel(self):
+        self.cancelled.set()
+        if not self.done.is_set() and self.thread_id is not None:
+            abort_request(self.thread_id)
+
+class KeyWatcher:
+    """
+    Notices keys typed while an answer is rendering, without consuming them.
+
+    The terminal is switched to cbreak mode so typed keys are neither echoed
+    over the answer nor held back until Enter, while Ctrl+C still raises
+    KeyboardInterrupt. The keys stay queued for the next prompt to read.
+    """
+    def __enter__(self):
+        self.saved = None
+        self.tty = sys.stdin.isatty()
+        if self.tty and os.name != 'nt':
+            import termios
+            import tty
+
+            self.saved = termios.tcgetattr(sys.stdin.fileno())
+            tty.setcbreak(sys.stdin.fileno())
+        return self
+
+    def pressed(self):
+        if not self.tty:
+            return False
+        if os.name == 'nt':
+            import msvcrt
+
+            return msvcrt.kbhit()
+        import select
+
+        return bool(select.select([sys.stdin.fileno()], [], [], 0)[0])
+
+    def __exit__(self, *exc_info):
+        if self.saved is not None:
+            import termios
+
+            # TCSADRAIN keeps the typed keys for the prompt
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, self.saved)
+
+# Responses longer than this are rendered block by block so output starts immediately
+PROGRESSIVE_RENDER_CHARS = 16 * 1024
+
+def display_response(response_content: str, use_pager=False):
+    """Displays the AI response with markdown rendering."""
+    from rich.markdown import Markdown
+
+    console = get_console()
+
+    # Very long answers go through the pager instead of flooding the scrollback
+    if use_pager and console.is_terminal and response_content.count('\n') > console.height * 2:
+        os.environ.setdefault('LESS', '-R')
+        with console.pager(styles=True):
+            console.print(Markdown(response_content))
+        return
+
+    if len(response_content) <= PROGRESSIVE_RENDER_CHARS:
+        console.print(Markdown(response_content), end="")
+        return
+
+    splitter = MarkdownBlockSplitter()
+    blocks = splitter.feed(response_content + "\n\n")
+    if splitter.tail.strip():
+        blocks.append(splitter.tail)  # e.g. an unterminated code fence
+    for index, block in enumerate(blocks):
+        if index:
+            console.print()
+        console.print(Markdown(block), end="")
+
+# Upper bound on the spans kept for a --profile-output trace; totals keep counting past it
+PROFILE_MAX_EVENTS = 200000
+
+class ProfileSpan:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, self.start, time.perf_counter())
+
+_NO_SPAN = contextlib.nullcontext()
+
+class PhaseProfiler:
+    """
+    Wall time per phase of startup and of each turn, for --profile and --startup-bench.
+
+    Code is instrumented with `with profiler.span('render: markdown'):`. While
+    profiling is off, span() returns a shared do-nothing context manager, so an
+    instrumented phase costs one method call. Startup phases are recorded with
+    mark() either way, since profiling can only be switched on once the
+    arguments have been parsed. With an output file, spans are also kept for a
+    Chrome trace (.json, for chrome://tracing or Perfetto), or the main thread
+    is run under cProfile and its pstats written (any other name).
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.last_mark = start
+        self.enabled = False
+        self.output = None
+        self.cprofile = None
+        self.totals = {}
+        self.counts = {}
+        self.events = []
+        self.thread_names = {}
+        self.lock = threading.Lock()
+
+    def enable(self, output=None):
+        self.enabled = True
+        self.output = output
+        if output and not output.endswith('.json'):
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NO_SPAN
+        return ProfileSpan(self, name)
+
+    def add(self, name, start, end):
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0.0) + (end - start)
+            self.counts[name] = self.counts.get(name, 0) + 1
+            if self.output and len(self.events) < PROFILE_MAX_EVENTS:
+                thread_id = threading.get_ident()
+                if thread_id not in self.thread_names:
+                    self.thread_names[thread_id] = threading.current_thread().name
+                self.events.append((name, start, end - start, thread_id))
+
+    def mark(self, name):
+        """Record the time since the previous mark as the startup phase name."""
+        now = time.perf_counter()
+        self.add(f"startup: {name}", self.last_mark, now)
+        self.last_mark = now
+
+    def time_import(self, module_name):
+        """Import a module the interactive session would load and record how long it took."""
+        __import__(module_name)
+        self.mark(f"import {module_name}")
+
+    def watch_redraws(self, app):
+        """Time every screen redraw of a prompt_toolkit application."""
+        started = []
+
+        def before_render(_):
+            started.append(time.perf_counter())
+
+        def after_render(_):
+            if started:
+                self.add("prompt_toolkit: redraw", started.pop(), time.perf_counter())
+
+        app.before_render += before_render
+        app.after_render += after_render
+
+    def report_startup(self):
+        print("Startup phases:")
+        for name, seconds in self.totals.items():
+            if name.startswith("startup: "):
+                print(f"  {name[len('startup: '):]:<32} {seconds * 1000:8.1f} ms")
+        print(f"  {'total':<32} {(self.last_mark - self.start) * 1000:8.1f} ms")
+
+    def report(self, file=None):
+        """Print the time spent in each phase, largest first."""
+        file = file or sys.stderr
+        wall = time.perf_counter() - self.start
+        with self.lock:
+            phases = sorted(self.totals.items(), key=lambda item: item[1], reverse=True)
+            counts = dict(self.counts)
+        print(f"\nProfile ({wall:.3f}s wall time):", file=file)
+        print(f"  {'Phase':<40}{'calls':>8}{'total':>12}{'mean':>12}{'% wall':>8}", file=file)
+        for name, seconds in phases:
+            print(f"  {name:<40}{counts[name]:>8}{seconds * 1000:>10.1f}ms{seconds / counts[name] * 1000:>10.2f}ms"
+                  f"{seconds / wall * 100:>8.1f}", file=file)
+        print("  Phases nest (request phases run inside the answer's), so the percentages overlap.", file=file)
+
+    def write_trace(self, path):
+        pid = os.getpid()
+        with self.lock:
+            events = [{'name': name, 'cat': name.split(':')[0], 'ph': 'X', 'pid': pid, 'tid': thread_id,
+                       'ts': round((start - self.start) * 1e6, 1), 'dur': round(duration * 1e6, 1)}
+                      for name, start, duration, thread_id in self.events]
+            events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': name}}
+                       for thread_id, name in self.thread_names.items()]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def finish(self):
+        """Print the report and write the output file; registered with atexit by --profile."""
+        if self.cprofile:
+            self.cprofile.disable()
+        self.report()
+        if not self.output:
+            return
+        try:
+            if self.cprofile:
+                self.cprofile.dump_stats(self.output)
+            else:
+                self.write_trace(self.output)
+            print(f"  Profile written to {self.output}", file=sys.stderr)
+        except OSError as e:
+            print(f"  Could not write the profile to {self.output}: {e}", file=sys.stderr)
+
+profiler = PhaseProfiler(_startup_t0)
+
+# Modules loaded lazily by the interactive session, in the order they are first needed
+INTERACTIVE_MODULES = ['requests', 'prompt_toolkit', 'halo', 'rich.markdown']
+
+# Define argument parser
+# Help is handled in a custom way
+def build_parser():
+    parser = argparse.ArgumentParser(description='Interactively chat with LLMs.', add_help=False)
+    parser.add_argument('--api_key', type=str, help='Your OpenAI API key. Can be set as environment variable.')
+    parser.add_argument('-m', '--model', type=str, help='The model to be used for the conversation.')
+    parser.add_argument('-l', '--l-models', action='store_true', help='List available models.')
+    parser.add_argument('-s', '--software', type=str, help='Learn about a software using its man page; separate several tools with commas (e.g. jq,awk,xargs).')
+    parser.add_argument('-h', '--help', action='store_true', help='Display this help message and exit.')
+    parser.add_argument('-p', '--prompt', type=str, metavar='QUESTION',
+                        help='Answer one question (with piped stdin as context) on stdout and exit.')
+    parser.add_argument('--stdin-tokens', type=int, help='Token budget for the stdin sent with -p')
+    parser.add_argument('-c', '--code-helper', type=str, nargs='+', metavar='PATH',
+                        help='Provide files, directories or globs for code assistance.')
+    parser.add_argument('--base_url', type=str, help='Base URL for custom OpenAI API endpoint (comma-separated to route across several)')
+    parser.add_argument('--hedge', action='store_true', help='Duplicate slow requests to a second endpoint')
+    parser.add_argument('--save_config', action='store_true', help='Save the current configuration')
+    parser.add_argument('--clear_config', action='store_true', help='Clear the saved configuration')
+    parser.add_argument('--compare', type=str, metavar='MODELS',
+                        help='Comma-separated models to send every prompt to in parallel')
+    parser.add_argument('--stream', action='store_true', default=None, help='Stream responses as they are generated')
+    parser.add_argument('--no-stream', dest='stream', action='store_false', help='Wait for the full response before displaying it')
+    parser.add_argument('--pager', action='store_true', default=None, help='Show very long responses in a pager')
+    parser.add_argument('--no-pager', dest='pager', action='store_false', help='Always print responses directly')
+    parser.add_argument('--pool-size', type=int, help='Number of pooled keep-alive connections per host')
+    parser.add_argument('--connect-timeout', type=float, help='Seconds to wait for a connection to the API')
+    parser.add_argument('--read-timeout', type=float, help='Seconds to wait for data from the API')
+    parser.add_argument('--max-retries', type=int, help='Times to retry a request that was rate limited or failed transiently')
+    parser.add_argument('--rpm', type=int, help='Client-side limit on requests per minute')
+    parser.add_argument('--tpm', type=int, help='Client-side limit on tokens per minute')
+    parser.add_argument('--compress', choices=['gzip', 'zstd', 'none'], help='Compress request bodies (the endpoint must accept it)')
+    parser.add_argument('--context-tokens', type=int, help="Size of the model's context window in tokens")
+    parser.add_argument('--summarize-evicted', action='store_true', help='Summarize turns dropped from the context window')
+    parser.add_argument('--code-tokens', type=int, help='Token budget for the code sent with each -c question')
+    parser.add_argument('--doc-sections', type=int, help='Number of documentation sections sent with each -s question')
+    parser.add_argument('--cache', action='store_true', default=None, help='Cache responses on disk and reuse them for identical requests')
+    parser.add_argument('--no-cache', dest='cache', action='store_false', help='Do not use the response cache')
+    parser.add_argument('--cache-dir', type=str, help='Directory for on-disk caches')
+    parser.add_argument('--semantic-cache', action='store_true', default=None,
+                        help='Reuse cached answers for prompts worded differently from an earlier one')
+    parser.add_argument('--no-semantic-cache', dest='semantic_cache', action='store_false',
+                        help='Do not use the semantic cache')
+    parser.add_argument('--similarity', type=float, help='Similarity (0-1) a prompt needs to reuse a semantic cache answer')
+    parser.add_argument('--embedder', choices=['hashing', 'api'],
+                        help="How the semantic cache embeds prompts: locally ('hashing') or with the endpoint's embeddings API")
+    parser.add_argument('--batch', type=str, metavar='FILE', help="Send the requests in a JSONL file ('-' for stdin) non-interactively")
+    parser.add_argument('--batch-output', type=str, metavar='FILE', help='JSONL file that batch results are appended to')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of batch requests in flight at once')
+    parser.add_argument('--metrics-file', type=str, metavar='FILE', help='Record per-request timings to a JSONL or Prometheus .prom file')
+    parser.add_argument('--resume', type=str, metavar='ID', help="Continue a saved session ('last' for the most recent)")
+    parser.add_argument('--list-sessions', action='store_true', help='List saved sessions and exit')
+    parser.add_argument('--no-save', dest='save_sessions', action='store_false', default=None,
+                        help="Don't save the conversation, the prompts typed or the turns for search")
+    parser.add_argument('--search', type=str, metavar='TERMS', help='Search past questions and answers and exit')
+    parser.add_argument('--profile', action='store_true', help='Print the time spent in each phase at exit')
+    parser.add_argument('--profile-output', type=str, metavar='FILE',
+                        help='Also write a Chrome trace (.json) or cProfile stats (other names) to FILE')
+    parser.add_argument('--startup-bench', action='store_true', help='Report startup time per phase and exit')
+    return parser
+
+def get_api_key(args):
+    if args.api_key:
+        logger.info("Using API key from command-line argument")
+        return args.api_key
+
+    if os.getenv("OPENWEBUI_KEY"):
+        logger.info("Using API key from OPENWEBUI_KEY environment variable")
+        return os.getenv("OPENWEBUI_KEY")
+    
+    if os.getenv("OPENAI_API_TOKEN"):
+        logger.info("Using API key from OPENAI_API_TOKEN environment variable")
+        return os.getenv("OPENAI_API_TOKEN")
+    
+    logger.error("No API key found")
+    return None
+
+def get_system_prompt(args):
+    if args.prompt is not None:
+        return (
+            "You are a helpful assistant answering a single request from the command line. "
+            "Your answer is written straight to a terminal or another program, "
+            "so reply with the answer only, in plain text, without markdown unless asked."
+        )
+    if args.software:
+        return (
+            "Expert CLI assistant focused on delivering single-command solutions. "
+            "Always prioritize using provided documentation. "
+            "Respond with exactly one command unless complexity requires alternatives. "
+            "Format commands as inline code. "
+            "Prioritize brevity - no examples or extra text unless absolutely needed."
+        )
+    return (
         "You are a helpful assistant communicating with a user. "
         "Be concise in your responses. Your output will be rendered in markdown, "
         "so feel free to use markdown formatting for clarity and structure."
     )
 
-# Initialize messages list with the system prompt
-messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-
-if args.help:
-    display_help()
-    sys.exit(0)
+def make_model_completer(catalog):
+    """Return a prompt_toolkit completer that completes model names after '/model '."""
+    from prompt_toolkit.completion import Completer, Completion
 
-# Initialize software_info as an empty string
-software_info = ""
-
-if args.software:
-    if os.name == 'nt':
-        print("Sorry, the man page functionality is not available on Windows.")
-        sys.exit(1)
-    software_info = get_software_info(args.software)
-    if software_info:
-        # Temp - instead of system prompt, I want to try adding it to the first message. 
-        print(f"\nNote: GPT has been provided with the man page for {args.software}. You can now ask questions about it.\n")
-    else:
-        print("Unable to provide information about the specified software. Continuing without software context.")
+    class ModelCompleter(Completer):
+        def get_completions(self, document, complete_event):
+            text = document.text_before_cursor
+            if not text.startswith('/model '):
+                return
+            prefix = text[len('/model '):]
+            for name in catalog.models:
+                if name.startswith(prefix):
+                    yield Completion(name, start_position=-len(prefix))
 
+    return ModelCompleter()
 
-if args.code_helper:
-    get_file_content(args.code_helper)
+def run_interactive(args, config, context, model, api_key, base_url, doc_indexes, code_index, response_cache=None,
+                    catalog=None, comparison_models=None, session_metrics=None, session_log=None, semantic_cache=None):
+    """Run the interactive chat loop until the user exits."""
+    with profiler.span("startup: UI imports"):
+        from concurrent.futures import ThreadPoolExecutor
+        from halo import Halo
+        from prompt_toolkit import PromptSession, print_formatted_text
+        from prompt_toolkit.formatted_text import FormattedText
+        from prompt_toolkit.history import FileHistory, InMemoryHistory
+        from prompt_toolkit.key_binding import KeyBindings
+        from prompt_toolkit.patch_stdout import patch_stdout
+        from prompt_toolkit.styles import Style
+        from rich.markdown import Markdown
 
-if not args.software and not args.code_helper:
-    display_intro()
+    stream = config.get('stream', False)
+    use_pager = config.get('pager', False)
+    doc_sections = config.get('doc_sections', DEFAULT_DOC_SECTIONS)
+    code_tokens = config.get('code_tokens', min(DEFAULT_CODE_TOKENS, context.budget // 2))
+    if session_metrics is None:
+        session_metrics = SessionMetrics()
 
-if args.clear_config:
-    save_config({})
-    print("Configuration cleared.")
-    sys.exit(0)
+    # Create a flag to indicate submission
+    submit_flag = False
 
-if args.model:
-    config['model'] = args.model
-if args.base_url:
-    config['base_url'] = args.base_url
+    # Define a custom style for the prompt
+    style = Style.from_dict({
+        'prompt': 'bold',
+        'input': 'green',
+        'you-prompt': 'bg:orange fg:white bold',
+        ## 'you-prompt': 'bg:white fg:orange bold',
+        # Currently the ai-prompt is defined inline using the FormattedText PromptSession near the bottom
+    })
 
-# Save config if requested
-if args.save_config:
-    save_config(config)
-    print("Configuration saved.")
+    # Create custom keybindings
+    kb = KeyBindings()
 
-# Use config values
-model = args.model or config.get('model', "llama3.1:8b")  # Modified this line
+    # Create a prompt session; prompts are kept across sessions for Up-arrow and Ctrl+R
+    if config.get('save_sessions', True):
+        history_path = make_private_dir(get_data_dir()) / 'prompt_history'
+        create_private_file(history_path)
+        prompt_history = FileHistory(str(history_path))
+    else:
+        # Nothing typed is written to disk
+        prompt_history = InMemoryHistory()
+    session = PromptSession(history=prompt_history,
+                            completer=make_model_completer(catalog) if catalog else None)
 
-if 'model' in config: 
-    model = config['model']
-if args.model:
-    config['model'] = args.model
+    def remember(message, pinned=False):
+        """Add a message to the conversation and to the session log."""
+        context.append(message, pinned)
+        if session_log:
+            with profiler.span("session log: append"):
+                session_log.append(message, pinned)
 
-base_url = config.get('base_url')
+    def withdraw_question():
+        """Drop the unanswered question, so the history stays as if it was never asked."""
+        nonlocal first_message_sent
+        context.pop()
+        if session_log:
+            session_log.pop()
+        first_message_sent = any(message['role'] == 'user' for message in context.messages)
 
-if 'base_url' in config:
-    API_ENDPOINT = config['base_url']
+    # Add keyboard shortcuts
+    @kb.add('c-space')
+    def _(event):
+        nonlocal submit_flag
+        submit_flag = True
+        event.app.exit(result=event.app.current_buffer.text)
 
-# Check if API key is provided or not
-if api_key is None:
-    print("No OpenAI API Key provided. Please provide your API key.")
-    exit()
 
-if args.l_models:
-    # List available models
-    list_available_models(api_key, base_url)
-    sys.exit(0)
+    @kb.add('c-q')
+    def _(event):
+        nonlocal exit_flag
+        exit_flag = True
+        event.app.exit()
 
-# Get model from command line arguments or use default
-# model = args.model
+    # Prevent the script from existing
+    exit_flag = False
 
-# Create a flag to indicate submission
-submit_flag = False
+    # Initialize last_response
+    last_response = ""
 
-# Define a custom style for the prompt
-style = Style.from_dict({
-    'prompt': 'bold',
-    'input': 'green',
-    'you-prompt': 'bg:orange fg:white bold',
-    ## 'you-prompt': 'bg:white fg:orange bold',
-    # Currently the ai-prompt is defined inline using the FormattedText PromptSession near the bottom
-})
+    # Intialize first_message_sent to only send the code helper file on first message
+    # (a resumed session already carries it)
+    first_message_sent = any(message['role'] == 'user' for message in context.messages)
 
-# Create custom keybindings
-kb = KeyBindings()
+    # Open the connection to the API while the user types the first prompt
+    warm_up_connection(get_chat_endpoint(base_url))
 
-# Create a prompt session
-session = PromptSession()
+    # Requests run in the background so Ctrl+C can cancel them and the next prompt can be typed meanwhile
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='request')
+    background_session = PromptSession(history=session.history, erase_when_done=True)
 
-# Add keyboard shortcuts
-@kb.add('c-space')
-def _(event):
-    global submit_flag
-    submit_flag = True
-    event.app.exit(result=event.app.current_buffer.text)
+    summarize = context.summarizer
+    summary_skipped = False
 
+    def summarize_in_background(previous, evicted, summary_model):
+        """
+        Run the summarizer on the request executor behind a spinner. Ctrl+C
+        aborts it; the turns are then evicted without a summary.
+        """
+        nonlocal summary_skipped
+        if summary_skipped:
+            return previous
+        cancelled = threading.Event()
+        thread_ids = []
 
-@kb.add('c-q')
-def _(event):
-    global exit_flag
-    exit_flag = True
-    event.app.exit()
+        def run():
+            thread_ids.append(threading.get_ident())
+            try:
+                return summarize(previous, evicted, summary_model, cancelled)
+            finally:
+                _active_connections.pop(threading.get_ident(), None)
+                _aborted_requests.discard(threading.get_ident())
 
-# Prevent the script from existing
-exit_flag = False
+        future = executor.submit(run)
+        spinner = Halo(text='Summarizing the oldest turns... (Ctrl+C drops them without a summary)', spinner='dots')
+        spinner.start()
+        try:
+            return future.result()
+        except KeyboardInterrupt:
+            cancelled.set()
+            for thread_id in thread_ids:
+                abort_request(thread_id)
+            summary_skipped = True
+            return previous
+        finally:
+            spinner.stop()
 
-# Initialize last_response
-last_response = ""
+    if summarize:
+        context.summarizer = summarize_in_background
+    if profiler.enabled:
+        profiler.watch_redraws(session.app)
+        profiler.watch_redraws(background_session.app)
 
-# Intialize first_message_sent to only send software on first message
-first_message_sent = False
+    # Prompts submitted while an answer was still arriving, sent in order
+    pending_inputs = collections.deque()
+    # Files attached with `attach`, sent with the next message
+    pending_attachments = []
 
-while True:
-    user_input = session.prompt(
-        [('class:you-prompt', f'{"You:":>11}'), ('class:input', '\n')],
+    prompt_message = [('class:you-prompt', f'{"You:":>11}'), ('class:input', '\n')]
+    prompt_options = dict(
         multiline=True,
         key_bindings=kb,
         style=style,
@@ -521,105 +3944,641 @@ while True:
         enable_history_search=True,
         prompt_continuation=lambda width, line_number, is_soft_wrap: '')
 
-    # Check for exit_flag
-    if exit_flag:
-        print("Ending the conversation. Goodbye!")
-        break
+    def show_header(job, ai_prompt):
+        if not job.shown:
+            job.shown = True
+            print()
+            print_formatted_text(FormattedText([('bg:red fg:white bold', ai_prompt)]), style=style)
 
-    if not user_input:  # If the input is empty or None, just continue
-        continue
+    def show_answer(job, ai_prompt):
+        """
+        Render the answer as it arrives. Returns False as soon as the user starts
+        typing, leaving the rest of the answer to prompt_while_generating().
+        """
+        spinner = Halo(text='Processing... (Ctrl+C cancels)', spinner='dots')
+        spinner.start()
+        try:
+            with KeyWatcher() as keys:
+                chunk = job.next_chunk(0.05)
+                while chunk == '':
+                    if keys.pressed():
+                        return False
+                    chunk = job.next_chunk(0.05)
+                spinner.stop()
+                show_header(job, ai_prompt)
+                if chunk is None:
+                    return True
+                if job.stream:
+                    # Keep the spinner until the first chunk arrives, then render as it streams
+                    chunks = itertools.chain([chunk], job.iter_chunks())
+                    return display_streaming_response(chunks, job.metrics, job.splitter, keys.pressed) is not None
+                render_start = time.perf_counter()
+                with profiler.span("render: markdown"):
+                    display_response(chunk, use_pager)
+                job.metrics['render'] = time.perf_counter() - render_start
+                return True
+        finally:
+            spinner.stop()
 
-    if user_input.strip().lower() in ["markdown", "md"]:
-        print(last_response) 
-    
-    if user_input.strip().lower() in ["raw"]:
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print(last_response) 
-        print('')
-        print('-------------------------')
-        print('')
-        continue 
-
-    if user_input.strip().lower() == "clear":
-        os.system('cls' if os.name == 'nt' else 'clear')
-        continue
-
-    if user_input.strip().lower() == "help":
-        display_help()
-        continue
+    def prompt_while_generating(job, ai_prompt):
+        """
+        Show the prompt while the answer is still arriving, printing the rest of
+        it above the prompt. Returns the prompts submitted in the meantime.
+        """
+        nonlocal submit_flag
+        console = get_console()
+        show_header(job, ai_prompt)
 
-    # Check if the user wants to exit the conversation
-    if user_input.lower() in ["exit", "q"]:
-        print("Ending the conversation. Goodbye!")
-        break
+        def print_rest():
+            # Whole markdown blocks only: a Live region can't share the screen with the prompt
+            for chunk in job.iter_chunks():
+                if job.cancelled.is_set():
+                    return
+                blocks = job.splitter.feed(chunk) if job.stream else [chunk]
+                for block in blocks:
+                    console.print(Markdown(block))
+                    console.print()
+            if job.stream and job.splitter.tail.strip() and not job.cancelled.is_set():
+                console.print(Markdown(job.splitter.tail))
+            app = background_session.app
 
-    # Check the submit flag
-    if submit_flag:
-        submit_flag = False  # reset the flag
+            def close_idle_prompt():
+                # Hand back to the normal prompt, unless the user is in the middle of one
+                if app.is_running and not app.current_buffer.text:
+                    app.exit()
+
+            if app.loop:
+                app.loop.call_soon_threadsafe(close_idle_prompt)
+
+        queued = []
+        with patch_stdout(raw=True):
+            printer = threading.Thread(target=print_rest, daemon=True)
+            printer.start()
+            while not job.done.is_set() or printer.is_alive():
+                try:
+                    text = background_session.prompt(
+                        prompt_message, refresh_interval=0.5,
+                        bottom_toolbar=lambda: (' Answer complete.' if job.done.is_set() else
+                                                ' Answering... Ctrl+Space queues this prompt, Ctrl+C cancels the answer.'),
+                        **prompt_options)
+                except KeyboardInterrupt:
+                    if not job.done.is_set():
+                        job.cancel()
+                        break
+                    continue
+                if exit_flag:
+                    break
+                if text:
+                    background_session.history.append_string(text)
+                    queued.append(text)
+                    print(f"Queued: {text}")
+                submit_flag = False
+            if not job.cancelled.is_set():
+                printer.join()
+        return queued
+
+    while True:
+        if pending_inputs:
+            user_input = pending_inputs.popleft()
+            submit_flag = True
+            print_formatted_text(FormattedText([('class:you-prompt', f'{"You:":>11}')]), style=style)
+            print(user_input)
+        else:
+            try:
+                with profiler.span("prompt: waiting for input"):
+                    user_input = session.prompt(
+                        prompt_message,
+                        rprompt=f'context: {context.total}/{context.budget} tokens',
+                        **prompt_options)
+            except KeyboardInterrupt:
+                continue  # Ctrl+C at an idle prompt just clears it
+            if user_input:
+                # Ctrl+Space submits without accepting the buffer, so record the prompt ourselves
+                session.history.append_string(user_input)
+
+        # Check for exit_flag
+        if exit_flag:
+            print("Ending the conversation. Goodbye!")
+            break
+
+        if not user_input:  # If the input is empty or None, just continue
+            continue
+
+        if user_input.strip().lower() in ["markdown", "md"]:
+            print(last_response) 
         
-        if not first_message_sent:
+        if user_input.strip().lower() in ["raw"]:
+            clear_screen()
+            print(last_response) 
+            print('')
+            print('-------------------------')
+            print('')
+            continue 
+
+        if user_input.strip().lower() == "clear":
+            clear_screen()
+            continue
+
+        if user_input.strip().lower() == "help":
+            display_help()
+            continue
+
+        if user_input.strip().startswith('/model'):
+            requested = user_input.strip()[len('/model'):].strip()
+            if not requested:
+                print(f"Current model: {model}")
+                if catalog and catalog.models:
+                    print("Available models: " + ", ".join(catalog.models))
+            elif catalog and catalog.models and requested not in catalog.models:
+                print(f"Unknown model '{requested}'. Press Tab after '/model ' to see the available models.")
+            else:
+                model = requested
+                if session_log:
+                    session_log.set_model(model)
+                context.budget = get_context_budget(model, config.get('context_tokens'))
+                print(f"Switched to {model}. The conversation continues with the new model.")
+            continue
+
+        if user_input.strip().startswith('/compare'):
+            requested = user_input.strip()[len('/compare'):].strip()
+            if requested.lower() == 'off':
+                comparison_models = None
+                print(f"Comparison mode off. Continuing with {model}.")
+            elif requested:
+                comparison_models = [name.strip() for name in requested.split(',') if name.strip()]
+                print(f"Comparing {', '.join(comparison_models)}. Each prompt goes to all of them.")
+            else:
+                print(f"Comparing: {', '.join(comparison_models)}" if comparison_models else "Comparison mode is off.")
+            continue
+
+        if user_input.strip().lower() == "stats":
+            print(session_metrics.describe())
+            print(request_limiter.describe())
+            if endpoint_router:
+                print("\n" + endpoint_router.describe())
+            continue
+
+        if user_input.strip().split(' ', 1)[0].lower() == "attach":
+            path = os.path.expanduser(user_input.strip()[len('attach'):].strip().strip('"\''))
+            if not path:
+                names = ", ".join(attachment['name'] for attachment in pending_attachments)
+                print(f"Attached to your next message: {names}" if names else "Usage: attach <path>")
+            elif not os.path.isfile(path):
+                print(f"No such file: {path}")
+            elif not is_text_file(path):
+                print(f"{path} looks like a binary file; only text files can be attached.")
+            else:
+                attachment = get_attachment_store().put_file(path)
+                pending_attachments.append(attachment)
+                tokens = (attachment['size'] + 3) // 4
+                print(f"Attached {attachment['name']} ({attachment['size'] / 1024:,.0f} KB, about {tokens:,} tokens). "
+                      f"It will be sent with your next message.")
+                if tokens > context.budget:
+                    print(f"Warning: that is more than the {context.budget:,} tokens the model's context window holds.")
+            continue
+
+        if user_input.strip().lower() == "cache":
+            print(response_cache.describe() if response_cache else "Response cache is disabled (enable it with --cache).")
+            if semantic_cache:
+                print(semantic_cache.describe())
+            continue
+
+        if user_input.strip().split(' ', 1)[0].lower() == "search":
+            terms = user_input.strip()[len('search'):].strip()
+            if terms:
+                print_search_results(terms)
+            else:
+                print("Usage: search <terms>")
+            continue
+
+        # Check if the user wants to exit the conversation
+        if user_input.lower() in ["exit", "q"]:
+            print("Ending the conversation. Goodbye!")
+            break
+
+        # Check the submit flag
+        if submit_flag:
+            submit_flag = False  # reset the flag
+            if session_log:
+                session_log.set_title(user_input)
+            
             combined_message = ""
-            if software_info:
-                combined_message += f"Documentation for the specified CLI tool:\n\n{software_info}\n\n"
-            if args.code_helper:
-                combined_message += f"Code from the specified file:\n\n{messages[-1]['content']}\n\n"
-            combined_message += f"User's question: {user_input}"
-            messages.append({"role": "user", "content": combined_message})
+            attachments, pending_attachments = pending_attachments, []
+            if doc_indexes:
+                # Only the documentation sections relevant to this question are sent, split across the tools
+                sections_per_tool = max(1, -(-doc_sections // len(doc_indexes)))
+                for doc_index in doc_indexes:
+                    combined_message += (f"Relevant documentation for {doc_index.name}:\n\n"
+                                         f"{doc_index.relevant_sections(user_input, sections_per_tool)}\n\n")
+            send_all_code = code_index and code_index.total_tokens <= code_tokens
+            if send_all_code and not first_message_sent:
+                # Small code bases are sent whole, once, from the attachment store
+                attachments.append(get_attachment_store().put_text(
+                    f"Code from the specified files:\n\n{code_index.all_code()}"))
+            elif code_index and not send_all_code:
+                relevant_code = code_index.relevant_code(user_input, code_tokens)
+                if relevant_code:
+                    combined_message += f"Relevant code from the specified files:\n\n{relevant_code}\n\n"
+            if combined_message or (send_all_code and not first_message_sent):
+                combined_message += f"User's question: {user_input}"
+            message = {"role": "user", "content": combined_message or user_input}
+            if len(message['content']) > ATTACH_PASTE_CHARS:
+                # A huge paste is kept once, in the attachment store
+                attachments.append(get_attachment_store().put_text(message['content']))
+                message['content'] = ""
+            if attachments:
+                message['attachments'] = attachments
+            # The first message carries the whole -c context, so keep it pinned
+            remember(message, pinned=bool(send_all_code and not first_message_sent))
             first_message_sent = True
-        else:
-            # For subsequent messages, just add the user input
-            messages.append({"role": "user", "content": user_input})
 
-        spinner = Halo(text='Processing...', spinner='dots')
-        spinner.start()
+            summary_skipped = False
+            with profiler.span("context: enforce budget"):
+                evicted = context.enforce_budget(model)
+            if summary_skipped:
+                print("Summary skipped; the oldest turns were dropped from the context.")
+            if evicted:
+                logger.info("Evicted %d messages to stay within %d tokens", len(evicted), context.budget)
 
-        # Get AI response using spinner
-        try:
-            logger.debug(f"Using model: {model}")
-            logger.debug(f"Messages: {messages}")
-            logger.debug(f"Type of model: {type(model)}")
-            logger.debug(f"Model value: {model}")
-            logger.debug(f"Type of api_key: {type(api_key)}")
-            logger.debug(f"Base URL: {base_url}")
-            
-            response = open_web_ui_api_request(messages, model, api_key, base_url)
-            
-            # Validate response
-            is_valid, error_message = validate_api_response(response)
-            if not is_valid:
-                logger.error(f"API Response Error: {error_message}")
-                last_response = f"Error: {error_message}"
+            ai_prompt = f'{(model[:8]+":" if len(model) > 8 else model+":"):>11}'
+
+            cache_key = None
+            # Compare mode always asks every model; a cached answer is from one model only
+            if response_cache and not comparison_models:
+                lookup_start = time.perf_counter()
+                cache_key = make_cache_key(get_chat_endpoint(base_url), model, context.messages)
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    # Cache hits skip the spinner and the network entirely
+                    last_response = cached
+                    metrics = {'latency': time.perf_counter() - lookup_start}
+                    print()
+                    print_formatted_text(FormattedText([('bg:red fg:white bold', ai_prompt), ('', ' (cached)')]), style=style)
+                    render_start = time.perf_counter()
+                    display_response(last_response, use_pager)
+                    metrics['render'] = time.perf_counter() - render_start
+                    session_metrics.record(model, 'cached', metrics)
+                    print()
+                    remember({"role": "assistant", "content": last_response})
+                    continue
+
+            semantic_scope = None
+            if semantic_cache and not comparison_models:
+                lookup_start = time.perf_counter()
+                # Only prompts asked at the same point, with the same documentation, code (as of its last edit)
+                # and attachments, can match
+                semantic_scope = make_cache_key(get_chat_endpoint(base_url), model, context.messages[:-1], {
+                    'docs': [doc_index.name for doc_index in doc_indexes or []],
+                    'code': {path: entry['mtime'] for path, entry in code_index.files.items()} if code_index else {},
+                    'attachments': [attachment['id'] for attachment in message.get('attachments', [])]})
+                hit = semantic_cache.lookup(semantic_scope, user_input)
+                if hit:
+                    last_response, similar_prompt, similarity = hit
+                    metrics = {'latency': time.perf_counter() - lookup_start}
+                    print()
+                    print_formatted_text(FormattedText([
+                        ('bg:red fg:white bold', ai_prompt),
+                        ('', f' (cached answer to a similar question, {similarity:.0%} match: '
+                             f'"{textwrap.shorten(similar_prompt, 60)}")')]), style=style)
+                    render_start = time.perf_counter()
+                    display_response(last_response, use_pager)
+                    metrics['render'] = time.perf_counter() - render_start
+                    session_metrics.record(model, 'semantic', metrics)
+                    print()
+                    remember({"role": "assistant", "content": last_response})
+                    continue
+
+            if comparison_models:
+                def show_result(position, result):
+                    label = f'{(result["model"][:8]+":" if len(result["model"]) > 8 else result["model"]+":"):>11}'
+                    print()
+                    if 'error' in result:
+                        print_formatted_text(FormattedText([('bg:red fg:white bold', label),
+                                                            ('', f' [{position}] failed after {result["latency"]:.1f}s')]), style=style)
+                        print(f"An error occurred: {result['error']}")
+                        return
+                    print_formatted_text(FormattedText([
+                        ('bg:red fg:white bold', label),
+                        ('', f' [{position}] {result["model"]} - {result["latency"]:.1f}s, '
+                             f'{result["tokens_per_second"]:.1f} tokens/s')]), style=style)
+                    display_response(result['content'], use_pager)
+                    print()
+
+                print(f"\nAsking {len(comparison_models)} models... (Ctrl+C cancels)")
+                try:
+                    results = compare_models(context.messages, comparison_models, api_key, base_url, show_result,
+                                             session_metrics)
+                    answers = [result for result in results if 'content' in result]
+                    if len(answers) > 1:
+                        numbers = [position for position, result in enumerate(results, 1) if 'content' in result]
+                        picked = input(f"\nKeep which answer in the conversation? {numbers} (Enter for {numbers[0]}): ").strip()
+                        choice = int(picked) if picked.isdigit() and int(picked) in numbers else numbers[0]
+                    elif answers:
+                        choice = results.index(answers[0]) + 1
+                except KeyboardInterrupt:
+                    withdraw_question()
+                    print("\nRequest cancelled.\n")
+                    continue
+                if not answers:
+                    # Nothing to keep, so drop the question to keep the history consistent
+                    withdraw_question()
+                    continue
+
+                chosen = results[choice - 1]
+                print(f"Keeping the answer from {chosen['model']}.\n")
+                last_response = chosen['content']
+                remember({"role": "assistant", "content": last_response})
+                record_turn(user_input, last_response, chosen['model'], session_log)
                 continue
-    
-            # Access the response content
-            last_response = response['choices'][0]['message']['content']
-            
-            # Add AI message to messages for the context of the next message
-            messages.append({"role": "assistant", "content": last_response})
-        except Exception as e:
-            last_response = f"An error occurred: {str(e)}"
-            logger.error(f"Error details: {e}")
-            
-        spinner.stop()
-
-        def display_response(response_content: str):
-            """Displays the AI response with markdown rendering."""
-            console = Console()
-            md_content = Markdown(response_content)
-            console.print(md_content, end="")
-
-        # Print AI response in bold
-        print()  # This will add a line break
-        ai_prompt = f'{(model[:8]+":" if len(model) > 8 else model+":"):>11}'
-        print_formatted_text(FormattedText([('bg:red fg:white bold', ai_prompt)]), style=style)
-        
-        if last_response is not None:
-            display_response(last_response)
+
+            job = ResponseJob(executor, context.messages, model, api_key, base_url, stream)
+            try:
+                with profiler.span("turn: answer"):
+                    if not show_answer(job, ai_prompt):
+                        # The user started typing: keep printing the answer above a live prompt
+                        pending_inputs.extend(prompt_while_generating(job, ai_prompt))
+                        if not job.cancelled.is_set():
+                            job.done.wait()
+            except KeyboardInterrupt:
+                job.cancel()
+
+            if job.cancelled.is_set():
+                withdraw_question()
+                print("\nRequest cancelled.\n")
+            else:
+                if job.error:
+                    last_response = f"An error occurred: {str(job.error)}"
+                    print(last_response)
+                else:
+                    last_response = job.content
+                    if cache_key:
+                        response_cache.put(cache_key, last_response)
+                    if semantic_scope:
+                        semantic_cache.add(semantic_scope, user_input, last_response)
+                    record_turn(user_input, last_response, model, session_log)
+                session_metrics.record(model, 'stream' if stream else 'chat',
+                                       finish_request_metrics(job.metrics, None if job.error else last_response),
+                                       job.error)
+                print()  # extra line break for visual separation
+
+                # Add AI message to messages for the context of the next message
+                remember({"role": "assistant", "content": last_response})
+
+            if exit_flag:
+                print("Ending the conversation. Goodbye!")
+                break
+
+    executor.shutdown(wait=False, cancel_futures=True)
+    save_endpoint_stats()
+    if session_log:
+        session_log.close()
+        if session_log.indexed:
+            print(f"Conversation saved. Resume it with: --resume {session_log.id}")
+
+def main():
+    profiler.mark("stdlib imports and definitions")
+
+    # Parse arguments
+    args = build_parser().parse_args()
+    profiler.mark("argument parsing")
+    if args.profile or args.profile_output:
+        import atexit
+
+        profiler.enable(args.profile_output)
+        atexit.register(profiler.finish)
+
+    # Load existing config
+    config = load_config()
+    # Decided before the command-line options are merged into config
+    config_loaded = bool(config)
+    profiler.mark("config load")
+
+    if args.help:
+        display_help()
+        sys.exit(0)
+
+    if args.list_sessions:
+        sessions = list_sessions(get_data_dir() / 'sessions')
+        if not sessions:
+            print("No saved sessions.")
+        for entry in sessions:
+            updated = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['updated']))
+            print(f"{entry['id']}  {updated}  {entry.get('model') or '':<16}  {entry.get('title', '')}")
+        sys.exit(0)
+
+    if args.search is not None:
+        print_search_results(args.search)
+        sys.exit(0)
+
+    api_key = get_api_key(args)
+    profiler.mark("api key lookup")
+
+    if args.startup_bench:
+        for module_name in INTERACTIVE_MODULES:
+            profiler.time_import(module_name)
+        profiler.report_startup()
+        sys.exit(0)
+
+    if api_key is None:
+        print("No OpenAI API Key provided. Please use one of the following methods:")
+        print("1. Use the --api_key command-line argument")
+        print("2. Set the OPENWEBUI_KEY environment variable")
+        print("3. Set the OPENAI_API_TOKEN environment variable")
+        sys.exit(1)
+
+    if args.clear_config:
+        save_config({})
+        print("Configuration cleared.")
+        sys.exit(0)
+
+    if args.model:
+        config['model'] = args.model
+    if args.base_url:
+        config['base_url'] = args.base_url
+    if args.stream is not None:
+        config['stream'] = args.stream
+    if args.pager is not None:
+        config['pager'] = args.pager
+    if args.pool_size:
+        config['pool_size'] = args.pool_size
+    if args.connect_timeout:
+        config['connect_timeout'] = args.connect_timeout
+    if args.read_timeout:
+        config['read_timeout'] = args.read_timeout
+    if args.compress:
+        config['compress'] = args.compress
+    if args.hedge:
+        config['hedge'] = True
+    if args.max_retries is not None:
+        config['max_retries'] = args.max_retries
+    if args.rpm:
+        config['rpm'] = args.rpm
+    if args.tpm:
+        config['tpm'] = args.tpm
+    if args.context_tokens:
+        config['context_tokens'] = args.context_tokens
+    if args.summarize_evicted:
+        config['summarize_evicted'] = True
+    if args.code_tokens:
+        config['code_tokens'] = args.code_tokens
+    if args.doc_sections:
+        config['doc_sections'] = args.doc_sections
+    if args.cache is not None:
+        config['cache'] = args.cache
+    if args.save_sessions is not None:
+        config['save_sessions'] = args.save_sessions
+    if args.cache_dir:
+        config['cache_dir'] = args.cache_dir
+    if args.metrics_file:
+        config['metrics_file'] = args.metrics_file
+    if args.stdin_tokens:
+        config['stdin_tokens'] = args.stdin_tokens
+    if args.semantic_cache is not None:
+        config['semantic_cache'] = args.semantic_cache
+    if args.similarity:
+        config['semantic_threshold'] = args.similarity
+    if args.embedder:
+        config['embedder'] = args.embedder
+
+    # Save config if requested
+    if args.save_config:
+        save_config(config)
+        print("Configuration saved.")
+
+    # Use config values
+    model = config.get('model', "llama3.1:8b")
+    base_urls = [url.strip() for url in str(config.get('base_url') or '').split(',') if url.strip()]
+    # Model lists, cache keys and sessions go by the first endpoint
+    base_url = base_urls[0] if base_urls else None
+
+    configure_http(config.get('pool_size'), config.get('connect_timeout'), config.get('read_timeout'),
+                   config.get('compress'))
+    if configure_endpoints(base_urls, config.get('endpoint_stats'), config.get('hedge')):
+        endpoint_router.start_probing(api_key)
+    configure_rate_limits(config.get('max_retries'), config.get('rpm'), config.get('tpm'),
+                          max(http_settings['pool_size'], args.concurrency))
+    configure_history(config.get('save_sessions', True))
+
+    cache_dir = Path(config['cache_dir']).expanduser() if config.get('cache_dir') else get_cache_dir()
+    response_cache = None
+    if config.get('cache'):
+        response_cache = ResponseCache(cache_dir,
+                                       config.get('cache_max_bytes', DEFAULT_CACHE_MAX_BYTES),
+                                       config.get('cache_max_age', DEFAULT_CACHE_MAX_AGE))
+    semantic_cache = None
+    if config.get('semantic_cache'):
+        embedder = make_embedder(config.get('embedder'), config.get('embedding_model'), api_key, base_url)
+        semantic_cache = SemanticCache(cache_dir, embedder,
+                                       config.get('semantic_threshold', DEFAULT_SEMANTIC_THRESHOLD),
+                                       config.get('semantic_max_entries', DEFAULT_SEMANTIC_MAX_ENTRIES),
+                                       config.get('cache_max_age', DEFAULT_CACHE_MAX_AGE))
+
+    catalog = ModelCatalog(cache_dir, base_url)
+    session_metrics = SessionMetrics(os.path.expanduser(config['metrics_file']) if config.get('metrics_file') else None)
+
+    if args.l_models:
+        # List available models
+        list_available_models(api_key, base_url, catalog)
+        sys.exit(0)
+
+    if args.batch:
+        if not args.batch_output:
+            print("--batch requires --batch-output <file> for the results.")
+            sys.exit(1)
+        # One pooled connection per worker
+        configure_http(pool_size=max(http_settings['pool_size'], args.concurrency))
+        exit_code = run_batch(args.batch, args.batch_output, model, api_key, base_url, max(1, args.concurrency),
+                              response_cache, session_metrics)
+        save_endpoint_stats()
+        sys.exit(exit_code)
+
+    if args.prompt is not None:
+        exit_code = run_one_shot(args.prompt, model, api_key, base_url, get_system_prompt(args),
+                                 config.get('stdin_tokens'), response_cache, session_metrics, semantic_cache)
+        save_endpoint_stats()
+        sys.exit(exit_code)
+
+    session_log = None
+    resumed_messages = None
+    if args.resume:
+        session_log, resumed_messages = SessionLog.resume(get_data_dir() / 'sessions', args.resume)
+        if session_log is None:
+            print(f"No saved session '{args.resume}'. Use --list-sessions to see them.")
+            sys.exit(1)
+        resumed_id = session_log.id
+        # Continue with the model the session last used unless -m says otherwise
+        if session_log.model and not args.model:
+            model = session_log.model
+        if not config.get('save_sessions', True):
+            # Continue the conversation without adding to its log
+            session_log = None
+    elif config.get('save_sessions', True):
+        session_log = SessionLog(get_data_dir() / 'sessions')
+
+    # Clear the terminal
+    clear_screen()
+    set_terminal_title()
+    if config_loaded:
+        print("Loaded saved configuration.")
+
+    # Validate the model against the cached catalog; refreshing it never blocks startup
+    if catalog.models and model not in catalog.models:
+        print(f"Warning: model '{model}' is not in the model list for this endpoint. Use -l to list available models.")
+    if catalog.is_stale():
+        catalog.refresh_in_background(api_key)
+
+    # Initialize the conversation with the system prompt
+    summarizer = None
+    if config.get('summarize_evicted'):
+        summarizer = lambda previous, evicted, model, cancelled=None: summarize_messages(previous, evicted, model,
+                                                                                         api_key, base_url, cancelled)
+    context = ContextWindow(get_context_budget(model, config.get('context_tokens')), summarizer)
+    if resumed_messages is not None:
+        for message, pinned in resumed_messages:
+            context.append(message, pinned)
+        context.enforce_budget(model)
+        print(f"Resumed session {resumed_id} ({len(resumed_messages)} messages).")
+    else:
+        system_message = {"role": "system", "content": get_system_prompt(args)}
+        context.append(system_message, pinned=True)
+        if session_log:
+            session_log.set_model(model)
+            session_log.append(system_message, pinned=True)
+
+    doc_indexes = []
+
+    if args.software:
+        if os.name == 'nt':
+            print("Sorry, the man page functionality is not available on Windows.")
+            sys.exit(1)
+        software_names = list(dict.fromkeys(name.strip() for name in args.software.split(',') if name.strip()))
+        with profiler.span("startup: software docs"):
+            doc_indexes = load_software_docs_concurrently(software_names, cache_dir)
+        if doc_indexes:
+            sources = ", ".join(f"the {'man page' if doc_index.kind == 'man' else 'help output'} for {doc_index.name}"
+                                for doc_index in doc_indexes)
+            print(f"\nNote: GPT has been provided with {sources}. "
+                  f"The sections relevant to each question are sent with it. You can now ask questions about it.\n")
         else:
-            print("No response to display.")
-            display_response(str(last_response))
-        
-        print()  # extra line break for visual separation
+            print("Unable to provide information about the specified software. Continuing without software context.")
+
+    code_index = None
+    if args.code_helper:
+        with profiler.span("startup: code index"):
+            code_index = load_code_index(args.code_helper, cache_dir)
+        if code_index.chunks:
+            print(f"GPT has been provided the code of {len(code_index.files)} files you're currently working on. "
+                  f"You can now ask questions about your code.\n")
+        else:
+            print("No readable source files were found at the given paths. Continuing without code context.\n")
+            code_index = None
+
+    if not args.software and not args.code_helper:
+        display_intro()
+
+    comparison_models = [name.strip() for name in args.compare.split(',') if name.strip()] if args.compare else None
+    run_interactive(args, config, context, model, api_key, base_url, doc_indexes, code_index, response_cache, catalog,
+                    comparison_models, session_metrics, session_log, semantic_cache)
 
-        # Add AI message to messages for the context of the next message
-        messages.append({"role": "assistant", "content": last_response})
\ No newline at end of file
+if __name__ == '__main__':
+    main()
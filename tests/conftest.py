@@ -0,0 +1,39 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SCRIPT_PATH = ROOT_DIR / 'openai-cl.py'
+
+# The mock API lives with the benchmarks
+sys.path.insert(0, str(ROOT_DIR / 'bench'))
+
+def load_client():
+    """Import openai-cl.py as a module (its file name isn't a valid module name)."""
+    spec = importlib.util.spec_from_file_location('openai_cl', SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+_client = load_client()
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    """
+    The openai-cl module with a fresh request limiter, no endpoint router and
+    the home, cache and data directories inside tmp_path.
+    """
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    _client.configure_rate_limits()
+    _client.configure_endpoints([])
+    _client.configure_history(False)
+    yield _client
+    _client.configure_endpoints([])
+
+@pytest.fixture
+def messages():
+    return [{"role": "user", "content": "hi"}]
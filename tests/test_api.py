@@ -0,0 +1,306 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import SCRIPT_PATH
+from mock_server import MockServer
+
+ANSWER = "Hello from the mock server."
+
+def closed_port_url():
+    """Return the URL of a local port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+def test_request(client, messages):
+    with MockServer(response_text=ANSWER) as server:
+        metrics = {}
+        response = client.chat_request(messages, 'llama3.1:8b', 'key', server.url, metrics)
+    assert client.validate_api_response(response) == (True, None)
+    assert response['choices'][0]['message']['content'] == ANSWER
+    assert metrics['latency'] > 0
+    assert metrics['usage']['completion_tokens'] == len(ANSWER) // 4
+
+def test_stream(client, messages):
+    with MockServer(response_text=ANSWER, chunk_chars=5) as server:
+        metrics = {}
+        chunks = list(client.chat_stream(messages, 'llama3.1:8b', 'key', server.url, metrics))
+    assert len(chunks) > 1
+    assert "".join(chunks) == ANSWER
+    assert metrics['usage']['completion_tokens'] == len(ANSWER) // 4
+
+def test_retry_after_429(client, messages):
+    with MockServer(response_text=ANSWER, fail_first=2, error_status=429, retry_after=0.2) as server:
+        start = time.perf_counter()
+        response = client.chat_request(messages, 'llama3.1:8b', 'key', server.url)
+        elapsed = time.perf_counter() - start
+        assert server.request_count == 3
+    assert response['choices'][0]['message']['content'] == ANSWER
+    assert client.request_limiter.retries == 2
+    # Each retry waits at least the Retry-After the server sent
+    assert elapsed >= 0.4
+
+def test_stream_retried_before_first_chunk(client, messages):
+    with MockServer(response_text=ANSWER, fail_first=1, error_status=503, retry_after=0) as server:
+        assert "".join(client.chat_stream(messages, 'llama3.1:8b', 'key', server.url)) == ANSWER
+    assert client.request_limiter.retries == 1
+
+def test_client_error_not_retried(client, messages):
+    with MockServer(error_rate=1, error_status=400) as server:
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.chat_request(messages, 'llama3.1:8b', 'key', server.url)
+        assert server.request_count == 1
+    assert client.request_limiter.retries == 0
+
+def test_gives_up_after_max_retries(client, messages):
+    client.configure_rate_limits(max_retries=2)
+    with MockServer(error_rate=1, error_status=503, retry_after=0) as server:
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.chat_request(messages, 'llama3.1:8b', 'key', server.url)
+        assert server.request_count == 3
+
+def test_failover(client, messages):
+    dead_url = closed_port_url()
+    with MockServer(response_text=ANSWER) as server:
+        router = client.configure_endpoints([dead_url, server.url])
+        response = client.chat_request(messages, 'llama3.1:8b', 'key', dead_url)
+        assert response['choices'][0]['message']['content'] == ANSWER
+        assert "".join(client.chat_stream(messages, 'llama3.1:8b', 'key', dead_url)) == ANSWER
+    assert router.endpoints[dead_url]['failures'] == 1
+    assert router.endpoints[server.url]['successes'] == 2
+    # The failed endpoint is passed over until it comes back
+    assert router.ranked() == [server.url, dead_url]
+
+def test_failover_not_on_client_error(client, messages):
+    with MockServer(error_rate=1, error_status=400) as first, MockServer(response_text=ANSWER) as second:
+        client.configure_endpoints([first.url, second.url])
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.chat_request(messages, 'llama3.1:8b', 'key', first.url)
+        assert second.request_count == 0
+
+def test_batch(client, tmp_path, capsys):
+    input_path = tmp_path / 'in.jsonl'
+    output_path = tmp_path / 'out.jsonl'
+    entries = [{'id': 'a', 'prompt': 'first'},
+               {'id': 'b', 'messages': [{'role': 'user', 'content': 'second'}], 'model': 'qwen2.5:14b'},
+               {'prompt': 'third'}]
+    input_path.write_text("\n".join(json.dumps(entry) for entry in entries) + "\n{not json\n", encoding='utf-8')
+    with MockServer(response_text=ANSWER) as server:
+        exit_code = client.run_batch(str(input_path), str(output_path), 'llama3.1:8b', 'key', server.url, 2)
+        assert exit_code == 0
+        results = {result['id']: result for result in map(json.loads, output_path.read_text().splitlines())}
+        assert set(results) == {'a', 'b', '3'}
+        assert all(result['response'] == ANSWER for result in results.values())
+        assert results['b']['model'] == 'qwen2.5:14b'
+
+        # A rerun skips the ids that already succeeded
+        exit_code = client.run_batch(str(input_path), str(output_path), 'llama3.1:8b', 'key', server.url, 2)
+        assert exit_code == 0
+        assert server.request_count == 3
+    assert "0 succeeded, 0 failed, 3 skipped" in capsys.readouterr().err
+
+def test_batch_failures(client, tmp_path):
+    client.configure_rate_limits(max_retries=0)
+    input_path = tmp_path / 'in.jsonl'
+    output_path = tmp_path / 'out.jsonl'
+    input_path.write_text(json.dumps({'id': 'a', 'prompt': 'first'}) + "\n", encoding='utf-8')
+    with MockServer(error_rate=1, error_status=500) as server:
+        assert client.run_batch(str(input_path), str(output_path), 'm', 'key', server.url, 1) == 1
+    result = json.loads(output_path.read_text())
+    assert result['id'] == 'a' and '500' in result['error']
+    assert client.load_completed_batch_ids(str(output_path)) == set()
+
+def run_prompt(tmp_path, base_url, *args):
+    """Run openai-cl.py -p in a subprocess with its own home directory."""
+    env = dict(os.environ, HOME=str(tmp_path / 'home'), XDG_CACHE_HOME=str(tmp_path / 'cache'),
+               XDG_DATA_HOME=str(tmp_path / 'data'), OPENAI_API_TOKEN='key')
+    env.pop('OPENWEBUI_KEY', None)
+    (tmp_path / 'home').mkdir(exist_ok=True)
+    return subprocess.run([sys.executable, str(SCRIPT_PATH), '--base_url', base_url, '--max-retries', '0', *args],
+                          env=env, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+
+def test_prompt_answer(tmp_path):
+    with MockServer(response_text=ANSWER) as server:
+        result = run_prompt(tmp_path, server.url, '-p', 'hello')
+    assert result.returncode == 0
+    assert result.stdout == ANSWER + "\n"
+    assert result.stderr == ""
+
+@pytest.mark.parametrize('status, exit_code', [(400, 1), (401, 3), (403, 3), (429, 4), (500, 5), (503, 5)])
+def test_prompt_exit_codes(tmp_path, status, exit_code):
+    with MockServer(error_rate=1, error_status=status) as server:
+        result = run_prompt(tmp_path, server.url, '-p', 'hello')
+    assert result.returncode == exit_code
+    assert result.stdout == ""
+    # The error is reported once
+    error, = result.stderr.splitlines()
+    assert error.startswith("openai-cl: ") and str(status) in error
+
+def test_prompt_unreachable(tmp_path):
+    result = run_prompt(tmp_path, closed_port_url(), '-p', 'hello')
+    assert result.returncode == 5
+
+def test_prompt_empty_question(tmp_path):
+    result = run_prompt(tmp_path, closed_port_url(), '-p', ' ')
+    assert result.returncode == 2
+    assert "-p needs a question" in result.stderr
+
+def test_compare_cancelled(client, messages):
+    with MockServer(latency=30) as server:
+        # As if Ctrl+C was pressed while the models are answering
+        threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGINT)).start()
+        start = time.perf_counter()
+        with pytest.raises(KeyboardInterrupt):
+            client.compare_models(messages, ['a', 'b'], 'key', server.url)
+        # The requests were aborted, not waited for
+        assert time.perf_counter() - start < 5
+        server.settings.latency = 0
+        assert client.chat_request(messages, 'a', 'key', server.url)['choices']
+
+def test_prompt_no_save(tmp_path):
+    with MockServer(response_text=ANSWER) as server:
+        assert run_prompt(tmp_path, server.url, '--no-save', '-p', 'hello').returncode == 0
+        assert not (tmp_path / 'data' / 'openai-cl' / 'history.sqlite').exists()
+        assert run_prompt(tmp_path, server.url, '-p', 'hello').returncode == 0
+        assert (tmp_path / 'data' / 'openai-cl' / 'history.sqlite').exists()
+
+def test_message_encoder_matches_json_dumps(client):
+    encoder = client.MessageEncoder()
+    history = [{"role": "system", "content": "Be brief. \"Quotes\", tabs\t and ünïcode ✓"},
+               {"role": "user", "content": "first", "name": "me"}]
+    params = {'stream': True, 'temperature': 0.5, 'stop': None}
+    body = encoder.encode('llama3.1:8b', history, **params)
+    assert body == json.dumps({'model': 'llama3.1:8b', 'messages': history, **params}).encode('utf-8')
+    # The next turn reuses the JSON of the messages already sent
+    first = encoder.encode_message(history[0])
+    history.append({"role": "assistant", "content": "answer"})
+    assert encoder.encode_message(history[0]) is first
+    # A message whose content was replaced is encoded again
+    history[1]['content'] = "edited"
+    body = encoder.encode('m', history)
+    assert body == json.dumps({'model': 'm', 'messages': history}).encode('utf-8')
+
+def test_request_compression(client, monkeypatch):
+    import gzip
+
+    monkeypatch.setitem(client.http_settings, 'compression', 'gzip')
+    assert client.compress_body(b'{"small": 1}') == (b'{"small": 1}', {})
+    body = json.dumps({"content": "word " * 1000}).encode('utf-8')
+    compressed, headers = client.compress_body(body)
+    assert headers == {'Content-Encoding': 'gzip'}
+    assert gzip.decompress(compressed) == body
+
+    messages = [{"role": "user", "content": "the same words again " * 500}]
+    with MockServer(response_text=ANSWER) as server:
+        metrics = {}
+        response = client.chat_request(messages, 'm', 'key', server.url, metrics)
+    # The server decompressed the body it was sent
+    assert response['choices'][0]['message']['content'] == ANSWER
+    assert metrics['request_bytes'] < len(client.message_encoder.encode('m', messages)) // 10
+
+def test_read_bounded_stdin(client):
+    import io
+
+    text, omitted = client.read_bounded_stdin(1000, io.BytesIO("short ✓\n".encode('utf-8')))
+    assert (text, omitted) == ("short ✓\n", 0)
+
+    lines = [f"line {number}\n" for number in range(100000)]
+    data = "".join(lines).encode('utf-8')
+    text, omitted = client.read_bounded_stdin(1000, io.BytesIO(data))
+    head, tail = text.split("\n[... ", 1)
+    tail = tail.split(" bytes omitted ...]\n\n", 1)[1]
+    # The start and end are kept, cut at line breaks
+    assert head.startswith("line 0\nline 1\n") and tail.endswith("line 99999\n")
+    assert set(head.splitlines(keepends=True) + tail.splitlines(keepends=True)) <= set(lines)
+    assert omitted == len(data) - len(head) - len(tail)
+    assert len(head) <= 250 and len(tail) <= 750
+    assert f"{omitted:,} bytes omitted" in text
+
+def test_compare_models(client, messages):
+    client.configure_rate_limits(max_retries=0)
+    session_metrics = client.SessionMetrics()
+    arrived = []
+    with MockServer(response_text=ANSWER, fail_first=1, error_status=400) as server:
+        results = client.compare_models(messages, ['a', 'b', 'c'], 'key', server.url,
+                                        lambda number, result: arrived.append((number, result)), session_metrics)
+        assert server.request_count == 3
+    assert [number for number, _ in arrived] == [1, 2, 3]
+    assert [result for _, result in arrived] == results
+    assert sorted(result['model'] for result in results) == ['a', 'b', 'c']
+    failed = [result for result in results if 'error' in result]
+    answered = [result for result in results if 'content' in result]
+    assert len(failed) == 1 and '400' in failed[0]['error']
+    assert all(result['content'] == ANSWER and result['completion_tokens'] == len(ANSWER) // 4
+               and result['tokens_per_second'] > 0 for result in answered)
+    assert [entry['mode'] for entry in session_metrics.requests] == ['compare'] * 3
+    assert sum('error' in entry for entry in session_metrics.requests) == 1
+
+def test_finish_request_metrics(client):
+    metrics = client.finish_request_metrics({'latency': 2.0, 'usage': {'prompt_tokens': 10, 'completion_tokens': 50}},
+                                            "answer")
+    assert metrics == {'latency': 2.0, 'prompt_tokens': 10, 'completion_tokens': 50, 'tokens_per_second': 25.0}
+    # Without usage from the server, tokens/s is estimated from the answer
+    metrics = client.finish_request_metrics({'latency': 1.0}, "x" * 40)
+    assert metrics['completion_tokens'] is None
+    assert metrics['tokens_per_second'] == client.estimate_tokens("x" * 40)
+    assert 'tokens_per_second' not in client.finish_request_metrics({'latency': 1.0}, None)
+
+def test_session_metrics_export(client, tmp_path):
+    jsonl = client.SessionMetrics(str(tmp_path / 'metrics.jsonl'))
+    prom = client.SessionMetrics(str(tmp_path / 'metrics.prom'))
+    for session_metrics in (jsonl, prom):
+        session_metrics.record('m', 'stream', {'latency': 0.5, 'ttfb': 0.1, 'completion_tokens': 20})
+        session_metrics.record('m', 'cached', {'latency': 0.001})
+        session_metrics.record('m', 'chat', {'latency': 1.5}, error="503 Server Error")
+
+    entries = [json.loads(line) for line in (tmp_path / 'metrics.jsonl').read_text().splitlines()]
+    assert [entry['mode'] for entry in entries] == ['stream', 'cached', 'chat']
+    assert entries[0]['ttfb'] == 0.1 and entries[2]['error'] == "503 Server Error"
+
+    lines = (tmp_path / 'metrics.prom').read_text().splitlines()
+    assert 'openai_cl_requests_total{mode="stream"} 1' in lines
+    assert 'openai_cl_request_errors_total 1' in lines
+    assert 'openai_cl_latency_seconds_count 3' in lines
+    assert not (tmp_path / 'metrics.prom.tmp').exists()
+
+    table = jsonl.describe()
+    assert table.startswith("3 requests (1 cached, 1 failed)")
+    assert client.SessionMetrics().describe() == "No requests yet."
+
+def test_model_catalog(client, tmp_path, capsys):
+    with MockServer(models=['qwen2.5:14b', 'llama3.1:8b']) as server:
+        catalog = client.ModelCatalog(tmp_path, server.url)
+        assert catalog.is_stale() and catalog.models == []
+        catalog.refresh('key')
+        assert catalog.models == ['llama3.1:8b', 'qwen2.5:14b']
+        assert server.request_count == 1
+
+        # A fresh catalog is read from disk and listed without asking the endpoint
+        cached = client.ModelCatalog(tmp_path, server.url)
+        assert cached.models == catalog.models and not cached.is_stale()
+        client.list_available_models('key', server.url, cached)
+        assert server.request_count == 1
+        assert "- qwen2.5:14b" in capsys.readouterr().out
+        assert cached.is_stale(ttl=0)
+        # Each endpoint has its own catalog
+        assert client.ModelCatalog(tmp_path, closed_port_url()).models == []
+
+def test_model_completer(client, tmp_path):
+    from prompt_toolkit.document import Document
+
+    catalog = client.ModelCatalog(tmp_path, None)
+    catalog.models = ['llama3.1:8b', 'llama3.2:3b', 'qwen2.5:14b']
+    completer = client.make_model_completer(catalog)
+    completions = completer.get_completions(Document("/model llama3."), None)
+    assert [completion.text for completion in completions] == ['llama3.1:8b', 'llama3.2:3b']
+    assert list(completer.get_completions(Document("llama"), None)) == []
@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+def test_cache_key_is_canonical(client):
+    messages = [{"role": "user", "content": "hi"}]
+    key = client.make_cache_key('http://x', 'm', messages, {'temperature': 0, 'top_p': 1})
+    assert key == client.make_cache_key('http://x', 'm', [{"content": "hi", "role": "user"}],
+                                        {'top_p': 1, 'temperature': 0})
+    assert key != client.make_cache_key('http://y', 'm', messages, {'temperature': 0, 'top_p': 1})
+    assert key != client.make_cache_key('http://x', 'n', messages, {'temperature': 0, 'top_p': 1})
+    assert key != client.make_cache_key('http://x', 'm', messages, {'temperature': 1, 'top_p': 1})
+    assert key != client.make_cache_key('http://x', 'm', [{"role": "user", "content": "hi!"}],
+                                        {'temperature': 0, 'top_p': 1})
+    assert client.make_cache_key('http://x', 'm', messages) == client.make_cache_key('http://x', 'm', messages, {})
+
+def test_response_cache_hit_and_miss(client, tmp_path):
+    cache = client.ResponseCache(tmp_path)
+    assert cache.get('a') is None
+    cache.put('a', "answer")
+    assert cache.get('a') == "answer"
+    # Entries outlive the connection
+    assert client.ResponseCache(tmp_path).get('a') == "answer"
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1, 'bytes': 6}
+
+def test_response_cache_evicts_least_recently_used(client, tmp_path):
+    cache = client.ResponseCache(tmp_path, max_bytes=250)
+    for key in 'abc':
+        cache.put(key, key * 100)
+        time.sleep(0.01)
+    # Only two entries fit; a was the least recently used
+    assert cache.get('a') is None
+    # Reading b makes c the least recently used
+    assert cache.get('b') == 'b' * 100
+    time.sleep(0.01)
+    cache.put('d', 'd' * 100)
+    assert cache.get('c') is None
+    assert cache.get('b') == 'b' * 100
+    assert cache.get('d') == 'd' * 100
+    assert cache.stats()['bytes'] <= 250
+
+def test_response_cache_expires_old_entries(client, tmp_path):
+    cache = client.ResponseCache(tmp_path, max_age=60)
+    cache.put('old', "stale")
+    cache.put('new', "fresh")
+    cache.db.execute("UPDATE responses SET created = created - 120 WHERE key = 'old'")
+    cache.db.commit()
+    assert cache.get('old') is None
+    assert cache.get('new') == "fresh"
+    cache.put('other', "x")
+    assert cache.stats()['entries'] == 2
+
+def make_semantic_cache(client, tmp_path, **settings):
+    return client.SemanticCache(tmp_path, client.HashingEmbedder(), **settings)
+
+def test_semantic_cache_matches_rewording(client, tmp_path):
+    cache = make_semantic_cache(client, tmp_path)
+    cache.add('scope', "how do I list the files in a directory", "Use ls.")
+    answer, prompt, similarity = cache.lookup('scope', "how to list files in a directory")
+    assert answer == "Use ls."
+    assert prompt == "how do I list the files in a directory"
+    assert similarity >= client.DEFAULT_SEMANTIC_THRESHOLD
+
+def test_semantic_cache_threshold(client, tmp_path):
+    cache = make_semantic_cache(client, tmp_path, threshold=0.9)
+    cache.add('scope', "how do I list the files in a directory", "Use ls.")
+    assert cache.lookup('scope', "how do I delete a directory") is None
+    # A negated question doesn't reuse the answer
+    assert cache.lookup('scope', "how do I not list the files in a directory") is None
+
+    lenient = make_semantic_cache(client, tmp_path / 'lenient', threshold=0.3)
+    lenient.add('scope', "how do I list the files in a directory", "Use ls.")
+    assert lenient.lookup('scope', "how do I delete a directory")[0] == "Use ls."
+    assert (cache.hits, cache.misses) == (0, 2)
+
+LONG_PROMPT = ("write a bash script that finds all log files in /var/log older than 7 days including compressed "
+               "archives and deletes them after printing their names")
+
+def test_semantic_cache_long_prompts(client, tmp_path):
+    cache = make_semantic_cache(client, tmp_path)
+    cache.add('scope', LONG_PROMPT, "find /var/log ...")
+    # Case, punctuation, filler words and word forms don't matter
+    assert cache.lookup('scope', "Write a Bash script that finds all the log files in /var/log older than 7 days, "
+                                 "including the compressed archives, and deletes them after printing their names.")
+    assert cache.lookup('scope', LONG_PROMPT.replace("finds", "finding").replace("deletes", "deleting"))
+
+def test_semantic_cache_long_near_misses(client, tmp_path):
+    cache = make_semantic_cache(client, tmp_path)
+    cache.add('scope', LONG_PROMPT, "find /var/log ...")
+    for changed in (LONG_PROMPT.replace("including", "excluding"), LONG_PROMPT.replace("7 days", "90 days"),
+                    LONG_PROMPT.replace("deletes", "compresses")):
+        vector = cache.embedder.embed(changed)
+        # Close enough to pass a fixed threshold of 0.9...
+        assert cache.index.best(vector, cache.scopes['scope'])[1] > 0.9
+        # ...but one word apart
+        assert cache.lookup('scope', changed) is None
+
+def test_semantic_threshold_scales_with_length(client, tmp_path):
+    cache = make_semantic_cache(client, tmp_path, threshold=0.8)
+    assert cache.required_similarity("list files") == pytest.approx(0.8)
+    required = [cache.required_similarity(" ".join(f"word{n}" for n in range(words))) for words in (5, 10, 20, 40)]
+    assert required == sorted(required) and required[-1] < 1
+    # The API embedder's vectors weigh what a word means, so its threshold is used as it is
+    cache.embedder = client.APIEmbedder('model', 'key', None)
+    assert cache.required_similarity(LONG_PROMPT) == pytest.approx(0.8)
+
+def test_semantic_cache_scopes(client, tmp_path):
+    cache = make_semantic_cache(client, tmp_path)
+    cache.add('model-a', "list the files", "Use ls.")
+    assert cache.lookup('model-b', "list the files") is None
+    assert cache.lookup('model-a', "list the files")[0] == "Use ls."
+
+def test_semantic_cache_reuses_least_recently_used_slot(client, tmp_path):
+    cache = make_semantic_cache(client, tmp_path, max_entries=2)
+    cache.add('scope', "list the files", "ls")
+    time.sleep(0.01)
+    cache.add('scope', "show the disk usage", "du")
+    time.sleep(0.01)
+    assert cache.lookup('scope', "list the files")[0] == "ls"
+    cache.add('scope', "count the lines", "wc")
+    assert cache.lookup('scope', "show the disk usage") is None
+    assert cache.lookup('scope', "list the files")[0] == "ls"
+
+    reopened = make_semantic_cache(client, tmp_path, max_entries=2)
+    assert reopened.lookup('scope', "count the lines")[0] == "wc"
+
+def test_semantic_cache_ignores_other_embedders(client, tmp_path):
+    make_semantic_cache(client, tmp_path).add('scope', "list the files", "ls")
+    cache = client.SemanticCache(tmp_path, client.HashingEmbedder(dim=256))
+    assert cache.lookup('scope', "list the files") is None
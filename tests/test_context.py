@@ -0,0 +1,127 @@
+import threading
+import time
+
+from mock_server import MockServer
+
+def message(role, chars):
+    return {"role": role, "content": role[0] * chars}
+
+def test_fits_budget(client):
+    window = client.ContextWindow(budget=1000)
+    window.append(message('system', 40), pinned=True)
+    window.append(message('user', 40))
+    assert window.enforce_budget() == []
+    assert window.total == 2 * client.estimate_tokens('x' * 40)
+
+def test_evicts_oldest_turns_first(client):
+    window = client.ContextWindow(budget=120)
+    system = message('system', 40)
+    window.append(system, pinned=True)
+    turns = []
+    for _ in range(4):
+        turns.append((message('user', 80), message('assistant', 80)))
+        window.append(turns[-1][0])
+        window.append(turns[-1][1])
+    evicted = window.enforce_budget()
+    # Whole turns go, the user message with the answer to it
+    assert [id(m) for m in evicted] == [id(m) for m in turns[0] + turns[1]]
+    assert window.messages[0] is system
+    assert window.total <= window.budget
+    assert window.total == sum(client.message_tokens(kept) for kept in window.messages)
+
+def test_pinned_messages_are_kept(client):
+    window = client.ContextWindow(budget=60)
+    window.append(message('system', 40), pinned=True)
+    window.append(message('user', 40))
+    code = message('system', 120)
+    window.append(code, pinned=True)
+    window.append(message('user', 40))
+    window.append(message('assistant', 40))
+    newest = message('user', 40)
+    window.append(newest)
+    window.enforce_budget()
+    assert code in window.messages
+    assert all(window.pinned[:2])
+    # The newest message is never evicted, even when the pinned context alone is over budget
+    assert window.messages[-1] is newest
+
+def test_pop_keeps_total(client):
+    window = client.ContextWindow(budget=1000)
+    window.append(message('user', 40))
+    window.append(message('assistant', 400))
+    window.pop()
+    assert window.total == client.estimate_tokens('u' * 40)
+    assert window.pinned == [False]
+
+def test_summarizer(client):
+    calls = []
+
+    def summarizer(previous, evicted, model):
+        calls.append((previous, [m['content'] for m in evicted], model))
+        return f"{previous} summary of {len(evicted)}".strip()
+
+    window = client.ContextWindow(budget=120, summarizer=summarizer)
+    window.append(message('system', 40), pinned=True)
+    for _ in range(3):
+        window.append(message('user', 120))
+        window.append(message('assistant', 120))
+    window.enforce_budget('current-model')
+    window.append(message('user', 120))
+    window.enforce_budget('other-model')
+
+    assert [model for _, _, model in calls] == ['current-model', 'other-model']
+    # The running summary is passed back in with the next evicted turn
+    assert [previous for previous, _, _ in calls] == ["", "summary of 4"]
+    assert len(calls[1][1]) == 2
+    assert window.summary == "summary of 4 summary of 2"
+    # One summary message, right after the leading pinned messages
+    summaries = [m for m in window.messages if m['content'].startswith("Summary of the earlier conversation")]
+    assert summaries == [window.messages[1]]
+    assert window.summary in summaries[0]['content']
+    assert window.total <= window.budget
+
+def test_summary_is_capped(client):
+    window = client.ContextWindow(budget=200, summarizer=lambda previous, evicted, model: "s" * 10000 + "end")
+    window.append(message('system', 40), pinned=True)
+    for _ in range(3):
+        window.append(message('user', 200))
+        window.append(message('assistant', 200))
+    window.enforce_budget()
+    max_chars = int(window.budget * client.SUMMARY_MAX_SHARE) * 4
+    assert window.summary.startswith("...") and window.summary.endswith("end")
+    assert len(window.summary) == max_chars + 3
+    assert window.total <= window.budget
+
+def test_failed_summary_evicts_anyway(client):
+    window = client.ContextWindow(budget=60, summarizer=lambda previous, evicted, model: previous)
+    window.append(message('user', 200))
+    window.append(message('assistant', 200))
+    window.append(message('user', 40))
+    assert len(window.enforce_budget()) == 2
+    assert window.summary_message is None
+
+def test_summarize_messages(client):
+    evicted = [message('user', 40), message('assistant', 40)]
+    with MockServer(response_text="The user asked about u.") as server:
+        window = client.ContextWindow(budget=30, summarizer=lambda previous, evicted, model: client.summarize_messages(
+            previous, evicted, model, 'key', server.url))
+        for turn in evicted + [message('user', 40)]:
+            window.append(turn)
+        window.enforce_budget('m')
+    assert window.summary == "The user asked about u."
+
+def test_summarize_messages_cancelled(client, caplog):
+    cancelled = threading.Event()
+
+    def cancel(thread_id):
+        cancelled.set()
+        client.abort_request(thread_id)
+
+    with MockServer(latency=30) as server:
+        threading.Timer(0.3, cancel, (threading.get_ident(),)).start()
+        start = time.perf_counter()
+        summary = client.summarize_messages("earlier", [message('user', 40)], 'm', 'key', server.url, cancelled)
+        assert time.perf_counter() - start < 5
+    # A cancelled summary keeps the previous one and isn't reported as a failure
+    assert summary == "earlier"
+    assert not [record for record in caplog.records if record.levelname == 'ERROR']
@@ -0,0 +1,114 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+MAN_PAGE = """\
+GREP(1)                     User Commands                    GREP(1)
+
+NAME
+       grep - print lines that match patterns
+
+SYNOPSIS
+       grep [OPTION...] PATTERNS [FILE...]
+
+OPTIONS
+       -i, --ignore-case
+              Ignore case distinctions in patterns and input data.
+
+       -r, --recursive
+              Read all files under each directory, recursively.
+
+       -v, --invert-match
+              Invert the sense of matching, to select non-matching lines.
+
+EXIT STATUS
+       Normally the exit status is 0 if a line is selected.
+"""
+
+def test_split_doc_sections(client):
+    chunks = client.split_doc_sections(MAN_PAGE)
+    by_start = {chunk['text'].split('\n')[0]: chunk for chunk in chunks}
+    assert by_start['grep - print lines that match patterns']['heading'] == 'NAME'
+    # Each option is a chunk of its own, under its section heading
+    for option in ('-i, --ignore-case', '-r, --recursive', '-v, --invert-match'):
+        assert by_start[option]['heading'] == 'OPTIONS'
+    assert "recursively" in by_start['-r, --recursive']['text']
+    assert "recursively" not in by_start['-i, --ignore-case']['text']
+    assert by_start['Normally the exit status is 0 if a line is selected.']['heading'] == 'EXIT STATUS'
+
+def test_split_doc_sections_long_chunks(client):
+    paragraph = "word " * (client.DOC_CHUNK_CHARS // 10)
+    chunks = client.split_doc_sections("DESCRIPTION\n" + "\n\n".join([paragraph] * 6))
+    assert len(chunks) > 1
+    assert all(chunk['heading'] == 'DESCRIPTION' for chunk in chunks)
+    assert all(len(chunk['text']) <= client.DOC_CHUNK_CHARS + len(paragraph) for chunk in chunks)
+
+def test_bm25_ranks_matching_documents_first(client):
+    chunks = client.split_doc_sections(MAN_PAGE)
+    index = client.BM25Index.from_texts(chunk['heading'] + ' ' + chunk['text'] for chunk in chunks)
+    best = chunks[index.search("search the directories recursively", 1)[0]]
+    assert best['text'].startswith('-r, --recursive')
+    best = chunks[index.search("ignoring case", 1)[0]]
+    assert best['text'].startswith('-i, --ignore-case')
+
+def test_bm25_search(client):
+    index = client.BM25Index.from_texts(["the cat sat on the mat", "dogs chase cats", "a bird in the hand"])
+    assert sorted(index.search("cat", 3)) == [0, 1]
+    assert index.search("bird", 3) == [2]
+    assert index.search("unrelated", 3) == []
+    assert len(index.search("cat dog bird", 2)) == 2
+
+def test_bm25_prefers_rarer_terms(client):
+    index = client.BM25Index.from_texts(["common rare", "common", "common"])
+    assert index.search("common rare", 3)[0] == 0
+
+def write_code(path, functions):
+    path.write_text("".join(f"def {name}():\n    return '{name}'\n\n" for name in functions), encoding='utf-8')
+
+def test_code_index_reindexes_changed_files(client, tmp_path, monkeypatch):
+    source = tmp_path / 'src'
+    source.mkdir()
+    for name in ('alpha', 'beta', 'gamma'):
+        write_code(source / f"{name}.py", [f"{name}_function"])
+    indexed = []
+
+    def index_code_file(path):
+        indexed.append(os.path.basename(path))
+        return original(path)
+
+    original = client.index_code_file
+    monkeypatch.setattr(client, 'index_code_file', index_code_file)
+    cache_dir = tmp_path / 'cache'
+    assert len(client.load_code_index([str(source)], cache_dir).chunks) == 3
+    assert sorted(indexed) == ['alpha.py', 'beta.py', 'gamma.py']
+
+    # Only files whose size or mtime changed are read again
+    indexed.clear()
+    write_code(source / 'beta.py', ['beta_function', 'delta_function'])
+    (source / 'gamma.py').unlink()
+    code_index = client.load_code_index([str(source)], cache_dir)
+    assert indexed == ['beta.py']
+    assert sorted(chunk['symbol'] for _, chunk in code_index.chunks) == [
+        "def alpha_function():", "def beta_function():", "def delta_function():"]
+    assert "delta_function" in code_index.relevant_code("delta function", 100)
+
+    indexed.clear()
+    client.load_code_index([str(source)], cache_dir)
+    assert indexed == []
+
+@pytest.mark.skipif(shutil.which('git') is None, reason="needs git")
+def test_code_glob_respects_gitignore(client, tmp_path):
+    subprocess.run(['git', 'init', '-q', str(tmp_path)], check=True)
+    (tmp_path / '.gitignore').write_text("generated/\n*_pb2.py\n", encoding='utf-8')
+    for name in ('app/main.py', 'app/api_pb2.py', 'generated/app.py', 'node_modules/lib.py'):
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        write_code(tmp_path / name, ['f'])
+    files = client.list_code_files(str(tmp_path / '**' / '*.py'))
+    assert files == [str(tmp_path / 'app' / 'main.py')]
+    # Outside a git checkout only the usual dependency and build directories are skipped
+    (tmp_path / '.git').rename(tmp_path / 'not-git')
+    files = client.list_code_files(str(tmp_path / '**' / '*.py'))
+    assert [os.path.relpath(path, tmp_path) for path in files] == [
+        os.path.join('app', 'api_pb2.py'), os.path.join('app', 'main.py'), os.path.join('generated', 'app.py')]
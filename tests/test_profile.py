@@ -0,0 +1,56 @@
+import io
+import json
+import threading
+import time
+
+def test_profiler_off_records_nothing(client):
+    profiler = client.PhaseProfiler(time.perf_counter())
+    with profiler.span("render: markdown"):
+        pass
+    assert profiler.span("other") is profiler.span("render: markdown")
+    assert profiler.totals == {}
+    # Startup phases are recorded either way
+    profiler.mark("parse arguments")
+    assert list(profiler.counts) == ["startup: parse arguments"]
+
+def test_profiler_trace(client, tmp_path):
+    profiler = client.PhaseProfiler(time.perf_counter())
+    trace_path = tmp_path / 'trace.json'
+    profiler.enable(str(trace_path))
+    for _ in range(3):
+        with profiler.span("render: markdown"):
+            time.sleep(0.01)
+
+    def request():
+        with profiler.span("request: encode body"):
+            pass
+
+    thread = threading.Thread(target=request, name='compare_0')
+    thread.start()
+    thread.join()
+
+    assert profiler.counts == {"render: markdown": 3, "request: encode body": 1}
+    assert profiler.totals["render: markdown"] >= 0.03
+    report = io.StringIO()
+    profiler.report(report)
+    # Largest phase first
+    phases = [line.split()[0] for line in report.getvalue().splitlines()[3:5]]
+    assert phases == ["render:", "request:"]
+
+    profiler.finish()
+    events = json.loads(trace_path.read_text())['traceEvents']
+    spans = [event for event in events if event['ph'] == 'X']
+    assert [event['name'] for event in spans] == ["render: markdown"] * 3 + ["request: encode body"]
+    assert spans[0]['cat'] == 'render' and spans[0]['dur'] >= 10000
+    thread_names = {event['tid']: event['args']['name'] for event in events if event['ph'] == 'M'}
+    assert thread_names[spans[-1]['tid']] == 'compare_0'
+
+def test_profiler_pstats(client, tmp_path):
+    import pstats
+
+    profiler = client.PhaseProfiler(time.perf_counter())
+    profiler.enable(str(tmp_path / 'profile.pstats'))
+    client.estimate_tokens("some text")
+    profiler.finish()
+    stats = pstats.Stats(str(tmp_path / 'profile.pstats'))
+    assert any(name == 'estimate_tokens' for _, _, name in stats.stats)
@@ -0,0 +1,30 @@
+def feed_in_pieces(splitter, text, size):
+    blocks = []
+    for start in range(0, len(text), size):
+        blocks.extend(splitter.feed(text[start:start + size]))
+    return blocks
+
+def test_splits_at_blank_lines(client):
+    splitter = client.MarkdownBlockSplitter()
+    assert splitter.feed("# Title\n\nFirst paragraph") == ["# Title\n\n"]
+    assert splitter.tail == "First paragraph"
+    assert splitter.feed(" continues.\n\n\n") == ["First paragraph continues.\n\n"]
+    assert splitter.tail == ""
+
+def test_code_fence_is_one_block(client):
+    text = "Intro\n\n```python\ndef f():\n\n    return 1\n```\nAfter"
+    splitter = client.MarkdownBlockSplitter()
+    blocks = feed_in_pieces(splitter, text, 3)
+    assert blocks == ["Intro\n\n", "```python\ndef f():\n\n    return 1\n```\n"]
+    assert splitter.tail == "After"
+    assert splitter.buffer == text
+
+def test_piece_size_does_not_matter(client):
+    text = "- a\n- b\n\n~~~\nx\n\ny\n~~~\n\nText\n\n```\nunclosed\n\n"
+    expected = feed_in_pieces(client.MarkdownBlockSplitter(), text, len(text))
+    for size in (1, 2, 5, 7):
+        splitter = client.MarkdownBlockSplitter()
+        assert feed_in_pieces(splitter, text, size) == expected
+        assert splitter.buffer == text
+    # An unclosed fence stays in the tail
+    assert splitter.tail == "```\nunclosed\n\n"
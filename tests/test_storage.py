@@ -0,0 +1,202 @@
+import json
+import os
+import time
+
+import pytest
+
+def test_session_resume(client, tmp_path):
+    log = client.SessionLog(tmp_path)
+    log.set_model('llama3.1:8b')
+    log.append({"role": "system", "content": "be brief"}, pinned=True)
+    log.append({"role": "user", "content": "first"})
+    log.set_title("first question")
+    log.append({"role": "assistant", "content": "answer"})
+    log.append({"role": "user", "content": "withdrawn"})
+    log.pop()
+    log.set_model('qwen2.5:14b')
+    log.close()
+    # A line cut short by a crash is skipped
+    with open(log.path, 'a', encoding='utf-8') as f:
+        f.write('{"message": {"role": "user", "con')
+
+    resumed, messages = client.SessionLog.resume(tmp_path, log.id)
+    assert messages == [({"role": "system", "content": "be brief"}, True),
+                        ({"role": "user", "content": "first"}, False),
+                        ({"role": "assistant", "content": "answer"}, False)]
+    assert resumed.model == 'qwen2.5:14b'
+    assert resumed.indexed
+
+    # Appending continues the same log
+    resumed.append({"role": "user", "content": "second"})
+    resumed.close()
+    _, messages = client.SessionLog.resume(tmp_path, 'last')
+    assert messages[-1] == ({"role": "user", "content": "second"}, False)
+
+def test_resume_unknown_session(client, tmp_path):
+    assert client.SessionLog.resume(tmp_path, 'missing') == (None, None)
+    assert client.SessionLog.resume(tmp_path, 'last') == (None, None)
+
+def test_list_sessions(client, tmp_path):
+    first = client.SessionLog(tmp_path, 'first')
+    first.append({"role": "user", "content": "one"})
+    first.set_title("one  two\nthree")
+    first.close()
+    second = client.SessionLog(tmp_path, 'second')
+    second.append({"role": "user", "content": "two"})
+    second.set_title("two")
+    second.close()
+    # Sessions without a question aren't listed
+    client.SessionLog(tmp_path, 'empty').append({"role": "system", "content": "x"})
+    os.utime(first.path, (time.time() + 10, time.time() + 10))
+
+    sessions = client.list_sessions(tmp_path)
+    assert [entry['id'] for entry in sessions] == ['first', 'second']
+    assert sessions[0]['title'] == "one two three"
+
+def test_attachment_store_round_trip(client, tmp_path):
+    store = client.AttachmentStore(tmp_path / 'attachments')
+    text = "héllo wörld " * 100
+    reference = store.put_text(text, 'notes.txt')
+    assert reference == store.put_text(text, 'notes.txt')
+    assert reference['size'] == len(text.encode('utf-8'))
+    assert len(list((tmp_path / 'attachments').iterdir())) == 1
+    assert "".join(store.iter_text(reference['id'])) == text
+
+    source = tmp_path / 'source.txt'
+    source.write_text(text, encoding='utf-8')
+    file_reference = store.put_file(source)
+    assert file_reference == {'id': reference['id'], 'name': 'source.txt', 'size': reference['size']}
+
+def test_attachment_chunks_split_characters(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(client, 'ATTACHMENT_CHUNK_BYTES', 5)
+    store = client.AttachmentStore(tmp_path)
+    text = "ééééé€€€ end"
+    reference = store.put_text(text)
+    source = tmp_path / 'source.txt'
+    source.write_text(text, encoding='utf-8')
+    assert store.put_file(source)['id'] == reference['id']
+    pieces = list(store.iter_text(reference['id']))
+    assert len(pieces) > 2
+    assert "".join(pieces) == text
+
+def test_encode_message_expands_attachments(client, tmp_path):
+    store = client.AttachmentStore(tmp_path)
+    message = {"role": "user", "content": "What does it do? \"quoted\"",
+               'attachments': [store.put_text("print('hi')\n", 'a.py'), store.put_text("pasted\ttext")]}
+    encoded = json.loads(store.encode_message(message))
+    assert encoded == {"role": "user", "content": "Attached file a.py:\n\nprint('hi')\n\n\npasted\ttext"
+                                                  "\n\nWhat does it do? \"quoted\""}
+
+def test_missing_and_pruned_attachments(client, tmp_path):
+    store = client.AttachmentStore(tmp_path)
+    old = store.put_text("old")
+    new = store.put_text("new")
+    os.utime(store.path(old['id']), (0, 0))
+    store.prune(max_age=3600)
+    assert not store.path(old['id']).exists()
+    assert store.path(new['id']).exists()
+    assert "".join(store.iter_text(old['id'])) == "[This attachment is no longer available.]"
+    assert "".join(store.iter_text(new['id'])) == "new"
+
+def test_attachments_stay_in_use(client, tmp_path):
+    store = client.AttachmentStore(tmp_path)
+    reference = store.put_text("pasted")
+    source = tmp_path / 'source.txt'
+    source.write_text("attached", encoding='utf-8')
+    file_reference = store.put_file(source)
+    for digest in (reference['id'], file_reference['id']):
+        os.utime(store.path(digest), (0, 0))
+    # Storing the same text again counts as using it
+    store.put_text("pasted")
+    store.put_file(source)
+    store.prune(max_age=3600)
+    assert "".join(store.iter_text(reference['id'])) == "pasted"
+    assert "".join(store.iter_text(file_reference['id'])) == "attached"
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc")
+def test_attachments_are_not_held_open(client, tmp_path):
+    store = client.AttachmentStore(tmp_path)
+    references = [store.put_text(f"text {number}") for number in range(20)]
+    open_files = len(os.listdir('/proc/self/fd'))
+    for reference in references:
+        assert store.encode_message({"role": "user", "content": "", 'attachments': [reference]})
+    assert len(os.listdir('/proc/self/fd')) == open_files
+
+def write_session(client, sessions_dir, session_id, turns, model='llama3.1:8b'):
+    log = client.SessionLog(sessions_dir, session_id)
+    log.set_model(model)
+    for question, answer in turns:
+        log.append(question)
+        log.set_title(question['content'] or 'attachment')
+        log.append({"role": "assistant", "content": answer})
+    log.close()
+    return log
+
+def test_history_import_and_search(client, tmp_path):
+    sessions_dir = tmp_path / 'sessions'
+    store = client.AttachmentStore(tmp_path / 'attachments')
+    question = {"role": "user", "content": "how do I rebase a branch"}
+    write_session(client, sessions_dir, 'plain', [(question, "Use git rebase main.")])
+    context = {"role": "user", "content": "Docs...\n\nUser's question: what is xargs"}
+    write_session(client, sessions_dir, 'context', [(context, "xargs builds command lines.")], model='qwen2.5:14b')
+    pasted = {"role": "user", "content": "", 'attachments': [store.put_text("x" * 100)]}
+    named = {"role": "user", "content": "", 'attachments': [store.put_text("y", 'notes.txt')]}
+    live = write_session(client, sessions_dir, 'attachments', [(pasted, "A long paste."), (named, "Some notes.")])
+    # A session still being written to by another openai-cl
+    with open(live.path, 'a', encoding='utf-8') as f:
+        f.write('{"message": {"role": "user", "con')
+    size = live.path.stat().st_size
+
+    history = client.HistoryIndex(tmp_path)
+    assert history.created
+    assert history.import_sessions(sessions_dir) == 4
+    assert live.path.stat().st_size == size
+    assert not client.HistoryIndex(tmp_path).created
+
+    hit, = history.search("rebasing branches")
+    assert hit['response'] == "Use git rebase main."
+    assert hit['session'] == 'plain' and hit['model'] == 'llama3.1:8b'
+    # Only the typed question is indexed, not the context sent with it
+    assert history.search("what is xargs")[0]['prompt'] == "what is xargs"
+    assert history.search("docs") == []
+    assert history.search("pasted")[0]['response'] == "A long paste."
+    assert history.search("notes.txt")[0]['response'] == "Some notes."
+
+    history.add("an unrelated question", "answer", 'm')
+    assert history.count() == 5
+    # Turns matching any of the words are returned when none match them all
+    assert [hit['prompt'] for hit in history.search("rebase xyzzy")] == ["how do I rebase a branch"]
+    # Punctuation is not FTS5 query syntax
+    assert history.search('"rebase" OR (*') != []
+    highlighted = history.search("rebase", highlight=('[', ']'))[0]['prompt']
+    assert highlighted == "how do I [rebase] a branch"
+
+def test_record_turn(client, monkeypatch):
+    monkeypatch.setattr(client, '_history_index', None)
+    client.configure_history(False)
+    client.record_turn("question about pipes", "answer", 'm')
+    assert client._history_index is None
+    client.configure_history(True)
+    client.record_turn("question about pipes", "answer", 'm')
+    assert client.get_history_index().search("pipes")[0]['response'] == "answer"
+    assert (client.get_data_dir() / 'history.sqlite').exists()
+
+@pytest.mark.skipif(os.name == 'nt', reason="POSIX file modes")
+def test_saved_files_are_private(client, tmp_path):
+    import stat
+
+    umask = os.umask(0o022)
+    try:
+        client.ResponseCache(client.get_cache_dir()).put('key', "answer")
+        log = client.SessionLog(client.get_data_dir() / 'sessions')
+        log.append({"role": "user", "content": "secret"})
+        log.set_title("secret")
+        log.close()
+        client.HistoryIndex(client.get_data_dir()).add("secret", "answer")
+        client.AttachmentStore(client.get_data_dir() / 'attachments').put_text("secret")
+    finally:
+        os.umask(umask)
+    for root in (client.get_cache_dir(), client.get_data_dir()):
+        for path in [root, *root.rglob('*')]:
+            mode = stat.S_IMODE(path.stat().st_mode)
+            assert mode == (0o700 if path.is_dir() else 0o600), path